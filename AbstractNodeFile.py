@@ -1,5 +1,9 @@
+import heapq
 from abc import ABC, abstractmethod
-from typing import Tuple, Optional
+from typing import Iterator, List, Tuple, Optional
+
+from DistanceMetricsFile import DistanceMetric
+from SearchStatsFile import SearchStats
 
 
 class AbstractNode(ABC):  # ABC means this is an abstract class
@@ -19,6 +23,14 @@ class AbstractNode(ABC):  # ABC means this is an abstract class
     def get_value(self) -> Optional[Tuple[float, ...]]:
         pass
 
+    def get_values(self) -> List[Tuple[float, ...]]:
+        """
+        :return: all the data held directly by this node - one for a PointNode, several for a BucketNode and none for a
+        SplitterNode.
+        """
+        value = self.get_value()
+        return [] if value is None else [value]
+
     @abstractmethod
     def recursive_to_string(self, depth: int = 0) -> str:
         """
@@ -33,7 +45,9 @@ class AbstractNode(ABC):  # ABC means this is an abstract class
                      target: Tuple[float, ...],
                      best_value_so_far: Optional[Tuple[float, ...]],
                      best_distance_so_far: float,
-                     visualizer=None) -> Tuple[Optional[Tuple[float, ...]], Optional[float]]:
+                     visualizer=None,
+                     metric: Optional[DistanceMetric] = None,
+                     stats: Optional[SearchStats] = None) -> Tuple[Optional[Tuple[float, ...]], Optional[float]]:
         """
         finds the nearest datum to the given target, presumably better than the best_value_so_far, beating the
         best_distance_so_far. rRturns the datum and distance of a better point
@@ -41,11 +55,179 @@ class AbstractNode(ABC):  # ABC means this is an abstract class
         :param best_value_so_far: the closest point to target found so far in this search process, before this call
         :param best_distance_so_far: the distance to the best_value_so_far.
         :param visualizer: if this is not none, then this will show our search in progress.
+        :param metric: how to measure distance, and so how to prune; None means Euclidean distance.
+        :param stats: if not None, the work done by this search is added to it.
         :return: the (tuple of floats, distance to that tuple), if there is one better than the ones given as parameters;
         otherwise, (None, None).
         """
         pass
 
+    def box_bound(self, target: Tuple[float, ...], metric: Optional[DistanceMetric] = None) -> float:
+        """
+        :param target: a data point we are searching around.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :return: a lower bound on the distance from the target to any datum in this subtree, from the bounding box of
+        its data if it keeps one (see SplitterNode.compute_bounding_boxes), or 0 if it doesn't.
+        """
+        return 0.0
+
+    def find_nearest_approximate(self,
+                                 target: Tuple[float, ...],
+                                 eps: float = 0.0,
+                                 max_leaves: Optional[int] = None,
+                                 metric: Optional[DistanceMetric] = None,
+                                 stats: Optional[SearchStats] = None) -> Tuple[Optional[Tuple[float, ...]],
+                                                                               Optional[float]]:
+        """
+        finds a datum close to the target, trading accuracy for speed, by "best bin first" search: it repeatedly takes
+        the unexplored branch with the smallest lower bound on its distance from the target (kept in a priority queue),
+        and follows the target's side of each threshold down from there to a leaf, queueing the other sides as it goes.
+        :param target: the tuple of floats for which we are trying to find a close tuple in our data set.
+        :param eps: a branch is skipped unless its bound times (1 + eps) beats the best distance so far, so the datum
+        found is at most (1 + eps) times as far away as the true nearest neighbor (in the metric's units). 0 is exact.
+        :param max_leaves: if not None, the search stops after checking this many leaves, even if branches that might
+        hold something closer are left unexplored. There is then no guarantee on the result, but the time is bounded.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :param stats: if not None, the work done by this search is added to it.
+        :return: (the closest datum found, its distance), or (None, None) if this (sub)tree holds no data.
+        """
+        best_value: Optional[Tuple[float, ...]] = None
+        best_distance = float('inf')
+        shrink = 1.0 + eps
+        leaves_checked = 0
+        # entries are (bound, order added, node); the order added breaks ties, since nodes can't be compared.
+        queue: List[Tuple[float, int, AbstractNode]] = [(0.0, 0, self)]
+        num_queued = 1
+        while queue and (max_leaves is None or leaves_checked < max_leaves):
+            bound, _, node = heapq.heappop(queue)
+            if bound * shrink >= best_distance:
+                if stats is not None:
+                    stats.branches_pruned += len(queue) + 1
+                break  # everything left in the queue is at least this far away.
+            if stats is not None and num_queued > 1:
+                stats.branches_explored += 1  # every branch but the first was queued as the far side of a threshold.
+            while node is not None and not node.is_a_leaf():
+                if stats is not None:
+                    stats.nodes_visited += 1
+                if target[node.get_axis()] < node.get_threshold():
+                    preferred_branch, secondary_branch = node.get_left(), node.get_right()
+                else:
+                    preferred_branch, secondary_branch = node.get_right(), node.get_left()
+                if secondary_branch is not None:
+                    secondary_bound = max(bound, node.threshold_bound(target, metric),
+                                          secondary_branch.box_bound(target, metric))
+                    if secondary_bound * shrink < best_distance:
+                        heapq.heappush(queue, (secondary_bound, num_queued, secondary_branch))
+                        num_queued += 1
+                    elif stats is not None:
+                        stats.branches_pruned += 1
+                node = preferred_branch
+            if node is not None:
+                leaves_checked += 1
+                value, distance = node.find_nearest(target, best_value, best_distance, metric=metric, stats=stats)
+                if value is not None:
+                    best_value, best_distance = value, distance
+        return (best_value, best_distance) if best_value is not None else (None, None)
+
+    def find_k_nearest(self,
+                       target: Tuple[float, ...],
+                       k: int,
+                       metric: Optional[DistanceMetric] = None,
+                       stats: Optional[SearchStats] = None) -> List[Tuple[Tuple[float, ...], float]]:
+        """
+        finds the k data in this (sub)tree closest to the target in a single traversal.
+        :param target: the tuple of floats for which we are trying to find the closest tuples in our data set.
+        :param k: how many neighbors to find.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :param stats: if not None, the work done by this search is added to it.
+        :return: a list of up to k (tuple of floats, distance to that tuple) pairs, closest first.
+        """
+        heap: List[Tuple[float, Tuple[float, ...]]] = []
+        if k > 0:
+            self.gather_k_nearest(target, k, heap, metric, stats)
+        return [(value, -negative_distance) for negative_distance, value in sorted(heap, reverse=True)]
+
+    @abstractmethod
+    def gather_k_nearest(self,
+                         target: Tuple[float, ...],
+                         k: int,
+                         heap: List[Tuple[float, Tuple[float, ...]]],
+                         metric: Optional[DistanceMetric] = None,
+                         stats: Optional[SearchStats] = None) -> None:
+        """
+        adds any data in this (sub)tree that are among the k closest to the target found so far to the heap.
+        :param target: the tuple of floats for which we are trying to find the closest tuples in our data set.
+        :param k: the most entries the heap may hold.
+        :param heap: a max-heap of at most k (-distance, value) pairs (heapq is a min-heap, so distances are negated,
+        putting the k-th best distance found so far at heap[0]). Modified in place.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :param stats: if not None, the work done by this search is added to it.
+        :return: None
+        """
+        pass
+
+    @abstractmethod
+    def query_radius(self,
+                     target: Tuple[float, ...],
+                     radius: float,
+                     metric: Optional[DistanceMetric] = None) -> Iterator[Tuple[float, ...]]:
+        """
+        generates every datum in this (sub)tree within the given distance of the target (inclusive), skipping any
+        subtree that lies entirely on the far side of a threshold.
+        :param target: the center of the search.
+        :param radius: the largest distance from target that counts as a match.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :return: a generator of the matching tuples of floats, in no particular order.
+        """
+        pass
+
+    @abstractmethod
+    def count_radius(self, target: Tuple[float, ...], radius: float, metric: Optional[DistanceMetric] = None) -> int:
+        """
+        counts the data that query_radius would generate, without building any of them.
+        """
+        pass
+
+    @abstractmethod
+    def query_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> Iterator[Tuple[float, ...]]:
+        """
+        generates every datum in this (sub)tree with low[axis] <= datum[axis] <= high[axis] on every axis. Use
+        float('-inf') or float('inf') to leave one end of an axis open.
+        :param low: the lower corner of the box.
+        :param high: the upper corner of the box.
+        :return: a generator of the matching tuples of floats, in no particular order.
+        """
+        pass
+
+    @abstractmethod
+    def count_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> int:
+        """
+        counts the data that query_box would generate, without building any of them.
+        """
+        pass
+
+    @staticmethod
+    def kth_best_distance(k: int, heap: List[Tuple[float, Tuple[float, ...]]]) -> float:
+        """
+        :return: the distance a datum must beat to get into a heap of the k best found so far - the worst distance in
+        the heap if it is full, or infinity if it is not.
+        """
+        return -heap[0][0] if len(heap) >= k else float('inf')
+
+    @staticmethod
+    def offer_to_heap(value: Tuple[float, ...],
+                      distance: float,
+                      k: int,
+                      heap: List[Tuple[float, Tuple[float, ...]]]) -> None:
+        """
+        puts (value, distance) into the heap of the k best found so far, if it belongs there, dropping the worst entry
+        if the heap would otherwise grow past k.
+        """
+        if len(heap) < k:
+            heapq.heappush(heap, (-distance, value))
+        elif distance < -heap[0][0]:
+            heapq.heapreplace(heap, (-distance, value))
+
     def __repr__(self):  # equivalent to Java's toString()
         return self.recursive_to_string()
 
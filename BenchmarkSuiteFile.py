@@ -0,0 +1,292 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from FlatKDTreeFile import FlatKDTree
+from KDTreeBenchmarkFile import make_synthetic_array, make_target_array
+from SearchStatsFile import SearchStats, measure_tree
+from SplitterNodeFile import SplitterNode
+from TableIngestionFile import load_table
+
+WEATHER_FILE = "Weather Data 2014-2024.tsv"
+SUITE_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+SUITE_DIMENSIONS = [2, 5, 10, 20]
+SUITE_LEAF_SIZE = 16
+NUM_SUITE_QUERIES = 200
+NUM_BATCH_TARGETS = 20_000  # targets searched with find_nearest_batch on each data set, at most.
+BATCH_SIZE = 5_000  # targets per find_nearest_batch call, when timing batches.
+BATCH_TIME_BUDGET_S = 30.0  # no more batches are started once batch timing has taken this long on one data set.
+OBJECT_TREE_MAX_POINTS = 100_000  # bigger data sets are only built as FlatKDTrees; the object tree would take too long.
+BRUTE_FORCE_MAX_CELLS = 2 * 10 ** 8  # brute force is skipped once points x dimensions passes this, to bound its time.
+PERCENTILES = (50, 90, 99)
+SUITE_SEED = 0  # seeds the random module before each data set, so that runs being compared use the same data.
+COMPARED_FIELDS = ["build_s", "peak_mb", "query_p50_us", "query_p99_us", "batch_us_per_target", "nodes_visited"]
+
+
+def percentiles(samples: Sequence[float], prefix: str) -> Dict[str, float]:
+    """
+    :return: a dictionary of {prefix_pNN_us: the NNth percentile of the samples (in seconds), in microseconds}.
+    """
+    values = np.percentile(np.asarray(samples, dtype=float) * 1e6, PERCENTILES)
+    return {f"{prefix}_p{percentile}_us": float(value) for percentile, value in zip(PERCENTILES, values)}
+
+
+def measure_build(build: Callable[[], object]) -> Tuple[object, float, float]:
+    """
+    runs a build, timing it and tracking the peak memory it allocates (numpy's arrays included) with tracemalloc.
+    :return: (what the build returned, seconds taken, peak megabytes allocated). The time includes tracemalloc's own
+    overhead, which is the same for every run being compared.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def time_each(targets: np.ndarray, search: Callable[[Tuple[float, ...]], object]) -> List[float]:
+    """
+    :return: how long, in seconds, the search took for each target in turn.
+    """
+    latencies = []
+    for target in targets.tolist():
+        target = tuple(target)
+        start = time.perf_counter()
+        search(target)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def brute_force_nearest(points: np.ndarray, target: np.ndarray) -> Tuple[int, float]:
+    """
+    the baseline the trees must beat: one vectorized pass over every point.
+    :return: (row of the nearest point, its distance).
+    """
+    differences = points - target
+    squared = np.einsum("ij,ij->i", differences, differences)
+    row = int(np.argmin(squared))
+    return row, float(np.sqrt(squared[row]))
+
+
+def time_batches(flat: FlatKDTree, targets: np.ndarray) -> Dict[str, float]:
+    """
+    times find_nearest_batch on the targets, BATCH_SIZE at a time, until they run out or BATCH_TIME_BUDGET_S has
+    passed (so that big, high-dimensional data sets still finish).
+    :return: a dictionary of how many targets were searched, the time per target in microseconds, and the throughput
+    in targets per second.
+    """
+    num_searched, seconds = 0, 0.0
+    for start in range(0, len(targets), BATCH_SIZE):
+        batch = targets[start:start + BATCH_SIZE]
+        batch_start = time.perf_counter()
+        flat.find_nearest_batch(batch)
+        seconds += time.perf_counter() - batch_start
+        num_searched += len(batch)
+        if seconds >= BATCH_TIME_BUDGET_S:
+            break
+    return {"batch_targets": num_searched,
+            "batch_us_per_target": seconds * 1e6 / num_searched,
+            "batch_targets_per_s": num_searched / seconds}
+
+
+def benchmark_flat_tree(points: np.ndarray, targets: np.ndarray, leaf_size: int,
+                        batch_targets: Optional[np.ndarray] = None) -> Tuple[Dict[str, float], FlatKDTree]:
+    """
+    builds a FlatKDTree over the points and measures its build, single queries, batch queries and search effort.
+    :param batch_targets: the targets to time find_nearest_batch with; None means the same targets as single queries.
+    :return: (a dictionary of measurements, the tree).
+    """
+    def build() -> FlatKDTree:
+        tree = FlatKDTree(leaf_size=leaf_size)
+        tree.build_from_array(points)
+        return tree
+
+    flat, build_seconds, peak_mb = measure_build(build)
+    result: Dict[str, float] = {"tree": "flat", "build_s": build_seconds, "peak_mb": peak_mb}
+    result.update(percentiles(time_each(targets, flat.find_nearest_row), "query"))
+
+    result.update(time_batches(flat, targets if batch_targets is None else batch_targets))
+
+    stats = SearchStats()
+    for target in targets.tolist():
+        flat.find_nearest_row(tuple(target), stats=stats)
+    result["nodes_visited"] = stats.nodes_visited / len(targets)
+    result["distances_computed"] = stats.distance_computations / len(targets)
+    result.update({f"tree_{name}": value for name, value in measure_tree(flat.get_root()).as_dict().items()})
+    return result, flat
+
+
+def benchmark_object_tree(points: np.ndarray, targets: np.ndarray, leaf_size: int) -> Dict[str, float]:
+    """
+    builds a SplitterNode tree over the points (from a set, as build_subtree requires) and measures its build, single
+    queries and search effort. The object tree has no batch search.
+    :return: a dictionary of measurements.
+    """
+    data: Set[Tuple[float, ...]] = set(map(tuple, points.tolist()))
+
+    def build() -> SplitterNode:
+        root = SplitterNode(0)
+        root.build_subtree(data, leaf_size=leaf_size)
+        return root
+
+    root, build_seconds, peak_mb = measure_build(build)
+    result: Dict[str, float] = {"tree": "object", "build_s": build_seconds, "peak_mb": peak_mb}
+    result.update(percentiles(time_each(targets, lambda target: root.find_nearest(target, None, float('inf'))),
+                              "query"))
+    stats = SearchStats()
+    for target in targets.tolist():
+        root.find_nearest(tuple(target), None, float('inf'), stats=stats)
+    result["nodes_visited"] = stats.nodes_visited / len(targets)
+    result["distances_computed"] = stats.distance_computations / len(targets)
+    result.update({f"tree_{name}": value for name, value in measure_tree(root).as_dict().items()})
+    return result
+
+
+def benchmark_brute_force(points: np.ndarray, targets: np.ndarray, flat: Optional[FlatKDTree] = None) \
+        -> Dict[str, float]:
+    """
+    times the brute-force baseline and, given a tree, checks that the tree found the same nearest distances.
+    :return: a dictionary of measurements.
+    """
+    latencies = time_each(targets, lambda target: brute_force_nearest(points, np.asarray(target)))
+    result: Dict[str, float] = {"tree": "brute_force"}
+    result.update(percentiles(latencies, "query"))
+    if flat is not None:
+        mismatches = sum(1 for target in targets
+                         if not np.isclose(flat.find_nearest_row(tuple(target.tolist()))[1],
+                                           brute_force_nearest(points, target)[1]))
+        result["mismatches"] = mismatches
+    return result
+
+
+def benchmark_data_set(name: str,
+                       points: np.ndarray,
+                       num_queries: int,
+                       leaf_size: int,
+                       num_batch_targets: int = NUM_BATCH_TARGETS) -> List[Dict[str, float]]:
+    """
+    runs every benchmark that suits the size of this data set.
+    :return: one dictionary of measurements per kind of tree (and the brute-force baseline), labelled with the data set.
+    """
+    targets = make_target_array(points, num_queries)
+    batch_targets = make_target_array(points, num_batch_targets)
+    label = {"data": name, "points": len(points), "dimensions": points.shape[1], "leaf_size": leaf_size}
+    flat_result, flat = benchmark_flat_tree(points, targets, leaf_size, batch_targets)
+    runs = [flat_result]
+    if len(points) <= OBJECT_TREE_MAX_POINTS:
+        runs.append(benchmark_object_tree(points, targets, leaf_size))
+    if points.size <= BRUTE_FORCE_MAX_CELLS:
+        runs.append(benchmark_brute_force(points, targets, flat))
+        brute_force_p50 = runs[-1]["query_p50_us"]
+        for run in runs[:-1]:
+            run["speedup_vs_brute_force"] = brute_force_p50 / run["query_p50_us"]
+    return [{**label, **run} for run in runs]
+
+
+def run_suite(sizes: Sequence[int],
+              dimensions: Sequence[int],
+              num_queries: int = NUM_SUITE_QUERIES,
+              leaf_size: int = SUITE_LEAF_SIZE,
+              num_batch_targets: int = NUM_BATCH_TARGETS,
+              weather_file: Optional[str] = WEATHER_FILE,
+              report: Callable[[Dict[str, float]], None] = print) -> Dict[str, object]:
+    """
+    runs the benchmarks on synthetic data of every size and dimension given, and on the weather data.
+    :param sizes: the numbers of synthetic points to try.
+    :param dimensions: the numbers of synthetic dimensions to try.
+    :param num_queries: how many targets to time on each data set.
+    :param leaf_size: the leaf size of every tree built.
+    :param num_batch_targets: how many targets to time find_nearest_batch with on each data set, at most.
+    :param weather_file: the weather tsv file, or None to skip it.
+    :param report: called with each result as soon as it is measured, since big runs take a while.
+    :return: a dictionary, ready to be saved as json, describing the environment and holding every result.
+    """
+    results = []
+    random.seed(SUITE_SEED)
+    if weather_file is not None and os.path.exists(weather_file):
+        weather, _ = load_table(weather_file, numeric_columns=(0, 1, 2, 3))
+        for result in benchmark_data_set("weather", weather, num_queries, leaf_size, num_batch_targets):
+            report(result)
+            results.append(result)
+    for dimension in dimensions:
+        for size in sizes:
+            random.seed(SUITE_SEED)
+            for result in benchmark_data_set("uniform", make_synthetic_array(size, dimension), num_queries,
+                                             leaf_size, num_batch_targets):
+                report(result)
+                results.append(result)
+    return {"environment": {"python": sys.version.split()[0],
+                            "numpy": np.__version__,
+                            "platform": platform.platform(),
+                            "cpus": os.cpu_count(),
+                            "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+            "results": results}
+
+
+def result_key(result: Dict[str, float]) -> Tuple:
+    return result["data"], result["points"], result["dimensions"], result["leaf_size"], result["tree"]
+
+
+def compare_runs(old_run: Dict[str, object], new_run: Dict[str, object]) -> List[Dict[str, float]]:
+    """
+    lines up the results of two runs of the suite, to spot regressions.
+    :return: for each result in both runs, its key plus new / old for each of COMPARED_FIELDS that both runs have.
+    """
+    old_results = {result_key(result): result for result in old_run["results"]}
+    comparisons = []
+    for new in new_run["results"]:
+        old = old_results.get(result_key(new))
+        if old is None:
+            continue
+        comparison = dict(zip(("data", "points", "dimensions", "leaf_size", "tree"), result_key(new)))
+        for field in COMPARED_FIELDS:
+            if field in old and field in new and old[field] > 0:
+                comparison[f"{field}_ratio"] = new[field] / old[field]
+        comparisons.append(comparison)
+    return comparisons
+
+
+def print_result(result: Dict[str, float]) -> None:
+    print("  ".join(f"{name}={value:.4g}" if isinstance(value, float) else f"{name}={value}"
+                    for name, value in result.items()), flush=True)
+
+
+def main(arguments: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Times k-d tree builds and searches against a brute-force baseline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SUITE_SIZES, help="synthetic data set sizes")
+    parser.add_argument("--dimensions", type=int, nargs="+", default=SUITE_DIMENSIONS, help="synthetic dimensions")
+    parser.add_argument("--queries", type=int, default=NUM_SUITE_QUERIES, help="targets timed per data set")
+    parser.add_argument("--leaf-size", type=int, default=SUITE_LEAF_SIZE)
+    parser.add_argument("--batch-targets", type=int, default=NUM_BATCH_TARGETS,
+                        help="targets timed with batch searches per data set, at most")
+    parser.add_argument("--no-weather", action="store_true", help="skip the weather data")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the results as json")
+    parser.add_argument("--compare", help="a previous run's json file, to print each measurement's ratio to it")
+    options = parser.parse_args(arguments)
+
+    run = run_suite(options.sizes, options.dimensions, options.queries, options.leaf_size, options.batch_targets,
+                    None if options.no_weather else WEATHER_FILE, report=print_result)
+    with open(options.output, "w") as output_file:
+        json.dump(run, output_file, indent=2)
+    print(f"Wrote {len(run['results'])} results to {options.output}.")
+
+    if options.compare is not None:
+        with open(options.compare) as old_file:
+            old_run = json.load(old_file)
+        print(f"Compared with {options.compare} (new / old):")
+        for comparison in compare_runs(old_run, run):
+            print_result(comparison)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import unittest
+
+from BenchmarkSuiteFile import run_suite, compare_runs
+
+
+class BenchmarkSuiteTestCase(unittest.TestCase):
+
+    def test_small_run(self):
+        reported = []
+        run = run_suite([300], [3], num_queries=12, leaf_size=4, num_batch_targets=7000, weather_file=None,
+                        report=reported.append)
+        self.assertEqual(reported, run["results"])
+        self.assertEqual(["flat", "object", "brute_force"], [result["tree"] for result in run["results"]])
+        for result in run["results"]:
+            self.assertEqual((300, 3), (result["points"], result["dimensions"]))
+            self.assertLessEqual(result["query_p50_us"], result["query_p99_us"])
+        flat, brute_force = run["results"][0], run["results"][2]
+        self.assertEqual(0, brute_force["mismatches"])
+        self.assertEqual(300, flat["tree_data"])
+        self.assertGreater(flat["nodes_visited"], 0)
+        self.assertIn("speedup_vs_brute_force", flat)
+        self.assertEqual(7000, flat["batch_targets"])  # two batches of BATCH_SIZE, the second one partly full.
+        self.assertAlmostEqual(1e6, flat["batch_us_per_target"] * flat["batch_targets_per_s"])
+
+        comparisons = compare_runs(run, run)
+        self.assertEqual(3, len(comparisons))
+        self.assertEqual(1.0, comparisons[0]["build_s_ratio"])
+
+    def test_runs_are_repeatable(self):
+        first, second = (run_suite([200], [2], num_queries=5, leaf_size=4, num_batch_targets=50,
+                                   weather_file=None, report=lambda _: None)
+                         for _ in range(2))
+        for first_result, second_result in zip(first["results"], second["results"]):
+            self.assertEqual(first_result.get("tree_max_depth"), second_result.get("tree_max_depth"))
+            self.assertEqual(first_result.get("nodes_visited"), second_result.get("nodes_visited"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import logging
+from typing import Iterator, List, Tuple, Optional, Iterable
+
+import numpy as np
+
+from AbstractNodeFile import AbstractNode
+from DistanceMetricsFile import DistanceMetric
+from SearchStatsFile import SearchStats
+
+
+class BucketNode(AbstractNode):
+    """
+    A leaf that holds several data at once, packed into one (b, d) numpy array, so that they can all be checked in
+    a single vectorized distance calculation instead of one PointNode at a time.
+    """
+
+    def __init__(self, values: Iterable[Tuple[float, ...]]):
+        """
+        :param values: the data to hold - a collection of tuples of floats, or a (b, d) array, which is copied.
+        """
+        self._points: np.ndarray = np.array(values if isinstance(values, np.ndarray) else list(values), dtype=float)
+
+    def is_a_leaf(self):
+        return True
+
+    def get_left(self) -> Optional["AbstractNode"]:
+        return None
+
+    def get_right(self) -> Optional["AbstractNode"]:
+        return None
+
+    def get_value(self) -> Optional[Tuple[float, ...]]:
+        """
+        :return: the datum in this bucket if it holds exactly one; otherwise None. Use get_values() for all of them.
+        """
+        return tuple(self._points[0].tolist()) if len(self._points) == 1 else None
+
+    def get_values(self) -> List[Tuple[float, ...]]:
+        return [tuple(row) for row in self._points.tolist()]
+
+    def get_points(self) -> np.ndarray:
+        return self._points
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def recursive_to_string(self, depth: int = 0) -> str:
+        return "".join("\t" * depth + str(value) + "\n" for value in self.get_values())
+
+    def find_nearest(self,
+                     target: Tuple[float, ...],
+                     best_value_so_far: Optional[Tuple[float, ...]],
+                     best_distance_so_far: float,
+                     visualizer=None,
+                     metric: Optional[DistanceMetric] = None,
+                     stats: Optional[SearchStats] = None) -> Tuple[Optional[Tuple[float, ...]], Optional[float]]:
+        """
+        finds the closest of this bucket's data to the target, in one pass over the packed array. If it is closer than
+        the best distance found so far, returns that datum and its distance. Otherwise, returns None for both.
+        :param target: the datum for which we are trying to find a nearest neighbor
+        :param best_value_so_far: the closest datum found previously in this search process, or None.
+        :param best_distance_so_far: the distance from the target upon which we are trying to improve
+        :param visualizer: a hook to a visualizer, so we can see progress if this is 2-d.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :param stats: if not None, this bucket's visit and distance calculations are counted in it.
+        :return: (value, distance) if we can improve, (None, None) otherwise.
+        """
+        if stats is not None:
+            self.count_scan(stats)
+        distances = self.distances_to(target, metric)
+        best_index = int(np.argmin(distances))
+        distance = float(distances[best_index])
+        if distance < best_distance_so_far:
+            logging.info("Found an improvement: distance=%s", distance)
+            value = tuple(self._points[best_index].tolist())
+            if visualizer is not None:
+                visualizer.show_search_progress(target=target, best_point=value, wait_for_key=True)
+            return value, distance
+        return None, None
+
+    def count_scan(self, stats: SearchStats) -> None:
+        stats.nodes_visited += 1
+        stats.leaves_scanned += 1
+        stats.distance_computations += len(self._points)
+
+    def distances_to(self, target: Tuple[float, ...], metric: Optional[DistanceMetric] = None) -> np.ndarray:
+        """
+        :return: an array of the distances from the target to each of this bucket's data, in order.
+        """
+        if metric is None:
+            diffs = self._points - np.asarray(target, dtype=float)
+            return np.sqrt(np.einsum("ij,ij->i", diffs, diffs))
+        return metric.distances(self._points, np.asarray(target, dtype=float))
+
+    def gather_k_nearest(self,
+                         target: Tuple[float, ...],
+                         k: int,
+                         heap: List[Tuple[float, Tuple[float, ...]]],
+                         metric: Optional[DistanceMetric] = None,
+                         stats: Optional[SearchStats] = None) -> None:
+        if stats is not None:
+            self.count_scan(stats)
+        distances = self.distances_to(target, metric)
+        if len(distances) > k:  # only the k closest in this bucket could possibly make it into the heap.
+            candidates = np.argpartition(distances, k - 1)[:k]
+        else:
+            candidates = range(len(distances))
+        for index in candidates:
+            if distances[index] < self.kth_best_distance(k, heap):
+                self.offer_to_heap(tuple(self._points[index].tolist()), float(distances[index]), k, heap)
+
+    def _radius_mask(self, target: Tuple[float, ...], radius: float, metric: Optional[DistanceMetric]) -> np.ndarray:
+        return self.distances_to(target, metric) <= radius
+
+    def _box_mask(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> np.ndarray:
+        return np.all((self._points >= np.asarray(low, dtype=float)) & (self._points <= np.asarray(high, dtype=float)),
+                      axis=1)
+
+    def query_radius(self,
+                     target: Tuple[float, ...],
+                     radius: float,
+                     metric: Optional[DistanceMetric] = None) -> Iterator[Tuple[float, ...]]:
+        for row in self._points[self._radius_mask(target, radius, metric)].tolist():
+            yield tuple(row)
+
+    def count_radius(self, target: Tuple[float, ...], radius: float, metric: Optional[DistanceMetric] = None) -> int:
+        return int(np.count_nonzero(self._radius_mask(target, radius, metric)))
+
+    def query_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> Iterator[Tuple[float, ...]]:
+        for row in self._points[self._box_mask(low, high)].tolist():
+            yield tuple(row)
+
+    def count_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> int:
+        return int(np.count_nonzero(self._box_mask(low, high)))
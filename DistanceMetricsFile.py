@@ -0,0 +1,255 @@
+import math
+from abc import ABC, abstractmethod
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+Number = Union[float, np.ndarray]  # the metrics' axis methods work on single floats or element-wise on arrays.
+
+
+class DistanceMetric(ABC):
+    """
+    A way of measuring the distance between two data, plus the bound the tree needs to prune with it: the smallest
+    distance there could possibly be from a target to anything on the far side of a threshold on one axis. The search
+    compares distances only with each other and with these bounds, so a metric may use any units that keep that order
+    (SquaredEuclideanMetric skips the square root, for instance).
+    """
+
+    @abstractmethod
+    def distance(self, a: Tuple[float, ...], b: Tuple[float, ...]) -> float:
+        pass
+
+    @abstractmethod
+    def distances(self, points: np.ndarray, target: np.ndarray) -> np.ndarray:
+        """
+        the distances between points and target, element-wise over all but the last axis, which holds the coordinates.
+        Either argument may be broadcast against the other, so (b, d) points and a (d,) target give b distances, and
+        (1, b, d) points and (m, 1, d) targets give an (m, b) array.
+        """
+        pass
+
+    @abstractmethod
+    def axis_lower_bound(self, axis: int, target_value: Number, threshold: float) -> Number:
+        """
+        a lower bound on the distance from a target to any datum on the other side of the threshold on the given axis.
+        :param axis: the axis of the split.
+        :param target_value: the target's value on that axis (or an array of them, for several targets).
+        :param threshold: the split's threshold (or an array of them, one per target value).
+        :return: the bound (or an array of bounds), in this metric's units.
+        """
+        pass
+
+    def box_lower_bound(self, target: Tuple[float, ...], low: Tuple[float, ...], high: Tuple[float, ...]) -> float:
+        """
+        a lower bound on the distance from the target to any datum inside the box with corners low and high. On each
+        axis where the target is outside the box, the whole box is on the far side of a threshold at its near edge, so
+        the largest of those axis_lower_bounds will do for any metric; most metrics override this with the exact
+        distance to the box.
+        :param target: a data point we are searching around.
+        :param low: the lower corner of the box.
+        :param high: the upper corner of the box.
+        :return: the bound, in this metric's units.
+        """
+        bound = 0.0
+        for axis, (value, low_value, high_value) in enumerate(zip(target, low, high)):
+            if value < low_value:
+                bound = max(bound, self.axis_lower_bound(axis, value, low_value))
+            elif value > high_value:
+                bound = max(bound, self.axis_lower_bound(axis, value, high_value))
+        return bound
+
+    def box_diameter(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> float:
+        """
+        an upper bound on the distance between any two data inside the box with corners low and high. Dual-tree
+        searches (see DualTreeFile) combine it with the triangle inequality, so a metric that doesn't obey that
+        inequality, or can't say, must leave this as infinity, which is always safe.
+        :param low: the lower corner of the box.
+        :param high: the upper corner of the box.
+        :return: the bound, in this metric's units.
+        """
+        return float('inf')
+
+
+class EuclideanMetric(DistanceMetric):
+    """
+    straight-line distance - the default used when no metric is given.
+    """
+
+    def distance(self, a: Tuple[float, ...], b: Tuple[float, ...]) -> float:
+        return math.sqrt(sum((x - y) ** 2 for x, y in zip(a, b)))
+
+    def distances(self, points: np.ndarray, target: np.ndarray) -> np.ndarray:
+        return np.sqrt(np.sum((points - target) ** 2, axis=-1))
+
+    def axis_lower_bound(self, axis: int, target_value: Number, threshold: float) -> Number:
+        return abs(target_value - threshold)
+
+    def box_lower_bound(self, target: Tuple[float, ...], low: Tuple[float, ...], high: Tuple[float, ...]) -> float:
+        return math.sqrt(sum(gap ** 2 for gap in box_gaps(target, low, high)))
+
+    def box_diameter(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> float:
+        return self.distance(low, high)
+
+
+class SquaredEuclideanMetric(DistanceMetric):
+    """
+    the square of the straight-line distance. It finds the same neighbors as EuclideanMetric without taking any square
+    roots, but the distances it reports are squared.
+    """
+
+    def distance(self, a: Tuple[float, ...], b: Tuple[float, ...]) -> float:
+        return sum((x - y) ** 2 for x, y in zip(a, b))
+
+    def distances(self, points: np.ndarray, target: np.ndarray) -> np.ndarray:
+        return np.sum((points - target) ** 2, axis=-1)
+
+    def axis_lower_bound(self, axis: int, target_value: Number, threshold: float) -> Number:
+        return (target_value - threshold) ** 2
+
+    def box_lower_bound(self, target: Tuple[float, ...], low: Tuple[float, ...], high: Tuple[float, ...]) -> float:
+        return sum(gap ** 2 for gap in box_gaps(target, low, high))
+
+
+class ManhattanMetric(DistanceMetric):
+    """
+    the sum of the differences on each axis ("taxicab" distance).
+    """
+
+    def distance(self, a: Tuple[float, ...], b: Tuple[float, ...]) -> float:
+        return sum(abs(x - y) for x, y in zip(a, b))
+
+    def distances(self, points: np.ndarray, target: np.ndarray) -> np.ndarray:
+        return np.sum(np.abs(points - target), axis=-1)
+
+    def axis_lower_bound(self, axis: int, target_value: Number, threshold: float) -> Number:
+        return abs(target_value - threshold)
+
+    def box_lower_bound(self, target: Tuple[float, ...], low: Tuple[float, ...], high: Tuple[float, ...]) -> float:
+        return sum(box_gaps(target, low, high))
+
+    def box_diameter(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> float:
+        return self.distance(low, high)
+
+
+class ChebyshevMetric(DistanceMetric):
+    """
+    the largest difference on any one axis.
+    """
+
+    def distance(self, a: Tuple[float, ...], b: Tuple[float, ...]) -> float:
+        return max(abs(x - y) for x, y in zip(a, b))
+
+    def distances(self, points: np.ndarray, target: np.ndarray) -> np.ndarray:
+        return np.max(np.abs(points - target), axis=-1)
+
+    def axis_lower_bound(self, axis: int, target_value: Number, threshold: float) -> Number:
+        return abs(target_value - threshold)
+
+    def box_diameter(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> float:
+        return self.distance(low, high)
+
+
+class WeightedEuclideanMetric(DistanceMetric):
+    """
+    Euclidean distance with a weight on each axis's squared difference, so axes measured in different units can be
+    put on a common scale, and optionally with periodic axes, whose values wrap around (such as day of year, where day
+    365 is next to day 1).
+    """
+
+    def __init__(self, weights: Sequence[float], periods: Optional[Sequence[Optional[float]]] = None):
+        """
+        :param weights: one non-negative weight per axis, multiplying that axis's squared difference.
+        :param periods: None, or one entry per axis: None for an ordinary axis, or the period P of a periodic axis. The
+        values of the data and targets on a periodic axis must lie in [0, P], for the pruning bound to hold.
+        """
+        self._weights = np.asarray(weights, dtype=float)
+        self._root_weights = np.sqrt(self._weights)
+        if periods is None:
+            periods = [None] * len(self._weights)
+        if len(periods) != len(self._weights):
+            raise ValueError(f"Expected {len(self._weights)} periods, one per weight, but got {len(periods)}.")
+        self._periods: Tuple[Optional[float], ...] = tuple(periods)
+        self._is_periodic = np.array([period is not None for period in self._periods])
+        self._period_array = np.array([0.0 if period is None else period for period in self._periods])
+
+    def get_weights(self) -> np.ndarray:
+        return self._weights
+
+    def get_periods(self) -> Tuple[Optional[float], ...]:
+        return self._periods
+
+    def _axis_difference(self, axis: int, x: float, y: float) -> float:
+        difference = abs(x - y)
+        period = self._periods[axis]
+        if period is not None:
+            difference %= period
+            difference = min(difference, period - difference)
+        return difference
+
+    def distance(self, a: Tuple[float, ...], b: Tuple[float, ...]) -> float:
+        return math.sqrt(sum(self._weights[axis] * self._axis_difference(axis, x, y) ** 2
+                             for axis, (x, y) in enumerate(zip(a, b))))
+
+    def distances(self, points: np.ndarray, target: np.ndarray) -> np.ndarray:
+        differences = np.abs(points - target)
+        if self._is_periodic.any():
+            wrapped = np.mod(differences, np.where(self._is_periodic, self._period_array, np.inf))
+            differences = np.where(self._is_periodic, np.minimum(wrapped, self._period_array - wrapped), differences)
+        return np.sqrt(np.sum(self._weights * differences ** 2, axis=-1))
+
+    def axis_lower_bound(self, axis: int, target_value: Number, threshold: float) -> Number:
+        period = self._periods[axis]
+        if period is None:
+            return self._root_weights[axis] * abs(target_value - threshold)
+        # the far side of the threshold also reaches the target "the other way around": for a target below the
+        # threshold, the far side runs from the threshold up to the period, which wraps around to meet 0.
+        direct = abs(target_value - threshold)
+        around = np.where(target_value < threshold, target_value, period - target_value)
+        bound = self._root_weights[axis] * np.minimum(direct, around)
+        return float(bound) if np.ndim(bound) == 0 else bound
+
+    def box_lower_bound(self, target: Tuple[float, ...], low: Tuple[float, ...], high: Tuple[float, ...]) -> float:
+        total = 0.0
+        for axis, gap in enumerate(box_gaps(target, low, high)):
+            period = self._periods[axis]
+            if gap > 0 and period is not None:
+                # the box can also be reached the other way around: up from the target to the period and on from 0 to
+                # the box's low edge, or down from the target to 0 and on from the period to the box's high edge.
+                value = target[axis]
+                around = value + period - high[axis] if value < low[axis] else period - value + low[axis]
+                gap = min(gap, around)
+            total += self._weights[axis] * gap ** 2
+        return math.sqrt(total)
+
+    def box_diameter(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> float:
+        total = 0.0
+        for axis, (low_value, high_value) in enumerate(zip(low, high)):
+            width = high_value - low_value
+            if self._periods[axis] is not None:  # values on a periodic axis are never more than half a period apart.
+                width = min(width, self._periods[axis] / 2)
+            total += self._weights[axis] * width ** 2
+        return math.sqrt(total)
+
+
+class PeriodicEuclideanMetric(WeightedEuclideanMetric):
+    """
+    Euclidean distance in which some axes wrap around; see WeightedEuclideanMetric.
+    """
+
+    def __init__(self, periods: Sequence[Optional[float]]):
+        super().__init__([1.0] * len(periods), periods)
+
+
+def box_gaps(target: Tuple[float, ...], low: Tuple[float, ...], high: Tuple[float, ...]) -> List[float]:
+    """
+    :return: for each axis, how far the target is outside the box with corners low and high: 0 within the box's range
+    on that axis, otherwise the distance to its nearer edge.
+    """
+    return [low_value - value if value < low_value else (value - high_value if value > high_value else 0.0)
+            for value, low_value, high_value in zip(target, low, high)]
+
+
+EUCLIDEAN = EuclideanMetric()
+SQUARED_EUCLIDEAN = SquaredEuclideanMetric()
+MANHATTAN = ManhattanMetric()
+CHEBYSHEV = ChebyshevMetric()
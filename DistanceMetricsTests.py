@@ -0,0 +1,95 @@
+import random
+import unittest
+
+import numpy as np
+
+from DistanceMetricsFile import EUCLIDEAN, SQUARED_EUCLIDEAN, MANHATTAN, CHEBYSHEV, WeightedEuclideanMetric, \
+    PeriodicEuclideanMetric
+from FlatKDTreeFile import FlatKDTree
+from SplitterNodeFile import SplitterNode
+
+
+class DistanceMetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(3)
+        # the last axis is periodic, like day of year.
+        self.data = {(random.uniform(0, 2), random.uniform(30, 100), random.uniform(0, 366)) for _ in range(400)}
+        self.targets = [(random.uniform(0, 2), random.uniform(30, 100), random.uniform(0, 366)) for _ in range(40)]
+        self.targets.append((1.0, 60.0, 1.0))  # right next to the wrap-around.
+        self.metrics = [EUCLIDEAN, SQUARED_EUCLIDEAN, MANHATTAN, CHEBYSHEV,
+                        WeightedEuclideanMetric((100.0, 1.0, 0.25)),
+                        WeightedEuclideanMetric((100.0, 1.0, 0.25), (None, None, 366.0)),
+                        PeriodicEuclideanMetric((None, None, 366.0))]
+
+    def brute_force(self, metric, target):
+        return sorted(metric.distance(target, datum) for datum in self.data)
+
+    def test_distance_matches_distances(self):
+        points = np.array(sorted(self.data))
+        for metric in self.metrics:
+            np.testing.assert_allclose([metric.distance(datum, self.targets[0]) for datum in points.tolist()],
+                                       metric.distances(points, np.array(self.targets[0])))
+
+    def test_periodic_distance_wraps(self):
+        metric = PeriodicEuclideanMetric((None, 366.0))
+        self.assertAlmostEqual(2.0, metric.distance((0.0, 365.0), (0.0, 1.0)))
+        self.assertAlmostEqual(5.0, metric.distance((3.0, 365.0), (0.0, 3.0)))
+
+    def test_box_lower_bound(self):
+        low, high = (0.5, 40.0, 300.0), (1.5, 80.0, 360.0)
+        inside = [tuple(random.uniform(lo, hi) for lo, hi in zip(low, high)) for _ in range(200)] + [low, high]
+        for metric in self.metrics:
+            for target in self.targets + [(1.0, 60.0, 330.0)]:
+                bound = metric.box_lower_bound(target, low, high)
+                self.assertLessEqual(bound, min(metric.distance(target, datum) for datum in inside) + 1e-9)
+        # for these, the bound is the distance to the nearest point of the box.
+        target = (3.0, 20.0, 330.0)
+        self.assertAlmostEqual(0.0, EUCLIDEAN.box_lower_bound((1.0, 60.0, 330.0), low, high))
+        self.assertAlmostEqual(EUCLIDEAN.distance(target, (1.5, 40.0, 330.0)),
+                               EUCLIDEAN.box_lower_bound(target, low, high))
+        self.assertAlmostEqual(21.5, MANHATTAN.box_lower_bound(target, low, high))
+        self.assertAlmostEqual(20.0, CHEBYSHEV.box_lower_bound(target, low, high))
+        self.assertAlmostEqual(6.0, PeriodicEuclideanMetric((None, 366.0)).box_lower_bound((0.0, 1.0), (0.0, 300.0),
+                                                                                            (0.0, 361.0)))
+
+    def test_box_diameter(self):
+        low, high = (0.5, 40.0, 100.0), (1.5, 80.0, 360.0)
+        inside = [tuple(random.uniform(lo, hi) for lo, hi in zip(low, high)) for _ in range(100)] + [low, high]
+        for metric in self.metrics:
+            diameter = metric.box_diameter(low, high)
+            self.assertGreaterEqual(diameter + 1e-9, max(metric.distance(a, b) for a in inside[:30] for b in inside))
+        self.assertAlmostEqual(EUCLIDEAN.distance(low, high), EUCLIDEAN.box_diameter(low, high))
+        self.assertEqual(float('inf'), SQUARED_EUCLIDEAN.box_diameter(low, high))  # no triangle inequality.
+        self.assertAlmostEqual(183.0, PeriodicEuclideanMetric((None, 366.0)).box_diameter((0.0, 0.0), (0.0, 360.0)))
+
+    def test_object_tree_queries(self):
+        for leaf_size, bounding_boxes in ((1, False), (6, False), (1, True), (6, True)):
+            root = SplitterNode(0)
+            root.build_subtree(self.data, leaf_size=leaf_size, bounding_boxes=bounding_boxes)
+            for metric in self.metrics:
+                for target in self.targets:
+                    expected = self.brute_force(metric, target)
+                    value, distance = root.find_nearest(target, None, float('inf'), metric=metric)
+                    self.assertAlmostEqual(expected[0], distance)
+                    k_nearest = [dist for _, dist in root.find_k_nearest(target, 5, metric=metric)]
+                    np.testing.assert_allclose(expected[:5], k_nearest)
+                    self.assertEqual(sum(1 for dist in expected if dist <= expected[9]),
+                                     root.count_radius(target, expected[9], metric=metric))
+
+    def test_flat_tree_queries(self):
+        flat = FlatKDTree(leaf_size=4)
+        flat.build_tree(self.data)
+        for metric in self.metrics:
+            rows, distances = flat.find_nearest_batch(np.array(self.targets), metric=metric)
+            for target, distance in zip(self.targets, distances):
+                expected = self.brute_force(metric, target)
+                self.assertAlmostEqual(expected[0], flat.find_nearest(target, metric=metric)[1])
+                self.assertAlmostEqual(expected[0], distance)
+                np.testing.assert_allclose(expected[:5], [dist for _, dist in flat.find_k_nearest(target, 5, metric)])
+                self.assertEqual(sum(1 for dist in expected if dist <= expected[9]),
+                                 flat.count_radius(target, expected[9], metric=metric))
+
+
+if __name__ == '__main__':
+    unittest.main()
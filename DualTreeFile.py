@@ -0,0 +1,352 @@
+import math
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from AbstractNodeFile import AbstractNode
+from DistanceMetricsFile import DistanceMetric, EUCLIDEAN
+from SearchStatsFile import SearchStats
+
+NO_NODE = -1  # stands in for a missing child or parent in BoxedTree's arrays.
+DUAL_TREE_BLOCK_SIZE = 64  # the most data in a node that the dual-tree walks treat as a leaf.
+
+
+class BoxedTree:
+    """
+    A read-only copy of the shape of a tree of nodes - one built by SplitterNode.build_subtree, or anything else whose
+    nodes have is_a_leaf, get_left, get_right and get_values - laid out in lists for the dual-tree walks below, with the
+    bounding box of every node's data. The boxes are worked out here, so the tree needn't have been built with
+    bounding_boxes=True.
+
+    The data are copied into one (n, d) array, leaf by leaf from left to right, so the data below any node are the
+    consecutive rows get_start(node) to get_end(node). Nodes are numbered in pre-order, the root being 0. A node with no
+    live data below it (only deleted PointNodes, say) has no box, and the walks skip it.
+    """
+
+    def __init__(self, root: Optional[AbstractNode], block_size: int = DUAL_TREE_BLOCK_SIZE):
+        """
+        :param root: the root of the tree to copy, or None for an empty tree.
+        :param block_size: a node with at most this many data below it is treated as a leaf by the walks, which then
+        compare all its data at once. The tree's own leaves, often of a single datum, are too small for a vectorized
+        distance calculation to pay for the work of reaching them; 1 keeps them as they are.
+        """
+        self._left: List[int] = []
+        self._right: List[int] = []
+        self._parent: List[int] = []
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self._lows: List[Optional[Tuple[float, ...]]] = []
+        self._highs: List[Optional[Tuple[float, ...]]] = []
+        leaf_values: List[Tuple[float, ...]] = []
+
+        # first pass, top down: number the nodes in pre-order (left before right), so that the leaves are reached, and
+        # their data copied out, from left to right.
+        leaves: List[int] = []
+        to_visit: List[Tuple[AbstractNode, int, bool]] = [] if root is None else [(root, NO_NODE, True)]
+        while to_visit:
+            node, parent, is_left = to_visit.pop()
+            index = len(self._left)
+            self._left.append(NO_NODE)
+            self._right.append(NO_NODE)
+            self._parent.append(parent)
+            self._starts.append(len(leaf_values))
+            self._ends.append(len(leaf_values))
+            self._lows.append(None)
+            self._highs.append(None)
+            if parent != NO_NODE:
+                (self._left if is_left else self._right)[parent] = index
+            if node.is_a_leaf():
+                leaves.append(index)
+                leaf_values.extend(node.get_values())  # a deleted PointNode has none.
+                self._ends[index] = len(leaf_values)
+            else:
+                for child, child_is_left in ((node.get_right(), False), (node.get_left(), True)):
+                    if child is not None:
+                        to_visit.append((child, index, child_is_left))
+
+        dimension = len(leaf_values[0]) if leaf_values else 0
+        self._points: np.ndarray = np.array(leaf_values, dtype=float).reshape(len(leaf_values), dimension)
+
+        # second pass, bottom up: in reverse pre-order, every node comes after its children, so their ranges of rows and
+        # their boxes are finished by the time they are combined into the node's.
+        for index in leaves:
+            start, end = self._starts[index], self._ends[index]
+            if end > start:
+                self._lows[index] = tuple(self._points[start:end].min(axis=0).tolist())
+                self._highs[index] = tuple(self._points[start:end].max(axis=0).tolist())
+        for index in range(len(self._left) - 1, -1, -1):
+            children = [child for child in (self._left[index], self._right[index]) if child != NO_NODE]
+            if len(children) == 0:
+                continue
+            self._ends[index] = max(self._ends[child] for child in children)
+            boxed = [child for child in children if self._lows[child] is not None]
+            if boxed:
+                self._lows[index] = tuple(map(min, zip(*(self._lows[child] for child in boxed))))
+                self._highs[index] = tuple(map(max, zip(*(self._highs[child] for child in boxed))))
+        # the walks only ever reach the top node of a block, so its children are simply forgotten.
+        for index in range(len(self._left)):
+            if self._ends[index] - self._starts[index] <= block_size:
+                self._left[index], self._right[index] = NO_NODE, NO_NODE
+
+    def get_points(self) -> np.ndarray:
+        return self._points
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def get_num_nodes(self) -> int:
+        return len(self._left)
+
+    def is_a_leaf(self, node: int) -> bool:
+        return self._left[node] == NO_NODE and self._right[node] == NO_NODE
+
+    def get_left(self, node: int) -> int:
+        return self._left[node]
+
+    def get_right(self, node: int) -> int:
+        return self._right[node]
+
+    def get_parent(self, node: int) -> int:
+        return self._parent[node]
+
+    def get_start(self, node: int) -> int:
+        return self._starts[node]
+
+    def get_end(self, node: int) -> int:
+        return self._ends[node]
+
+    def get_bounding_box(self, node: int) -> Optional[Tuple[Tuple[float, ...], Tuple[float, ...]]]:
+        """
+        :return: (low corner, high corner) of the smallest box holding the data below the node, or None if it has none.
+        """
+        if self._lows[node] is None:
+            return None
+        return self._lows[node], self._highs[node]
+
+    def get_children(self, node: int) -> List[int]:
+        """
+        :return: those of the node's children that have live data below them.
+        """
+        return [child for child in (self._left[node], self._right[node])
+                if child != NO_NODE and self._lows[child] is not None]
+
+
+def box_to_box_bound(low_a: Tuple[float, ...],
+                     high_a: Tuple[float, ...],
+                     low_b: Tuple[float, ...],
+                     high_b: Tuple[float, ...],
+                     metric: Optional[DistanceMetric] = None) -> float:
+    """
+    a lower bound on the distance between any datum in box a and any datum in box b.
+
+    A metric only knows how far a point is from a box, but on each axis, the gap between the two boxes is the same as
+    the gap between a's low corner and b stretched downwards by a's width (its low edge moved from low_b to
+    low_b - (high_a - low_a)), which covers every way a point of a could be offset from a's low corner.
+    :param low_a: the lower corner of the first box.
+    :param high_a: the upper corner of the first box.
+    :param low_b: the lower corner of the second box.
+    :param high_b: the upper corner of the second box.
+    :param metric: how to measure distance; None means Euclidean distance.
+    :return: the bound, in the metric's units.
+    """
+    if metric is not None:
+        stretched_low_b = tuple(low - (high - start) for low, high, start in zip(low_b, high_a, low_a))
+        return metric.box_lower_bound(low_a, stretched_low_b, high_b)
+    total = 0.0  # Euclidean distance, written out, since this is worked out for every pair of nodes a walk reaches.
+    for a_low, a_high, b_low, b_high in zip(low_a, high_a, low_b, high_b):
+        if b_low > a_high:
+            total += (b_low - a_high) ** 2
+        elif a_low > b_high:
+            total += (a_low - b_high) ** 2
+    return math.sqrt(total)
+
+
+def pairwise_distances(query_points: np.ndarray,
+                       reference_points: np.ndarray,
+                       metric: Optional[DistanceMetric] = None) -> np.ndarray:
+    """
+    :return: an (m, n) array of the distances from each of m query points to each of n reference points.
+    """
+    if metric is None:
+        diffs = query_points[:, np.newaxis, :] - reference_points[np.newaxis, :, :]
+        return np.sqrt(np.einsum("ijk,ijk->ij", diffs, diffs))
+    return metric.distances(reference_points[np.newaxis, :, :], query_points[:, np.newaxis, :])
+
+
+def as_boxed_tree(tree: Union[BoxedTree, AbstractNode, None]) -> BoxedTree:
+    return tree if isinstance(tree, BoxedTree) else BoxedTree(tree)
+
+
+def all_nearest_neighbors(query_tree: Union[BoxedTree, AbstractNode, None],
+                          reference_tree: Union[BoxedTree, AbstractNode, None],
+                          metric: Optional[DistanceMetric] = None,
+                          stats: Optional[SearchStats] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    finds the nearest reference datum to every query datum at once, by walking both trees together (a "dual-tree"
+    search). Instead of starting from the reference root for each query datum, it considers a query node and a
+    reference node at a time, and skips the whole pair if their boxes are too far apart for anything in the reference
+    node to beat the best distance so far of any datum in the query node. Otherwise both nodes are split (or just the
+    one that isn't a leaf), and each query child is paired with the nearer reference child first, until two leaves
+    meet and all the distances between them are found in one vectorized step.
+
+    The bound a query node's pairs must beat is the worst best distance of any datum below it. If the metric gives a
+    box_diameter, it may be tightened further by the triangle inequality: no datum below can be further from its
+    nearest neighbor than the best distance of any other datum below, plus the diameter of the node's box.
+    :param query_tree: the root of a tree of the data to find neighbors for (or a BoxedTree already made from one).
+    :param reference_tree: the root of a tree of the data to find them among (or a BoxedTree made from one).
+    :param metric: how to measure distance; None means Euclidean distance.
+    :param stats: if not None, the work done is added to it: nodes_visited counts the pairs of nodes looked at,
+    branches_pruned the pairs skipped, and leaves_scanned the pairs of leaves whose distances were found.
+    :return: (query points, their nearest reference points, the distances between them) - an (m, d), an (m, d) and an
+    (m,) array, with the query data in the order the query tree's leaves hold them (its BoxedTree's get_points()). If
+    the reference tree is empty, the nearest points are all nan and the distances all infinite.
+    """
+    queries, references = as_boxed_tree(query_tree), as_boxed_tree(reference_tree)
+    query_points, reference_points = queries.get_points(), references.get_points()
+    best_distances = np.full(len(queries), np.inf)
+    best_rows = np.full(len(queries), NO_NODE, dtype=np.int64)
+
+    if len(queries) > 0 and len(references) > 0:
+        search = DualTreeBounds(queries, EUCLIDEAN if metric is None else metric)
+        # a stack of (query node, reference node, the bound on the distance between their boxes) still to consider.
+        to_visit: List[Tuple[int, int, float]] = [(0, 0, 0.0)]
+        push, pop = to_visit.append, to_visit.pop
+        bounds = search.bounds
+        while to_visit:
+            query, reference, lower_bound = pop()
+            if lower_bound >= bounds[query]:
+                if stats is not None:
+                    stats.branches_pruned += 1
+                continue
+            if stats is not None:
+                stats.nodes_visited += 1
+
+            query_is_leaf, reference_is_leaf = queries.is_a_leaf(query), references.is_a_leaf(reference)
+            if query_is_leaf and reference_is_leaf:
+                start, end = queries.get_start(query), queries.get_end(query)
+                reference_start = references.get_start(reference)
+                distances = pairwise_distances(query_points[start:end],
+                                               reference_points[reference_start:references.get_end(reference)],
+                                               metric)
+                if stats is not None:
+                    stats.leaves_scanned += 1
+                    stats.distance_computations += distances.size
+                nearest = np.argmin(distances, axis=1)
+                nearest_distances = distances[np.arange(end - start), nearest]
+                improved = nearest_distances < best_distances[start:end]
+                best_distances[start:end][improved] = nearest_distances[improved]
+                best_rows[start:end][improved] = nearest[improved] + reference_start
+                search.leaf_done(query, float(best_distances[start:end].max()), float(best_distances[start:end].min()))
+                continue
+
+            query_children = [query] if query_is_leaf else queries.get_children(query)
+            reference_children = [reference] if reference_is_leaf else references.get_children(reference)
+            for query_child in reversed(query_children):
+                query_low, query_high = queries.get_bounding_box(query_child)
+                pairs = []
+                for reference_child in reference_children:
+                    reference_low, reference_high = references.get_bounding_box(reference_child)
+                    pairs.append((box_to_box_bound(query_low, query_high, reference_low, reference_high, metric),
+                                  reference_child))
+                # the farther child is pushed first, so that the nearer one is searched first, and shrinks the bound.
+                for pair_bound, reference_child in sorted(pairs, reverse=True):
+                    if pair_bound < bounds[query_child]:
+                        push((query_child, reference_child, pair_bound))
+                    elif stats is not None:
+                        stats.branches_pruned += 1
+
+    nearest_points = np.full_like(query_points, np.nan)
+    found = best_rows != NO_NODE
+    if found.any():
+        nearest_points[found] = reference_points[best_rows[found]]
+    return query_points, nearest_points, best_distances
+
+
+class DualTreeBounds:
+    """
+    The bound each query node's pairs must beat in all_nearest_neighbors, kept up to date as the leaves below it find
+    nearer neighbors. Bounds only ever shrink.
+    """
+
+    def __init__(self, queries: BoxedTree, metric: DistanceMetric):
+        self._queries = queries
+        num_nodes = queries.get_num_nodes()
+        self.bounds: List[float] = [float('inf')] * num_nodes  # public, as it is read for every pair of nodes.
+        self._least: List[float] = [float('inf')] * num_nodes  # the smallest best distance of any datum below.
+        self._diameters: List[float] = [float('inf')] * num_nodes
+        for node in range(num_nodes):
+            box = queries.get_bounding_box(node)
+            if box is not None:
+                self._diameters[node] = metric.box_diameter(*box)
+
+    def leaf_done(self, leaf: int, worst: float, least: float) -> None:
+        """
+        records a query leaf's best distances after a search of a reference leaf, and passes the change on up to its
+        ancestors, stopping as soon as one's bound and least distance don't change.
+        :param leaf: the query leaf.
+        :param worst: the largest best distance of any datum in the leaf.
+        :param least: the smallest.
+        """
+        self._least[leaf] = least
+        self.bounds[leaf] = min(worst, least + self._diameters[leaf])
+        node = self._queries.get_parent(leaf)
+        while node != NO_NODE:
+            children = self._queries.get_children(node)
+            least = min(self._least[child] for child in children)
+            bound = min(max(self.bounds[child] for child in children), least + self._diameters[node])
+            if bound >= self.bounds[node] and least >= self._least[node]:
+                return
+            self.bounds[node], self._least[node] = bound, least
+            node = self._queries.get_parent(node)
+
+
+def join_within(query_tree: Union[BoxedTree, AbstractNode, None],
+                reference_tree: Union[BoxedTree, AbstractNode, None],
+                radius: float,
+                metric: Optional[DistanceMetric] = None,
+                stats: Optional[SearchStats] = None) -> Iterator[Tuple[Tuple[float, ...], Tuple[float, ...], float]]:
+    """
+    generates every pair of a query datum and a reference datum within the given distance of each other (inclusive) -
+    an "epsilon join" - by walking both trees together, skipping each pair of nodes whose boxes are further apart than
+    the radius, and checking the rest a pair of leaves at a time.
+    :param query_tree: the root of one tree (or a BoxedTree already made from one).
+    :param reference_tree: the root of the other (or a BoxedTree made from one).
+    :param radius: the largest distance that counts as a match.
+    :param metric: how to measure distance; None means Euclidean distance.
+    :param stats: as in all_nearest_neighbors.
+    :return: a generator of (query datum, reference datum, distance) triples, in no particular order.
+    """
+    queries, references = as_boxed_tree(query_tree), as_boxed_tree(reference_tree)
+    query_points, reference_points = queries.get_points(), references.get_points()
+    if len(queries) == 0 or len(references) == 0:
+        return
+
+    to_visit: List[Tuple[int, int]] = [(0, 0)]
+    while to_visit:
+        query, reference = to_visit.pop()
+        query_low, query_high = queries.get_bounding_box(query)
+        reference_low, reference_high = references.get_bounding_box(reference)
+        if box_to_box_bound(query_low, query_high, reference_low, reference_high, metric) > radius:
+            if stats is not None:
+                stats.branches_pruned += 1
+            continue
+        if stats is not None:
+            stats.nodes_visited += 1
+
+        query_is_leaf, reference_is_leaf = queries.is_a_leaf(query), references.is_a_leaf(reference)
+        if query_is_leaf and reference_is_leaf:
+            start, reference_start = queries.get_start(query), references.get_start(reference)
+            distances = pairwise_distances(query_points[start:queries.get_end(query)],
+                                           reference_points[reference_start:references.get_end(reference)], metric)
+            if stats is not None:
+                stats.leaves_scanned += 1
+                stats.distance_computations += distances.size
+            for query_row, reference_row in zip(*np.nonzero(distances <= radius)):
+                yield (tuple(query_points[start + query_row].tolist()),
+                       tuple(reference_points[reference_start + reference_row].tolist()),
+                       float(distances[query_row, reference_row]))
+        elif reference_is_leaf or (not query_is_leaf and queries.get_end(query) - queries.get_start(query) >=
+                                   references.get_end(reference) - references.get_start(reference)):
+            to_visit.extend((child, reference) for child in queries.get_children(query))
+        else:
+            to_visit.extend((query, child) for child in references.get_children(reference))
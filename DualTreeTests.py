@@ -0,0 +1,119 @@
+import math
+import random
+import unittest
+
+import numpy as np
+
+from DistanceMetricsFile import MANHATTAN, SQUARED_EUCLIDEAN, WeightedEuclideanMetric
+from DualTreeFile import BoxedTree, all_nearest_neighbors, join_within, box_to_box_bound
+from KDTreeFile import KDTree
+from SearchStatsFile import SearchStats
+from SplitterNodeFile import SplitterNode
+
+METRICS = [None, MANHATTAN, SQUARED_EUCLIDEAN, WeightedEuclideanMetric((4.0, 1.0, 0.25), (None, None, 366.0))]
+
+
+class DualTreeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(43)
+        # the last axis is periodic for the weighted metric, like day of year.
+        self.queries = {(random.uniform(0, 10), random.uniform(0, 100), random.uniform(0, 366)) for _ in range(300)}
+        self.references = {(random.uniform(0, 10), random.uniform(0, 100), random.uniform(0, 366)) for _ in range(700)}
+
+    @staticmethod
+    def build(data, leaf_size):
+        root = SplitterNode(0)
+        root.build_subtree(data, leaf_size=leaf_size)
+        return root
+
+    @staticmethod
+    def distance(metric, a, b):
+        return math.dist(a, b) if metric is None else metric.distance(a, b)
+
+    def test_boxed_tree(self):
+        root = self.build(self.references, 4)
+        for block_size in (1, 10):
+            boxed = BoxedTree(root, block_size=block_size)
+            self.assertCountEqual(self.references, [tuple(point) for point in boxed.get_points().tolist()])
+            low, high = boxed.get_bounding_box(0)
+            np.testing.assert_allclose(low, boxed.get_points().min(axis=0))
+            np.testing.assert_allclose(high, boxed.get_points().max(axis=0))
+            for node in range(boxed.get_num_nodes()):
+                children = boxed.get_children(node)
+                if boxed.is_a_leaf(node):
+                    self.assertEqual([], children)
+                else:
+                    self.assertEqual(boxed.get_end(node) - boxed.get_start(node),
+                                     sum(boxed.get_end(child) - boxed.get_start(child) for child in children))
+        self.assertEqual(0, len(BoxedTree(None)))
+
+    def test_box_to_box_bound(self):
+        for metric in METRICS:
+            for _ in range(20):
+                a = [tuple(random.uniform(0, 366) for _ in range(3)) for _ in range(6)]
+                b = [tuple(random.uniform(0, 366) for _ in range(3)) for _ in range(6)]
+                a_low, a_high = tuple(map(min, zip(*a))), tuple(map(max, zip(*a)))
+                b_low, b_high = tuple(map(min, zip(*b))), tuple(map(max, zip(*b)))
+                bound = box_to_box_bound(a_low, a_high, b_low, b_high, metric)
+                self.assertLessEqual(bound, min(self.distance(metric, x, y) for x in a for y in b) + 1e-9)
+        self.assertAlmostEqual(5.0, box_to_box_bound((0.0, 0.0), (1.0, 1.0), (4.0, 5.0), (6.0, 6.0)))
+
+    def test_all_nearest_neighbors(self):
+        expected = {(index, query): min(self.distance(metric, query, reference) for reference in self.references)
+                    for index, metric in enumerate(METRICS) for query in self.queries}
+        for leaf_size, block_size in ((1, 1), (1, 16), (5, 5), (5, 64)):
+            queries = BoxedTree(self.build(self.queries, leaf_size), block_size=block_size)
+            references = BoxedTree(self.build(self.references, leaf_size), block_size=block_size)
+            for index, metric in enumerate(METRICS):
+                query_points, nearest_points, distances = all_nearest_neighbors(queries, references, metric)
+                self.assertCountEqual(self.queries, [tuple(point) for point in query_points.tolist()])
+                for query, nearest, distance in zip(query_points.tolist(), nearest_points.tolist(), distances):
+                    self.assertAlmostEqual(expected[index, tuple(query)], distance)
+                    self.assertAlmostEqual(distance, self.distance(metric, query, nearest))
+                    self.assertIn(tuple(nearest), self.references)
+
+    def test_pruning(self):
+        queries = BoxedTree(self.build(self.queries, 4), block_size=4)
+        references = BoxedTree(self.build(self.references, 4), block_size=4)
+        stats = SearchStats()
+        all_nearest_neighbors(queries, references, stats=stats)
+        self.assertLess(stats.distance_computations, len(self.queries) * len(self.references) / 4)
+        self.assertGreater(stats.branches_pruned, 0)
+        stats.reset()
+        pairs = list(join_within(queries, references, 5.0, stats=stats))
+        self.assertLess(stats.distance_computations, len(self.queries) * len(self.references) / 4)
+        self.assertGreater(len(pairs), 0)
+
+    def test_join_within(self):
+        queries, references = self.build(self.queries, 3), self.build(self.references, 6)
+        for metric, radius in ((None, 12.0), (MANHATTAN, 15.0), (METRICS[3], 20.0)):
+            expected = {(query, reference) for query in self.queries for reference in self.references
+                        if self.distance(metric, query, reference) <= radius}
+            found = list(join_within(queries, references, radius, metric))
+            self.assertEqual(len(expected), len(found))
+            self.assertEqual(expected, {(query, reference) for query, reference, _ in found})
+            for query, reference, distance in found:
+                self.assertAlmostEqual(self.distance(metric, query, reference), distance)
+
+    def test_deleted_and_empty(self):
+        tree = KDTree(leaf_size=1)
+        tree.build(set(self.references))
+        deleted = list(self.references)[:200]
+        for datum in deleted:
+            tree.delete(datum)
+        live = self.references - set(deleted)
+        query_points, nearest_points, distances = all_nearest_neighbors(self.build(self.queries, 2), tree.get_root())
+        for query, nearest, distance in zip(query_points.tolist(), nearest_points.tolist(), distances):
+            self.assertAlmostEqual(min(math.dist(query, reference) for reference in live), distance)
+            self.assertIn(tuple(nearest), live)
+
+        query_points, nearest_points, distances = all_nearest_neighbors(self.build(self.queries, 2), None)
+        self.assertEqual(len(self.queries), len(query_points))
+        self.assertTrue(np.all(np.isinf(distances)))
+        self.assertTrue(np.all(np.isnan(nearest_points)))
+        self.assertEqual([], list(join_within(None, self.build(self.references, 2), 10.0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,993 @@
+import heapq
+import json
+import random
+import struct
+from typing import Dict, Iterator, List, Tuple, Optional, Sequence, Set
+
+import numpy as np
+
+from AbstractNodeFile import AbstractNode
+from DistanceMetricsFile import DistanceMetric, EUCLIDEAN, SQUARED_EUCLIDEAN
+from PointStorageFile import PointStorage, STORAGE_DTYPES, STORAGE_FLOAT64, STORAGE_MODES
+from SearchStatsFile import SearchStats
+from SplitterNodeFile import NUM_POINTS_FOR_MEDIAN
+
+NO_CHILD = -1  # stored in the left/right child arrays where a SplitterNode would have a None child.
+LEAF_AXIS = -1  # stored in the axis array for nodes that hold points rather than a split.
+# find_nearest_batch measures the distances from targets to the points of the leaves they visit for at most about this
+# many coordinates of points at a time, to bound the memory its arrays take.
+BATCH_CHUNK_VALUES = 1 << 21
+# with compact storage and exact re-checking, a search for k neighbors gathers RECHECK_FACTOR * k candidates (but at
+# least RECHECK_MIN_CANDIDATES) from the compact points, then keeps the k of them that are closest by the exact ones.
+RECHECK_FACTOR = 2
+RECHECK_MIN_CANDIDATES = 8
+
+# the snapshot file format written by FlatKDTree.save: a fixed header, a table giving the byte offset and element count
+# of each array section, then the sections themselves, each little-endian and aligned to SNAPSHOT_ALIGNMENT bytes so
+# that they can be memory-mapped in place.
+SNAPSHOT_MAGIC = b"KDTREE\x00\x00"
+SNAPSHOT_VERSION = 3
+SNAPSHOT_ALIGNMENT = 64
+SNAPSHOT_HEADER = struct.Struct("<8sIIqqqq")  # magic, version, flags, dimension, leaf_size, num_points, num_nodes
+SNAPSHOT_SECTION = struct.Struct("<qq")  # byte offset, number of elements
+SNAPSHOT_HAS_PAYLOADS = 1  # a bit in the header's flags.
+SNAPSHOT_STORAGE_SHIFT = 8  # the flags hold the storage mode's position in STORAGE_MODES from this bit up.
+# the "_points" section is written in the tree's storage dtype, rather than the one given here.
+SNAPSHOT_SECTIONS: List[Tuple[str, str]] = [("_axes", "<i4"), ("_thresholds", "<f8"), ("_left", "<i8"),
+                                            ("_right", "<i8"), ("_starts", "<i8"), ("_ends", "<i8"),
+                                            ("_indices", "<i8"), ("_points", "<f8"), ("_payload_offsets", "<i8"),
+                                            ("_payload_bytes", "u1"), ("_exact_points", "<f8"), ("_scales", "<f8"),
+                                            ("_offsets", "<f8"), ("_metadata", "u1")]
+# version 1 snapshots, from before compact storage, have only the first SNAPSHOT_V1_SECTIONS sections and always hold
+# float64 points; version 2 snapshots, from before metadata, have only the first SNAPSHOT_V2_SECTIONS. Both can still
+# be loaded.
+SNAPSHOT_V1_SECTIONS = 10
+SNAPSHOT_V2_SECTIONS = 13
+
+
+class FlatKDTree:
+    """
+    A k-d tree that keeps all of its points in one contiguous (n, d) numpy array and all of its splits in parallel
+    arrays, rather than as a graph of SplitterNode/PointNode objects. Node 0 is the root. Each node owns a contiguous
+    range [start, end) of the (reordered) point array; a leaf scans its range directly.
+
+    The points may be kept in a compact form - float32, or quantized to uint16 or uint8 - to fit bigger trees in memory;
+    see PointStorage. Searches then measure distances to the compact points, which are a little off, so they can miss
+    a neighbor whose distance is very close to another's. With exact_recheck, a float64 copy of the points is kept as
+    well (memory-mapped from the snapshot file, once the tree has been saved and loaded, so only the rows actually
+    re-checked are read from disk), and each search's final candidates are measured again against it.
+
+    Searches never change the tree, so any number of threads may search one FlatKDTree at once. A rebuild, though,
+    replaces its arrays one at a time, so don't rebuild a FlatKDTree that other threads may be searching: build a new
+    one and swap it in for the old one instead (or use a KDTree, which can be changed while it is searched).
+    """
+
+    def __init__(self, leaf_size: int = 1, storage: str = STORAGE_FLOAT64, exact_recheck: bool = False):
+        """
+        :param leaf_size: the most points a leaf may hold.
+        :param storage: how to hold the points: one of STORAGE_MODES.
+        :param exact_recheck: if True (and storage is not float64), keep a float64 copy of the points too, and re-check
+        the final candidates of each search against it.
+        """
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode {storage!r}; expected one of {STORAGE_MODES}.")
+        self._leaf_size: int = max(1, leaf_size)
+        self._dimension: int = -1
+        self._storage_mode: str = storage
+        self._storage: Optional[PointStorage] = None  # fitted to the points by each build.
+        self._exact_recheck: bool = exact_recheck and storage != STORAGE_FLOAT64
+        # (n, d) array of the storage's dtype, reordered so each subtree is contiguous.
+        self._points: Optional[np.ndarray] = None
+        self._exact_points: Optional[np.ndarray] = None  # (n, d) float copy of _points, if exact_recheck.
+        self._indices: Optional[np.ndarray] = None  # _indices[i] is the original row of _points[i].
+        self._axes: Optional[np.ndarray] = None  # axis of each node, or LEAF_AXIS.
+        self._thresholds: Optional[np.ndarray] = None
+        self._left: Optional[np.ndarray] = None  # index of the left child node, or NO_CHILD.
+        self._right: Optional[np.ndarray] = None
+        self._starts: Optional[np.ndarray] = None  # first row of _points belonging to each node.
+        self._ends: Optional[np.ndarray] = None  # one past the last row of _points belonging to each node.
+        # optional payloads (such as descriptions), one string per row of _points, stored as utf-8 bytes: the payload
+        # of row i is _payload_bytes[_payload_offsets[i]:_payload_offsets[i + 1]].
+        self._payload_offsets: Optional[np.ndarray] = None
+        self._payload_bytes: Optional[np.ndarray] = None
+        self._version: int = 0  # goes up by one every time the tree is (re)built; see get_version.
+        self._metadata: Dict[str, object] = {}  # whatever was saved with the snapshot this tree was loaded from.
+
+    def get_version(self) -> int:
+        """
+        :return: a number that changes whenever the contents of this tree do, so that anything holding on to earlier
+        search results (such as a QueryCache) can tell they may be out of date.
+        """
+        return self._version
+
+    def get_dimension(self) -> int:
+        return self._dimension
+
+    def get_metadata(self) -> Dict[str, object]:
+        """
+        :return: the metadata saved along with the snapshot this tree was loaded from (such as the settings it was
+        built with), or {} if there was none or the tree was built rather than loaded.
+        """
+        return self._metadata
+
+    def get_leaf_size(self) -> int:
+        return self._leaf_size
+
+    def get_num_nodes(self) -> int:
+        return 0 if self._axes is None else len(self._axes)
+
+    def get_storage(self) -> Optional[PointStorage]:
+        """
+        :return: how this tree holds its points, or None if it has not been built.
+        """
+        return self._storage
+
+    def has_exact_points(self) -> bool:
+        """
+        :return: whether this tree keeps a float64 copy of compact points, and re-checks searches against it.
+        """
+        return self._exact_points is not None
+
+    def get_stored_points(self) -> Optional[np.ndarray]:
+        """
+        :return: the (n, d) array of points as they are stored - in the storage's dtype - and searched.
+        """
+        return self._points
+
+    def get_points(self) -> Optional[np.ndarray]:
+        """
+        :return: the (n, d) float array of points, in the order of the tree's rows. With compact storage, this is the
+        float64 copy if one is kept, or else a new array decoded from the stored one - so use get_point to look up one
+        row at a time.
+        """
+        if self._points is None:
+            return None
+        if self._exact_points is not None:
+            return self._exact_points
+        return self._storage.decode(self._points)
+
+    def get_point(self, row: int) -> np.ndarray:
+        """
+        :param row: a row of get_points()
+        :return: that point, as a float array: exact if the tree has float64 storage or an exact copy, and otherwise as
+        decoded from the compact storage.
+        """
+        if self._exact_points is not None:
+            return self._exact_points[row]
+        return self._storage.decode(self._points[row])
+
+    def _point_tuple(self, row: int) -> Tuple[float, ...]:
+        return tuple(self.get_point(row).tolist())
+
+    def _leaf_points(self, start: int, end: int) -> np.ndarray:
+        """
+        :return: the float values of the stored (possibly compact) points in rows start to end, as searches see them.
+        """
+        return self._storage.decode(self._points[start:end])
+
+    def get_memory_usage(self) -> Dict[str, int]:
+        """
+        :return: the number of bytes held by each part of this tree: "points" (the stored points, which searches scan),
+        "exact_points" (the float64 copy kept for re-checking, if any), "structure" (the split arrays and the original
+        row of each point), "payloads", and the "total" of them all. The arrays of a loaded tree are memory-mapped, so
+        for one of those, these are the bytes of the snapshot file that searches may read.
+        """
+        def size(*arrays: Optional[np.ndarray]) -> int:
+            return sum(0 if array is None else int(array.nbytes) for array in arrays)
+
+        usage = {"points": size(self._points),
+                 "exact_points": size(self._exact_points),
+                 "structure": size(self._axes, self._thresholds, self._left, self._right, self._starts, self._ends,
+                                   self._indices),
+                 "payloads": size(self._payload_offsets, self._payload_bytes)}
+        usage["total"] = sum(usage.values())
+        return usage
+
+    def __len__(self) -> int:
+        return 0 if self._points is None else len(self._points)
+
+    def build_tree(self, data_to_split: Set[Tuple[float, ...]]) -> None:
+        """
+        builds the tree from the same kind of set that SplitterNode.build_subtree accepts.
+        :param data_to_split: the set of Tuples of floats that we wish to load into the tree.
+        :return: None
+        """
+        self.build_from_array(np.array(list(data_to_split), dtype=float))
+
+    def build_from_array(self, points: np.ndarray, payloads: Optional[Sequence[str]] = None) -> None:
+        """
+        builds the tree from an (n, d) array of points, following the same rules as SplitterNode.build_subtree: the
+        axis rotates round-robin starting at 0, each split is at the median of (a sample of) the values on that axis,
+        and values equal to the threshold are sent left or right by a coin flip.
+
+        With compact storage, the tree is split on the values the compact points decode to, so that its thresholds
+        agree with the points that searches will actually see.
+        :param points: the (n, d) array of points to load into the tree. Rows are copied, not referenced.
+        :param payloads: if not None, one string per row of points (such as a description), which stays attached to
+        that point; see get_payload.
+        :return: None
+        """
+        points = np.array(points, dtype=float, copy=True)
+        if points.ndim != 2 or len(points) == 0:
+            raise ValueError(f"Expected a non-empty (n, d) array of points, but got shape {points.shape}.")
+        self._dimension = points.shape[1]
+        self._version += 1
+        self._storage = PointStorage.fit(points, self._storage_mode)
+        stored = self._storage.encode(points)
+        exact_points = points if self._exact_recheck else None
+        points = self._storage.decode(stored)  # for float64 storage, the same array as before.
+        order = np.arange(len(points))
+
+        axes: List[int] = []
+        thresholds: List[float] = []
+        lefts: List[int] = []
+        rights: List[int] = []
+        starts: List[int] = []
+        ends: List[int] = []
+
+        def new_node(start: int, end: int) -> int:
+            axes.append(LEAF_AXIS)
+            thresholds.append(0.0)
+            lefts.append(NO_CHILD)
+            rights.append(NO_CHILD)
+            starts.append(start)
+            ends.append(end)
+            return len(axes) - 1
+
+        # a stack of (node index, axis to split on) still to be built. A node is split only if it holds more than
+        # leaf_size points; otherwise it stays a leaf.
+        to_build: List[Tuple[int, int]] = [(new_node(0, len(points)), 0)]
+        # the coin flips for ties are drawn in bulk from numpy, seeded from the random module so that random.seed still
+        # makes the build reproducible.
+        coins = np.random.default_rng(random.getrandbits(64))
+        while to_build:
+            node, axis = to_build.pop()
+            start, end = starts[node], ends[node]
+            if end - start <= self._leaf_size:
+                continue
+            values = points[order[start:end], axis]
+            threshold = self._median_value(values)
+            goes_left = values < threshold
+            tied = np.flatnonzero(values == threshold)
+            goes_left[tied] = coins.random(len(tied)) < 0.5  # a coin flip for each datum tied with the threshold.
+            order[start:end] = np.concatenate((order[start:end][goes_left], order[start:end][~goes_left]))
+            middle = start + int(np.count_nonzero(goes_left))
+
+            axes[node] = axis
+            thresholds[node] = threshold
+            next_axis = (axis + 1) % self._dimension
+            if middle > start:
+                lefts[node] = new_node(start, middle)
+                to_build.append((lefts[node], next_axis))
+            if end > middle:
+                rights[node] = new_node(middle, end)
+                to_build.append((rights[node], next_axis))
+
+        self._indices = order
+        self._points = np.ascontiguousarray(stored[order])
+        self._exact_points = None if exact_points is None else np.ascontiguousarray(exact_points[order])
+        self._axes = np.array(axes, dtype=np.int32)
+        self._thresholds = np.array(thresholds, dtype=float)
+        self._left = np.array(lefts, dtype=np.int64)
+        self._right = np.array(rights, dtype=np.int64)
+        self._starts = np.array(starts, dtype=np.int64)
+        self._ends = np.array(ends, dtype=np.int64)
+        self._payload_offsets, self._payload_bytes = None, None
+        if payloads is not None:
+            if len(payloads) != len(points):
+                raise ValueError(f"Expected {len(points)} payloads, one per point, but got {len(payloads)}.")
+            self._set_payloads([payloads[row] for row in order.tolist()])
+
+    def _set_payloads(self, payloads: Sequence[str]) -> None:
+        """
+        packs one payload string per row of _points into _payload_offsets and _payload_bytes.
+        """
+        encoded = [payload.encode("utf-8") for payload in payloads]
+        self._payload_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(payload) for payload in encoded], out=self._payload_offsets[1:])
+        self._payload_bytes = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    def has_payloads(self) -> bool:
+        return self._payload_offsets is not None
+
+    def get_payload(self, row: int) -> Optional[str]:
+        """
+        :param row: a row of get_points()
+        :return: the payload string given for that point when the tree was built, or None if there were none.
+        """
+        if self._payload_offsets is None:
+            return None
+        start, end = self._payload_offsets[row], self._payload_offsets[row + 1]
+        return bytes(self._payload_bytes[start:end]).decode("utf-8")
+
+    @staticmethod
+    def _median_value(values: np.ndarray) -> float:
+        """
+        the same median rule as SplitterNode.get_median_value: the middle of the sorted values of a random sample of
+        NUM_POINTS_FOR_MEDIAN entries, or of all of them if there are not that many.
+        :param values: the values along the current axis of the points being split.
+        :return: the median
+        """
+        if 0 < NUM_POINTS_FOR_MEDIAN < len(values):
+            values = values[random.sample(range(len(values)), NUM_POINTS_FOR_MEDIAN)]
+        nums = np.sort(values)
+        return float(nums[len(nums) // 2])
+
+    def is_leaf(self, node: int) -> bool:
+        return self._axes[node] == LEAF_AXIS
+
+    def get_axis(self, node: int) -> int:
+        return int(self._axes[node])
+
+    def get_threshold(self, node: int) -> float:
+        return float(self._thresholds[node])
+
+    def get_left_index(self, node: int) -> int:
+        return int(self._left[node])
+
+    def get_right_index(self, node: int) -> int:
+        return int(self._right[node])
+
+    def get_node_range(self, node: int) -> Tuple[int, int]:
+        """
+        :param node: the index of a node in this tree
+        :return: the [start, end) range of rows of get_points() that belong to that node's subtree.
+        """
+        return int(self._starts[node]), int(self._ends[node])
+
+    def get_original_index(self, row: int) -> int:
+        """
+        :param row: a row of get_points()
+        :return: the row that point had in the array (or list of the set) this tree was built from.
+        """
+        return int(self._indices[row])
+
+    @staticmethod
+    def _search_metric(metric: Optional[DistanceMetric]) -> DistanceMetric:
+        """
+        the metric the searches actually run in. Without a metric, they search in squared Euclidean distance, which
+        finds the same neighbors with no square roots, and take the square root only of the distances they report.
+        """
+        return SQUARED_EUCLIDEAN if metric is None else metric
+
+    @staticmethod
+    def _reported_distance(distance, metric: Optional[DistanceMetric]):
+        """
+        converts a distance (or array of them) found by a search in _search_metric(metric) into the one to report.
+        """
+        return np.sqrt(distance) if metric is None else distance
+
+    def find_nearest_row(self,
+                         target: Tuple[float, ...],
+                         node: int = 0,
+                         metric: Optional[DistanceMetric] = None,
+                         stats: Optional[SearchStats] = None) -> Tuple[int, float]:
+        """
+        finds the row of get_points() closest to the target, searching the subtree rooted at the given node.
+        :param target: the point for which we want the nearest neighbor.
+        :param node: the node at which to start, normally the root.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :param stats: if not None, the work done by this search is added to it.
+        :return: (row, distance), or (-1, inf) if the tree is empty.
+        """
+        if self._points is None:
+            return -1, float('inf')
+        if self._exact_points is not None:  # gather a few candidates, to re-check.
+            return self.find_k_nearest_rows(target, 1, node=node, metric=metric, stats=stats)[0]
+        target_array = np.asarray(target, dtype=float)
+        best_row, best_distance = self._search(node, target_array, -1, float('inf'), self._search_metric(metric),
+                                               stats)
+        return best_row, float(self._reported_distance(best_distance, metric))
+
+    def _search(self, node: int, target: np.ndarray, best_row: int, best_distance: float,
+                metric: DistanceMetric, stats: Optional[SearchStats] = None) -> Tuple[int, float]:
+        """
+        the search behind find_nearest_row, walking the subtree from an explicit stack so that trees of any depth can
+        be searched.
+        :return: the best (row, distance) found so far, including anything found in this subtree.
+        """
+        # entries are (node, NO_CHILD) for a subtree to search, or (secondary branch, splitter) for the far side of a
+        # splitter whose near side has now been searched: that is only searched if the splitter's threshold is still
+        # closer than the best distance found by then.
+        to_visit: List[Tuple[int, int]] = [(node, NO_CHILD)]
+        while to_visit:
+            node, splitter = to_visit.pop()
+            if splitter != NO_CHILD:
+                splitter_axis = self._axes[splitter]
+                if metric.axis_lower_bound(splitter_axis, target[splitter_axis], self._thresholds[splitter]) \
+                        >= best_distance:
+                    if stats is not None:
+                        stats.branches_pruned += 1
+                    continue
+                if stats is not None:
+                    stats.branches_explored += 1
+
+            axis = self._axes[node]
+            if stats is not None:
+                self._count_visit(node, stats)
+            if axis == LEAF_AXIS:
+                start, end = self._starts[node], self._ends[node]
+                distances = metric.distances(self._leaf_points(start, end), target)
+                local_best = int(np.argmin(distances))
+                if distances[local_best] < best_distance:
+                    best_row, best_distance = int(start) + local_best, float(distances[local_best])
+                continue
+
+            if target[axis] < self._thresholds[node]:
+                preferred, secondary = self._left[node], self._right[node]
+            else:
+                preferred, secondary = self._right[node], self._left[node]
+            if secondary != NO_CHILD:  # pushed first, so that it is popped after the preferred side is searched.
+                to_visit.append((secondary, node))
+            if preferred != NO_CHILD:
+                to_visit.append((preferred, NO_CHILD))
+        return best_row, best_distance
+
+    def _count_visit(self, node: int, stats: SearchStats) -> None:
+        """
+        counts a search's visit to a node in its stats, including the distances measured if it is a leaf.
+        """
+        stats.nodes_visited += 1
+        if self._axes[node] == LEAF_AXIS:
+            stats.leaves_scanned += 1
+            stats.distance_computations += int(self._ends[node] - self._starts[node])
+
+    def find_nearest(self,
+                     target: Tuple[float, ...],
+                     metric: Optional[DistanceMetric] = None,
+                     stats: Optional[SearchStats] = None) -> Tuple[Optional[Tuple[float, ...]], Optional[float]]:
+        """
+        finds the point in this tree closest to the target.
+        :param target: the point for which we want the nearest neighbor.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :param stats: if not None, the work done by this search is added to it.
+        :return: (closest point as a tuple of floats, distance), or (None, None) if the tree is empty.
+        """
+        row, distance = self.find_nearest_row(target, metric=metric, stats=stats)
+        if row < 0:
+            return None, None
+        return self._point_tuple(row), distance
+
+    def find_k_nearest_rows(self,
+                            target: Tuple[float, ...],
+                            k: int,
+                            node: int = 0,
+                            metric: Optional[DistanceMetric] = None,
+                            stats: Optional[SearchStats] = None) -> List[Tuple[int, float]]:
+        """
+        finds the k rows of get_points() closest to the target in one traversal, pruning against the k-th best distance
+        found so far, which is kept at the top of a bounded max-heap.
+        :param target: the point for which we want the nearest neighbors.
+        :param k: how many neighbors to find.
+        :param node: the node at which to start, normally the root.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :param stats: if not None, the work done by this search is added to it.
+        :return: a list of up to k (row, distance) pairs, closest first.
+        """
+        if self._points is None or k <= 0:
+            return []
+        target_array = np.asarray(target, dtype=float)
+        search_metric = self._search_metric(metric)
+        heap: List[Tuple[float, int]] = []  # (-distance, row), so the worst of the k is at heap[0].
+        if self._exact_points is None:
+            self._gather_k(node, target_array, k, heap, search_metric, stats)
+            return [(row, float(self._reported_distance(-negative_distance, metric)))
+                    for negative_distance, row in sorted(heap, reverse=True)]
+
+        # the compact points are a little off, so the true k nearest may not be the k that look nearest; but they will
+        # almost always be among a few more than k.
+        self._gather_k(node, target_array, max(RECHECK_MIN_CANDIDATES, RECHECK_FACTOR * k), heap, search_metric, stats)
+        rows = np.array([row for _, row in heap], dtype=np.int64)
+        distances = search_metric.distances(self._exact_points[rows], target_array)
+        if stats is not None:
+            stats.distance_computations += len(rows)
+        closest = np.argsort(distances, kind="stable")[:k]
+        return [(int(row), float(self._reported_distance(distance, metric)))
+                for row, distance in zip(rows[closest], distances[closest])]
+
+    def _gather_k(self, node: int, target: np.ndarray, k: int, heap: List[Tuple[float, int]],
+                  metric: DistanceMetric, stats: Optional[SearchStats] = None) -> None:
+        """
+        the search behind find_k_nearest_rows, walking the subtree from an explicit stack like _search.
+        """
+        to_visit: List[Tuple[int, int]] = [(node, NO_CHILD)]  # as in _search.
+        while to_visit:
+            node, splitter = to_visit.pop()
+            if splitter != NO_CHILD:
+                splitter_axis = self._axes[splitter]
+                if len(heap) == k and metric.axis_lower_bound(splitter_axis, target[splitter_axis],
+                                                              self._thresholds[splitter]) >= -heap[0][0]:
+                    if stats is not None:
+                        stats.branches_pruned += 1
+                    continue
+                if stats is not None:
+                    stats.branches_explored += 1
+
+            axis = self._axes[node]
+            if stats is not None:
+                self._count_visit(node, stats)
+            if axis == LEAF_AXIS:
+                start, end = self._starts[node], self._ends[node]
+                distances = metric.distances(self._leaf_points(start, end), target)
+                for local_row in np.argsort(distances)[:k]:
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-float(distances[local_row]), int(start + local_row)))
+                    elif distances[local_row] < -heap[0][0]:
+                        heapq.heapreplace(heap, (-float(distances[local_row]), int(start + local_row)))
+                    else:
+                        break  # the rest of this leaf is sorted further away.
+                continue
+
+            if target[axis] < self._thresholds[node]:
+                preferred, secondary = self._left[node], self._right[node]
+            else:
+                preferred, secondary = self._right[node], self._left[node]
+            if secondary != NO_CHILD:
+                to_visit.append((secondary, node))
+            if preferred != NO_CHILD:
+                to_visit.append((preferred, NO_CHILD))
+
+    def find_k_nearest(self,
+                       target: Tuple[float, ...],
+                       k: int,
+                       metric: Optional[DistanceMetric] = None,
+                       stats: Optional[SearchStats] = None) -> List[Tuple[Tuple[float, ...], float]]:
+        """
+        finds the k points in this tree closest to the target.
+        :param target: the point for which we want the nearest neighbors.
+        :param k: how many neighbors to find.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :param stats: if not None, the work done by this search is added to it.
+        :return: a list of up to k (point as a tuple of floats, distance) pairs, closest first.
+        """
+        return [(self._point_tuple(row), distance)
+                for row, distance in self.find_k_nearest_rows(target, k, metric=metric, stats=stats)]
+
+    def find_nearest_batch(self,
+                           targets: np.ndarray,
+                           metric: Optional[DistanceMetric] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        finds the nearest neighbor of each of many targets at once, with no Python loop over the targets: every step
+        works on arrays holding all of them. First, all the targets walk down the tree together, one level per step, to
+        the leaf that their side of each threshold leads to, and measure the distances to its points; that gives each
+        target a nearest point so far. Then the tree is searched again from the root, one level per step, by (target,
+        node) pairs. Each pair carries a lower bound on the distance from its target to anything in its node - the
+        largest of the axis_lower_bounds of the thresholds it has crossed to get there - and is dropped once that is no
+        closer than the target's best so far, which leaves only the few nodes near each target's own leaf. The leaves
+        that pairs reach are measured in bulk, like the first ones. (A tree that re-checks its compact points against
+        exact ones searches for each target in turn, with find_nearest_row, instead.)
+        :param targets: an (m, d) array of targets.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :return: (rows, distances) - two arrays of length m, holding the row of get_points() nearest each target and
+        the distance to it.
+        """
+        search_metric = self._search_metric(metric)
+        targets = np.atleast_2d(np.asarray(targets, dtype=float))
+        num_targets = len(targets)
+        best_rows = np.full(num_targets, -1, dtype=np.int64)
+        best_distances = np.full(num_targets, np.inf)
+        if self._points is None or num_targets == 0:
+            return best_rows, best_distances
+        if self._exact_points is not None:
+            for target_index, target in enumerate(targets):
+                best_rows[target_index], best_distances[target_index] = self.find_nearest_row(target, metric=metric)
+            return best_rows, best_distances
+
+        # the walk down: each target's node, one level further down per step, until they are all at leaves. A target
+        # whose side of a threshold has no child takes the other side.
+        own_leaves = np.zeros(num_targets, dtype=np.int64)
+        walking = np.flatnonzero(self._axes[own_leaves] != LEAF_AXIS)
+        while len(walking) > 0:
+            nodes = own_leaves[walking]
+            goes_left = targets[walking, self._axes[nodes]] < self._thresholds[nodes]
+            preferred = np.where(goes_left, self._left[nodes], self._right[nodes])
+            own_leaves[walking] = np.where(preferred != NO_CHILD, preferred, self._left[nodes] + self._right[nodes]
+                                           - preferred)
+            walking = walking[self._axes[own_leaves[walking]] != LEAF_AXIS]
+        all_targets = np.arange(num_targets)
+        self._scan_leaves(targets, all_targets, own_leaves, search_metric, best_rows, best_distances)
+
+        # the search from the root, by (target, node, lower bound) pairs.
+        pair_targets, pair_nodes, pair_bounds = all_targets, np.zeros(num_targets, dtype=np.int64), \
+            np.zeros(num_targets)
+        while len(pair_targets) > 0:
+            close_enough = pair_bounds < best_distances[pair_targets]
+            pair_targets, pair_nodes, pair_bounds = \
+                pair_targets[close_enough], pair_nodes[close_enough], pair_bounds[close_enough]
+            axes = self._axes[pair_nodes]
+            at_leaf = axes == LEAF_AXIS
+            to_scan = at_leaf & (pair_nodes != own_leaves[pair_targets])  # each target's own leaf is already done.
+            if to_scan.any():
+                self._scan_leaves(targets, pair_targets[to_scan], pair_nodes[to_scan], search_metric, best_rows,
+                                  best_distances)
+
+            splits = ~at_leaf
+            pair_targets, pair_nodes, pair_bounds, axes = \
+                pair_targets[splits], pair_nodes[splits], pair_bounds[splits], axes[splits]
+            thresholds = self._thresholds[pair_nodes]
+            goes_left = targets[pair_targets, axes] < thresholds
+            near = np.where(goes_left, self._left[pair_nodes], self._right[pair_nodes])
+            far = np.where(goes_left, self._right[pair_nodes], self._left[pair_nodes])
+            # a metric bounds one axis at a time, so the far sides' bounds are worked out axis by axis.
+            far_bounds = pair_bounds.copy()
+            for axis in np.unique(axes).tolist():
+                on_axis = axes == axis
+                far_bounds[on_axis] = np.maximum(pair_bounds[on_axis], search_metric.axis_lower_bound(
+                    axis, targets[pair_targets[on_axis], axis], thresholds[on_axis]))
+            pair_targets = np.concatenate((pair_targets, pair_targets))
+            pair_nodes = np.concatenate((near, far))
+            pair_bounds = np.concatenate((pair_bounds, far_bounds))
+            has_child = pair_nodes != NO_CHILD
+            pair_targets, pair_nodes, pair_bounds = \
+                pair_targets[has_child], pair_nodes[has_child], pair_bounds[has_child]
+
+        return best_rows, self._reported_distance(best_distances, metric)
+
+    def _scan_leaves(self, targets: np.ndarray, pair_targets: np.ndarray, pair_nodes: np.ndarray,
+                     metric: DistanceMetric, best_rows: np.ndarray, best_distances: np.ndarray) -> None:
+        """
+        the bulk leaf search of find_nearest_batch: measures the distance from each of the pair_targets to every point
+        of the leaf in pair_nodes beside it, and wherever that finds a point closer than the target's best so far,
+        updates best_rows and best_distances. A target may be paired with several leaves.
+        """
+        starts = self._starts[pair_nodes]
+        sizes = self._ends[pair_nodes] - starts
+        width = int(sizes.max())  # the leaves are measured as if they were all this big, with the extra points ignored.
+        offsets = np.arange(width)
+        chunk_size = max(1, BATCH_CHUNK_VALUES // (width * targets.shape[1]))
+        for first in range(0, len(pair_targets), chunk_size):
+            chunk_targets = pair_targets[first:first + chunk_size]
+            chunk_starts = starts[first:first + chunk_size, np.newaxis]
+            in_leaf = offsets < sizes[first:first + chunk_size, np.newaxis]
+            rows = np.where(in_leaf, chunk_starts + offsets, chunk_starts)
+            distances = metric.distances(self._storage.decode(self._points[rows]),
+                                         targets[chunk_targets, np.newaxis, :])
+            distances[~in_leaf] = np.inf
+            closest = np.argmin(distances, axis=1)
+            closest_distances = distances[np.arange(len(chunk_targets)), closest]
+            # several pairs may share a target; only the closest of their points counts for it.
+            order = np.lexsort((closest_distances, chunk_targets))
+            is_first = np.ones(len(order), dtype=bool)
+            is_first[1:] = chunk_targets[order[1:]] != chunk_targets[order[:-1]]
+            chosen = order[is_first]
+            chosen = chosen[closest_distances[chosen] < best_distances[chunk_targets[chosen]]]
+            best_rows[chunk_targets[chosen]] = rows[chosen, closest[chosen]]
+            best_distances[chunk_targets[chosen]] = closest_distances[chosen]
+
+    def _leaf_matches(self, node: int, may_reach, matches) -> Iterator[np.ndarray]:
+        """
+        walks the subtree at node, skipping every child that cannot hold a match, and for each leaf reached generates
+        the rows of get_points() for which matches(points) is True.
+        :param node: the node at which to start.
+        :param may_reach: a function (axis, threshold, is_left) -> bool, saying whether the left (or right) side of a
+        split on that axis at that threshold could hold any matches.
+        :param matches: a function from an (m, d) array of points to a boolean array of length m.
+        :return: a generator of arrays of matching rows, one per leaf that has any.
+        """
+        to_visit = [node] if self._points is not None else []
+        while to_visit:
+            node = to_visit.pop()
+            axis = self._axes[node]
+            if axis == LEAF_AXIS:
+                start, end = self._starts[node], self._ends[node]
+                rows = np.flatnonzero(matches(self._leaf_points(start, end))) + start
+                if self._exact_points is not None and len(rows) > 0:
+                    rows = rows[matches(self._exact_points[rows])]
+                if len(rows) > 0:
+                    yield rows
+                continue
+            threshold = self._thresholds[node]
+            if self._right[node] != NO_CHILD and may_reach(axis, threshold, False):
+                to_visit.append(self._right[node])
+            if self._left[node] != NO_CHILD and may_reach(axis, threshold, True):
+                to_visit.append(self._left[node])
+
+    def _radius_matches(self, target: Tuple[float, ...], radius: float, node: int,
+                        metric: Optional[DistanceMetric]) -> Iterator[np.ndarray]:
+        center = np.asarray(target, dtype=float)
+        metric = EUCLIDEAN if metric is None else metric
+
+        def may_reach(axis: int, threshold: float, is_left: bool) -> bool:
+            # the side the target is on can always hold matches; the other only if the threshold is close enough.
+            if (center[axis] < threshold) == is_left:
+                return True
+            return metric.axis_lower_bound(axis, center[axis], threshold) <= radius
+
+        return self._leaf_matches(node, may_reach, lambda points: metric.distances(points, center) <= radius)
+
+    def _box_matches(self, low: Tuple[float, ...], high: Tuple[float, ...], node: int) -> Iterator[np.ndarray]:
+        low_array = np.asarray(low, dtype=float)
+        high_array = np.asarray(high, dtype=float)
+
+        def may_reach(axis: int, threshold: float, is_left: bool) -> bool:
+            return low_array[axis] <= threshold if is_left else high_array[axis] >= threshold
+
+        return self._leaf_matches(node, may_reach,
+                                  lambda points: np.all((points >= low_array) & (points <= high_array), axis=1))
+
+    def query_radius_rows(self,
+                          target: Tuple[float, ...],
+                          radius: float,
+                          node: int = 0,
+                          metric: Optional[DistanceMetric] = None) -> Iterator[int]:
+        """
+        :return: a generator of the rows of get_points() within radius of target (inclusive).
+        """
+        for rows in self._radius_matches(target, radius, node, metric):
+            yield from rows.tolist()
+
+    def count_radius(self,
+                     target: Tuple[float, ...],
+                     radius: float,
+                     node: int = 0,
+                     metric: Optional[DistanceMetric] = None) -> int:
+        return sum(len(rows) for rows in self._radius_matches(target, radius, node, metric))
+
+    def query_box_rows(self, low: Tuple[float, ...], high: Tuple[float, ...], node: int = 0) -> Iterator[int]:
+        """
+        :return: a generator of the rows of get_points() inside the box [low, high] (inclusive) on every axis.
+        """
+        for rows in self._box_matches(low, high, node):
+            yield from rows.tolist()
+
+    def count_box(self, low: Tuple[float, ...], high: Tuple[float, ...], node: int = 0) -> int:
+        return sum(len(rows) for rows in self._box_matches(low, high, node))
+
+    def query_radius(self,
+                     target: Tuple[float, ...],
+                     radius: float,
+                     metric: Optional[DistanceMetric] = None) -> Iterator[Tuple[float, ...]]:
+        for row in self.query_radius_rows(target, radius, metric=metric):
+            yield self._point_tuple(row)
+
+    def query_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> Iterator[Tuple[float, ...]]:
+        for row in self.query_box_rows(low, high):
+            yield self._point_tuple(row)
+
+    def save(self, path: str, metadata: Optional[Dict[str, object]] = None) -> None:
+        """
+        writes this tree to a snapshot file that load can later open without rebuilding. The format is versioned (see
+        SNAPSHOT_VERSION) and holds the header, the split arrays, the point array (in the tree's storage dtype) and, if
+        there are any, the payloads, the exact copy of the points, the storage's scales and offsets, and the metadata.
+        :param path: the file to write.
+        :param metadata: anything json can hold, to keep with the snapshot - such as the settings the tree was built
+        with, so that whoever loads it can tell whether it is still what they want. The loaded tree's get_metadata
+        returns it.
+        :return: None
+        """
+        if self._axes is None:
+            raise ValueError("Can't save a tree that hasn't been built.")
+        flags = SNAPSHOT_HAS_PAYLOADS if self.has_payloads() else 0
+        flags |= STORAGE_MODES.index(self._storage.get_mode()) << SNAPSHOT_STORAGE_SHIFT
+        sections = {"_scales": self._storage.get_scales(), "_offsets": self._storage.get_offsets(),
+                    "_metadata": None if not metadata else np.frombuffer(json.dumps(metadata).encode("utf-8"),
+                                                                         dtype=np.uint8)}
+        arrays = []
+        for name, dtype in SNAPSHOT_SECTIONS:
+            array = sections[name] if name in sections else getattr(self, name)
+            dtype = self._storage.get_dtype().newbyteorder("<") if name == "_points" else dtype
+            arrays.append(np.ascontiguousarray(np.empty(0) if array is None else array, dtype=dtype).reshape(-1))
+
+        position = SNAPSHOT_HEADER.size + SNAPSHOT_SECTION.size * len(SNAPSHOT_SECTIONS)
+        offsets = []
+        for array in arrays:
+            position += -position % SNAPSHOT_ALIGNMENT
+            offsets.append(position)
+            position += array.nbytes
+
+        with open(path, "wb") as snapshot_file:
+            snapshot_file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, flags, self._dimension,
+                                                     self._leaf_size, len(self), self.get_num_nodes()))
+            for offset, array in zip(offsets, arrays):
+                snapshot_file.write(SNAPSHOT_SECTION.pack(offset, len(array)))
+            for offset, array in zip(offsets, arrays):
+                snapshot_file.write(b"\x00" * (offset - snapshot_file.tell()))
+                snapshot_file.write(array.tobytes())
+
+    @staticmethod
+    def load(path: str) -> "FlatKDTree":
+        """
+        opens a snapshot written by save. The arrays are memory-mapped read-only rather than read, so even a very large
+        tree opens almost at once and is paged in from disk only as searches touch it, and several processes that load
+        the same file share one copy of it in the operating system's page cache.
+        :param path: the snapshot file to open.
+        :return: the tree, ready to search. Its arrays are read-only.
+        """
+        with open(path, "rb") as snapshot_file:
+            header = snapshot_file.read(SNAPSHOT_HEADER.size)
+            if len(header) < SNAPSHOT_HEADER.size or header[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a k-d tree snapshot.")
+            magic, version, flags, dimension, leaf_size, num_points, num_nodes = SNAPSHOT_HEADER.unpack(header)
+            if version not in (1, 2, SNAPSHOT_VERSION):
+                raise ValueError(f"{path} is snapshot version {version}, but only versions 1 to {SNAPSHOT_VERSION} "
+                                 f"are supported.")
+            section_names = SNAPSHOT_SECTIONS[:{1: SNAPSHOT_V1_SECTIONS, 2: SNAPSHOT_V2_SECTIONS}.get(
+                version, len(SNAPSHOT_SECTIONS))]
+            sections = [SNAPSHOT_SECTION.unpack(snapshot_file.read(SNAPSHOT_SECTION.size)) for _ in section_names]
+
+        storage_index = flags >> SNAPSHOT_STORAGE_SHIFT
+        if storage_index >= len(STORAGE_MODES):
+            raise ValueError(f"{path} is damaged: it has an unknown storage mode, number {storage_index}.")
+        storage_mode = STORAGE_MODES[storage_index]
+        arrays = {}
+        for (name, dtype), (offset, count) in zip(section_names, sections):
+            if name == "_points":
+                dtype = STORAGE_DTYPES[storage_mode].newbyteorder("<")  # always float64 in version 1 snapshots.
+            if count == 0:  # a file can't be memory-mapped with no length, so an empty section is an empty array.
+                arrays[name] = np.empty(0, dtype=dtype)
+                arrays[name].flags.writeable = False
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+        # which of the optional sections are really there is known from the header, not from their being empty: the
+        # payloads have a flag (their bytes are empty when every payload is ""); a built tree always has points, so a
+        # saved exact copy is never empty; and only the quantized storage modes have scales and offsets.
+        if version == 1 or len(arrays["_exact_points"]) == 0:
+            arrays["_exact_points"] = None
+        scales, offsets = arrays.pop("_scales", None), arrays.pop("_offsets", None)
+        metadata_bytes = arrays.pop("_metadata", None)
+        if not PointStorage.is_quantized_mode(storage_mode):
+            scales, offsets = None, None
+        tree = FlatKDTree(leaf_size=leaf_size, storage=storage_mode,
+                          exact_recheck=arrays["_exact_points"] is not None)
+        tree._dimension = dimension
+        tree._storage = PointStorage(storage_mode, scales, offsets)
+        if metadata_bytes is not None and len(metadata_bytes) > 0:
+            try:
+                tree._metadata = json.loads(metadata_bytes.tobytes().decode("utf-8"))
+            except ValueError as error:  # json's errors and UnicodeDecodeError are both ValueErrors.
+                raise ValueError(f"{path} is damaged: its metadata can't be read ({error}).")
+        for name, array in arrays.items():
+            setattr(tree, name, array)
+        tree._points = tree._points.reshape(num_points, dimension)
+        if tree._exact_points is not None:
+            tree._exact_points = tree._exact_points.reshape(num_points, dimension)
+        if not flags & SNAPSHOT_HAS_PAYLOADS:
+            tree._payload_offsets, tree._payload_bytes = None, None
+        if len(tree._axes) != num_nodes:
+            raise ValueError(f"{path} is damaged: expected {num_nodes} nodes, but found {len(tree._axes)}.")
+        return tree
+
+    def get_root(self) -> Optional["FlatNodeView"]:
+        """
+        :return: an AbstractNode view of the root of this tree, for code (such as TwoDVisualizer) that walks a tree of
+        nodes, or None if the tree has not been built.
+        """
+        if self._axes is None:
+            return None
+        return FlatNodeView(self, 0)
+
+
+class FlatNodeView(AbstractNode):
+    """
+    A lightweight AbstractNode that points at one node of a FlatKDTree, so that the flat tree can be walked with
+    get_left/get_right/get_value like a SplitterNode/PointNode tree. Views are created on demand and hold no data.
+    """
+
+    def __init__(self, tree: FlatKDTree, node: int):
+        self._tree = tree
+        self._node = node
+
+    def get_node_index(self) -> int:
+        return self._node
+
+    def is_a_leaf(self) -> bool:
+        return self._tree.is_leaf(self._node)
+
+    def get_axis(self) -> int:
+        return self._tree.get_axis(self._node)
+
+    def get_threshold(self) -> float:
+        return self._tree.get_threshold(self._node)
+
+    def get_dimension(self) -> int:
+        return self._tree.get_dimension()
+
+    def threshold_bound(self, target: Tuple[float, ...], metric: Optional[DistanceMetric] = None) -> float:
+        """
+        :return: the shortest distance there could be from the target to any point on the other side of this node's
+        threshold from it, as in SplitterNode.threshold_bound.
+        """
+        if metric is None:
+            return abs(target[self.get_axis()] - self.get_threshold())
+        return metric.axis_lower_bound(self.get_axis(), target[self.get_axis()], self.get_threshold())
+
+    def get_left(self) -> Optional["AbstractNode"]:
+        if self.is_a_leaf() or self._tree.get_left_index(self._node) == NO_CHILD:
+            return None
+        return FlatNodeView(self._tree, self._tree.get_left_index(self._node))
+
+    def get_right(self) -> Optional["AbstractNode"]:
+        if self.is_a_leaf() or self._tree.get_right_index(self._node) == NO_CHILD:
+            return None
+        return FlatNodeView(self._tree, self._tree.get_right_index(self._node))
+
+    def get_values(self) -> List[Tuple[float, ...]]:
+        """
+        :return: all the points held in this node's subtree, as tuples of floats.
+        """
+        start, end = self._tree.get_node_range(self._node)
+        return [tuple(self._tree.get_point(row).tolist()) for row in range(start, end)]
+
+    def get_value(self) -> Optional[Tuple[float, ...]]:
+        """
+        :return: the point held by this node, if it is a leaf holding exactly one point; otherwise None.
+        """
+        if not self.is_a_leaf():
+            return None
+        values = self.get_values()
+        return values[0] if len(values) == 1 else None
+
+    def recursive_to_string(self, depth: int = 0) -> str:
+        """
+        describes this subtree in order, like SplitterNode.recursive_to_string - and, like it, walks the subtree with an
+        explicit stack, so it works for trees of any depth.
+        """
+        lines: List[str] = []
+        # entries are (node, depth, False) before the node's left subtree is listed, and (node, depth, True) after it.
+        to_visit: List[Tuple[FlatNodeView, int, bool]] = [(self, depth, False)]
+        while to_visit:
+            node, node_depth, left_done = to_visit.pop()
+            if node.is_a_leaf():
+                lines.extend("\t" * node_depth + str(value) + "\n" for value in node.get_values())
+            elif left_done:
+                lines.append("\t" * node_depth + f"axis: {node.get_axis()} | threshold: {node.get_threshold()}\n")
+            else:
+                right, left = node.get_right(), node.get_left()
+                if right is not None:
+                    to_visit.append((right, node_depth + 1, False))
+                to_visit.append((node, node_depth, True))
+                if left is not None:
+                    to_visit.append((left, node_depth + 1, False))
+        return "".join(lines)
+
+    def find_nearest(self,
+                     target: Tuple[float, ...],
+                     best_value_so_far: Optional[Tuple[float, ...]],
+                     best_distance_so_far: float,
+                     visualizer=None,
+                     metric: Optional[DistanceMetric] = None,
+                     stats: Optional[SearchStats] = None) -> Tuple[Optional[Tuple[float, ...]], Optional[float]]:
+        """
+        searches this node's subtree of the flat tree, with the same contract as SplitterNode.find_nearest. The
+        visualizer is not used; the flat search has no intermediate steps to show.
+        :param target: a data point for which we are searching for the nearest neighbor
+        :param best_value_so_far: the closest datum found before this call, or None.
+        :param best_distance_so_far: the distance to beat.
+        :param visualizer: not used.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :param stats: if not None, the work done by this search is added to it.
+        :return: (closest value, shortest distance) if we can improve on best_distance_so_far, or (None, None).
+        """
+        row, distance = self._tree.find_nearest_row(target, node=self._node, metric=metric, stats=stats)
+        if row >= 0 and distance < best_distance_so_far:
+            return tuple(self._tree.get_point(row).tolist()), distance
+        return None, None
+
+    def gather_k_nearest(self,
+                         target: Tuple[float, ...],
+                         k: int,
+                         heap: List[Tuple[float, Tuple[float, ...]]],
+                         metric: Optional[DistanceMetric] = None,
+                         stats: Optional[SearchStats] = None) -> None:
+        for row, distance in self._tree.find_k_nearest_rows(target, k, node=self._node, metric=metric, stats=stats):
+            if distance >= self.kth_best_distance(k, heap):
+                break
+            self.offer_to_heap(tuple(self._tree.get_point(row).tolist()), distance, k, heap)
+
+    def query_radius(self,
+                     target: Tuple[float, ...],
+                     radius: float,
+                     metric: Optional[DistanceMetric] = None) -> Iterator[Tuple[float, ...]]:
+        for row in self._tree.query_radius_rows(target, radius, node=self._node, metric=metric):
+            yield tuple(self._tree.get_point(row).tolist())
+
+    def count_radius(self, target: Tuple[float, ...], radius: float, metric: Optional[DistanceMetric] = None) -> int:
+        return self._tree.count_radius(target, radius, node=self._node, metric=metric)
+
+    def query_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> Iterator[Tuple[float, ...]]:
+        for row in self._tree.query_box_rows(low, high, node=self._node):
+            yield tuple(self._tree.get_point(row).tolist())
+
+    def count_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> int:
+        return self._tree.count_box(low, high, node=self._node)
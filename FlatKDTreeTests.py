@@ -0,0 +1,271 @@
+import math
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from FlatKDTreeFile import FlatKDTree, LEAF_AXIS, NO_CHILD
+from PointStorageFile import STORAGE_DTYPES, STORAGE_MODES, STORAGE_FLOAT64, STORAGE_FLOAT32, STORAGE_UINT16, \
+    STORAGE_UINT8
+from SearchStatsFile import SearchStats
+from SplitterNodeFile import SplitterNode
+
+
+class FlatKDTreeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(12)
+        self.val_set_A = {(29.0, 27.0), (70.0, 74.0), (16.0, 93.0), (30.0, 61.0), (47.0, 0.0), (38.0, 2.0),
+                          (84.0, 54.0), (1.0, 96.0), (27.0, 25.0)}
+        self.val_set_C = {tuple(float(random.randrange(0, 100)) for _ in range(4)) for _ in range(300)}
+        self.targets = [tuple(random.uniform(0, 100) for _ in range(4)) for _ in range(50)]
+
+    def assertAlmostEqualList(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for e, a in zip(expected, actual):
+            self.assertAlmostEqual(e, a)
+
+    def brute_force_distance(self, data, target):
+        return min(math.dist(datum, target) for datum in data)
+
+    def test_matches_splitter_node(self):
+        root = SplitterNode(0)
+        root.build_subtree(self.val_set_C)
+        for leaf_size in (1, 8):
+            flat = FlatKDTree(leaf_size=leaf_size)
+            flat.build_tree(self.val_set_C)
+            self.assertEqual(len(self.val_set_C), len(flat))
+            for target in self.targets:
+                flat_value, flat_dist = flat.find_nearest(target)
+                tree_value, tree_dist = root.find_nearest(target, None, float('inf'))
+                self.assertIn(flat_value, self.val_set_C)
+                self.assertAlmostEqual(tree_dist, flat_dist)
+                self.assertAlmostEqual(self.brute_force_distance(self.val_set_C, target), flat_dist)
+
+    def test_find_k_nearest(self):
+        flat = FlatKDTree(leaf_size=4)
+        flat.build_tree(self.val_set_C)
+        for target in self.targets[:10]:
+            expected = sorted(math.dist(target, datum) for datum in self.val_set_C)[:7]
+            self.assertAlmostEqualList(expected, [distance for _, distance in flat.find_k_nearest(target, 7)])
+            view_results = flat.get_root().find_k_nearest(target, 7)
+            self.assertAlmostEqualList(expected, [distance for _, distance in view_results])
+
+    def test_query_radius_and_box(self):
+        flat = FlatKDTree(leaf_size=4)
+        flat.build_tree(self.val_set_C)
+        target, low, high = self.targets[0], (20.0, 0.0, 40.0, 10.0), (60.0, 50.0, 90.0, 100.0)
+        expected_radius = {datum for datum in self.val_set_C if math.dist(target, datum) <= 30.0}
+        expected_box = {datum for datum in self.val_set_C
+                        if all(lo <= v <= hi for lo, v, hi in zip(low, datum, high))}
+        for searcher in (flat, flat.get_root()):
+            self.assertEqual(expected_radius, set(searcher.query_radius(target, 30.0)))
+            self.assertEqual(len(expected_radius), searcher.count_radius(target, 30.0))
+            self.assertEqual(expected_box, set(searcher.query_box(low, high)))
+            self.assertEqual(len(expected_box), searcher.count_box(low, high))
+
+    def test_find_nearest_batch(self):
+        points = np.array(sorted(self.val_set_C))
+        targets = np.array(self.targets)
+        brute_force = np.sqrt(((targets[:, np.newaxis, :] - points[np.newaxis, :, :]) ** 2).sum(axis=2)).min(axis=1)
+        for leaf_size in (1, 8):
+            flat = FlatKDTree(leaf_size=leaf_size)
+            flat.build_from_array(points)
+            rows, distances = flat.find_nearest_batch(targets)
+            np.testing.assert_allclose(brute_force, distances)
+            np.testing.assert_allclose(distances, np.linalg.norm(flat.get_points()[rows] - targets, axis=1))
+
+    def test_find_nearest_batch_matches_single_searches(self):
+        # enough targets, and clustered enough data, that many of them cross thresholds into other leaves.
+        rng = np.random.default_rng(41)
+        points = np.concatenate((rng.normal(0, 1, (3000, 3)), rng.normal(5, 0.1, (1000, 3))))
+        targets = np.concatenate((rng.normal(0, 2, (1500, 3)), rng.normal(5, 0.5, (500, 3))))
+        for leaf_size in (1, 5, 32):
+            flat = FlatKDTree(leaf_size=leaf_size)
+            flat.build_from_array(points)
+            rows, distances = flat.find_nearest_batch(targets)
+            expected = np.array([flat.find_nearest_row(target)[1] for target in targets])
+            np.testing.assert_allclose(expected, distances)
+            np.testing.assert_allclose(distances, np.linalg.norm(flat.get_points()[rows] - targets, axis=1))
+
+    def test_deeper_than_recursion_limit(self):
+        # the builds split at medians, so they never make a deep tree; this lays out the arrays of a chain of splitters
+        # by hand instead, each with the point i in a leaf on its left and the next splitter on its right.
+        depth = 3 * sys.getrecursionlimit()
+        flat = FlatKDTree(leaf_size=1)
+        flat.build_from_array(np.arange(depth + 1, dtype=float).reshape(-1, 1))
+        splitters, leaves = np.arange(0, 2 * depth, 2), np.arange(1, 2 * depth + 1, 2)
+        flat._points = flat._points[np.argsort(flat._indices)]
+        flat._indices = np.arange(depth + 1)
+        flat._axes = np.full(2 * depth + 1, LEAF_AXIS, dtype=np.int32)
+        flat._axes[splitters] = 0
+        flat._thresholds = np.zeros(2 * depth + 1)
+        flat._thresholds[splitters] = np.arange(depth) + 0.5
+        flat._left = np.full(2 * depth + 1, NO_CHILD, dtype=np.int64)
+        flat._left[splitters] = leaves
+        flat._right = np.full(2 * depth + 1, NO_CHILD, dtype=np.int64)
+        flat._right[splitters] = splitters + 2
+        flat._starts = np.zeros(2 * depth + 1, dtype=np.int64)
+        flat._starts[splitters] = np.arange(depth)
+        flat._starts[leaves] = np.arange(depth)
+        flat._starts[-1] = depth
+        flat._ends = np.full(2 * depth + 1, depth + 1, dtype=np.int64)
+        flat._ends[leaves] = np.arange(depth) + 1
+
+        self.assertEqual((1234, 0.25), flat.find_nearest_row((1234.25,)))
+        self.assertEqual([1234, 1235, 1233], [row for row, _ in flat.find_k_nearest_rows((1234.25,), 3)])
+        self.assertEqual((depth, 0.0), flat.find_nearest_row((float(depth),)))
+        stats = SearchStats()
+        flat.find_nearest_row((1234.25,), stats=stats)
+        self.assertEqual(1234 + 2, stats.nodes_visited)  # splitters 0 to 1234, then the leaf holding 1234.
+        rows, distances = flat.find_nearest_batch(np.array([[1234.25], [-5.0], [depth + 5.0]]))
+        self.assertEqual([1234, 0, depth], rows.tolist())
+        self.assertEqual(depth, str(flat.get_root()).count("axis"))
+        self.assertEqual({1234, 1235}, set(flat.query_radius_rows((1234.25,), 0.75)))
+
+    def test_save_and_load(self):
+        points = np.array(sorted(self.val_set_C))
+        flat = FlatKDTree(leaf_size=4)
+        flat.build_from_array(points, payloads=[f"day {row} \u00b0F" for row in range(len(points))])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tree.kdt")
+            flat.save(path)
+            loaded = FlatKDTree.load(path)
+            self.assertEqual(len(flat), len(loaded))
+            self.assertEqual(4, loaded.get_leaf_size())
+            for target in self.targets:
+                row, distance = loaded.find_nearest_row(target)
+                self.assertEqual(flat.find_nearest_row(target), (row, distance))
+                self.assertEqual(f"day {loaded.get_original_index(row)} \u00b0F", loaded.get_payload(row))
+            del loaded
+
+            with open(path, "r+b") as snapshot_file:
+                snapshot_file.seek(8)
+                snapshot_file.write(b"\x63\x00\x00\x00")  # an unsupported version number.
+            with self.assertRaises(ValueError):
+                FlatKDTree.load(path)
+
+    def test_save_and_load_metadata(self):
+        points = np.array(sorted(self.val_set_C))
+        flat = FlatKDTree(leaf_size=4)
+        flat.build_from_array(points)
+        metadata = {"leaf_size": 4, "columns": [0, 1], "periods": [None, 366.0], "note": "\u00b0F"}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tree.kdt")
+            flat.save(path, metadata=metadata)
+            loaded = FlatKDTree.load(path)
+            self.assertEqual(metadata, loaded.get_metadata())
+            self.assertEqual(flat.find_nearest_row(self.targets[0]), loaded.find_nearest_row(self.targets[0]))
+            del loaded
+            flat.save(path)
+            self.assertEqual({}, FlatKDTree.load(path).get_metadata())
+        self.assertEqual({}, flat.get_metadata())
+
+    def test_save_and_load_empty_payloads(self):
+        # every payload is "", so the payload bytes section is empty, but the tree still has payloads.
+        points = np.array(sorted(self.val_set_C))
+        flat = FlatKDTree(leaf_size=4)
+        flat.build_from_array(points, payloads=[""] * len(points))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tree.kdt")
+            flat.save(path)
+            loaded = FlatKDTree.load(path)
+            self.assertTrue(loaded.has_payloads())
+            self.assertFalse(loaded.has_exact_points())
+            self.assertEqual("", loaded.get_payload(0))
+            self.assertEqual(flat.get_memory_usage(), loaded.get_memory_usage())
+            del loaded
+
+    def test_compact_storage(self):
+        points = np.array(sorted(self.val_set_C))
+        plain = FlatKDTree(leaf_size=4)
+        plain.build_from_array(points)
+        for mode in STORAGE_MODES:
+            compact = FlatKDTree(leaf_size=4, storage=mode)
+            compact.build_from_array(points)
+            decoded = compact.get_points()
+            self.assertEqual(STORAGE_DTYPES[mode], compact.get_stored_points().dtype)
+            self.assertLessEqual(compact.get_memory_usage()["points"], plain.get_memory_usage()["points"])
+            # searches are exact for the points as stored, which are within the storage's error of the originals.
+            for target in self.targets:
+                expected = np.sort(np.linalg.norm(decoded - target, axis=1))
+                self.assertAlmostEqual(expected[0], compact.find_nearest_row(target)[1])
+                self.assertAlmostEqualList(expected[:5], [dist for _, dist in compact.find_k_nearest_rows(target, 5)])
+            rows, distances = compact.find_nearest_batch(np.array(self.targets))
+            np.testing.assert_allclose(distances, np.linalg.norm(decoded[rows] - self.targets, axis=1))
+            self.assertTrue(np.all(np.abs(decoded[0] - points[compact.get_original_index(0)]) <=
+                                   compact.get_storage().get_max_error(points) + 1e-12))
+
+    def test_exact_recheck(self):
+        points = np.array(sorted(self.val_set_C))
+        for mode in STORAGE_MODES[1:]:
+            compact = FlatKDTree(leaf_size=4, storage=mode, exact_recheck=True)
+            compact.build_from_array(points)
+            self.assertTrue(compact.has_exact_points())
+            self.assertEqual(points.nbytes, compact.get_memory_usage()["exact_points"])
+            np.testing.assert_array_equal(points[compact.get_original_index(7)], compact.get_point(7))
+            for target in self.targets:
+                expected = np.sort(np.linalg.norm(points - target, axis=1))
+                self.assertAlmostEqualList(expected[:3], [dist for _, dist in compact.find_k_nearest_rows(target, 3)])
+                row, distance = compact.find_nearest_row(target)
+                self.assertAlmostEqual(expected[0], distance)
+                self.assertAlmostEqual(distance, math.dist(target, compact.get_point(row)))
+                # range queries never report a point that only the compact values put in range.
+                within = set(compact.query_radius(target, 30.0))
+                self.assertTrue(all(math.dist(target, point) <= 30.0 for point in within))
+                self.assertLessEqual(len(within), len([d for d in expected if d <= 30.0]))
+            rows, distances = compact.find_nearest_batch(np.array(self.targets))
+            np.testing.assert_allclose(np.linalg.norm(points[:, np.newaxis] - self.targets, axis=2).min(axis=0),
+                                       distances)
+        self.assertFalse(FlatKDTree(storage=STORAGE_FLOAT64, exact_recheck=True).has_exact_points())
+        with self.assertRaises(ValueError):
+            FlatKDTree(storage="int4")
+
+    def test_save_and_load_compact(self):
+        points = np.array(sorted(self.val_set_C))
+        with tempfile.TemporaryDirectory() as directory:
+            for mode, exact_recheck in ((STORAGE_UINT8, False), (STORAGE_UINT16, True), (STORAGE_FLOAT32, True)):
+                flat = FlatKDTree(leaf_size=4, storage=mode, exact_recheck=exact_recheck)
+                flat.build_from_array(points, payloads=[f"day {row}" for row in range(len(points))])
+                path = os.path.join(directory, f"{mode}.kdt")
+                flat.save(path)
+                loaded = FlatKDTree.load(path)
+                self.assertEqual(mode, loaded.get_storage().get_mode())
+                self.assertEqual(exact_recheck, loaded.has_exact_points())
+                self.assertEqual(flat.get_memory_usage(), loaded.get_memory_usage())
+                for target in self.targets:
+                    self.assertEqual(flat.find_k_nearest_rows(target, 4), loaded.find_k_nearest_rows(target, 4))
+                self.assertEqual(flat.get_payload(3), loaded.get_payload(3))
+                del loaded
+
+    def test_node_view_walks_like_object_tree(self):
+        flat = FlatKDTree()
+        flat.build_tree(self.val_set_A)
+        root = flat.get_root()
+        found = set()
+        to_visit = [root]
+        while to_visit:
+            node = to_visit.pop()
+            if node.is_a_leaf():
+                found.add(node.get_value())
+            else:
+                self.assertIsNone(node.get_value())
+                to_visit.extend(child for child in (node.get_left(), node.get_right()) if child is not None)
+        self.assertEqual(self.val_set_A, found)
+        point_lines = [line for line in str(root).split("\n") if line.strip().startswith("(")]
+        self.assertEqual(len(self.val_set_A), len(point_lines))
+
+        value, dist = root.find_nearest((44.0, 66.0), None, float('inf'))
+        self.assertEqual((30.0, 61.0), value)
+        value, dist = root.find_nearest((44.0, 66.0), (30.0, 61.0), dist)
+        self.assertIsNone(value)
+        value, dist = root.find_nearest_approximate((44.0, 66.0))
+        self.assertEqual((30.0, 61.0), value)
+        self.assertAlmostEqual(math.dist((30.0, 61.0), (44.0, 66.0)), dist)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,431 @@
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Set, Tuple, Optional
+
+import numpy as np
+
+from DistanceMetricsFile import DistanceMetric, EUCLIDEAN
+from DualTreeFile import BoxedTree, all_nearest_neighbors
+from FlatKDTreeFile import FlatKDTree
+from PointStorageFile import STORAGE_FLOAT64, STORAGE_MODES
+from SearchStatsFile import SearchStats, measure_tree
+from SplitPolicyFile import SplitPolicy, MedianSplit, SlidingMidpointSplit, AXIS_ROUND_ROBIN, AXIS_WIDEST_SPREAD, \
+    AXIS_HIGHEST_VARIANCE, EXACT_MEDIAN
+from SplitterNodeFile import SplitterNode
+from WeatherRunnerFile import load_data, WEATHER_METRIC
+
+WEATHER_FILE = "Weather Data 2014-2024.tsv"
+LEAF_SIZES = [1, 2, 4, 8, 16, 32, 64]
+NUM_SYNTHETIC_POINTS = 20000
+SYNTHETIC_DIMENSIONS = [2, 4, 8]
+NUM_QUERIES = 500
+APPROXIMATE_LEAF_SIZE = 8
+# (eps, max_leaves) pairs to try with find_nearest_approximate; (0.0, None) is the exact search, for comparison.
+APPROXIMATE_SETTINGS = [(0.0, None), (0.5, None), (1.0, None), (2.0, None), (0.0, 64), (0.0, 16), (0.0, 4), (0.0, 1)]
+POLICY_LEAF_SIZES = [1, 8]
+DUPLICATE_FRACTION = 0.9  # the share of make_duplicate_heavy_data's points that are 0 on axis 0, like the PRCP column.
+# (name, policy) pairs to compare in benchmark_split_policies; None is build_subtree's default.
+SPLIT_POLICIES: List[Tuple[str, Optional[SplitPolicy]]] = [
+    ("default", None),
+    ("exact", MedianSplit(sample_size=0)),
+    ("sample 200", MedianSplit(sample_size=200)),
+    ("med spread", MedianSplit(axis_rule=AXIS_WIDEST_SPREAD)),
+    ("med var", MedianSplit(axis_rule=AXIS_HIGHEST_VARIANCE)),
+    ("mid rr", SlidingMidpointSplit(axis_rule=AXIS_ROUND_ROBIN)),
+    ("midpoint", SlidingMidpointSplit())]
+BUILD_SIZES = [10_000, 100_000]
+BUILD_LEAF_SIZE = 8
+# (name, function(root, data, leaf_size)) pairs to compare in benchmark_builds.
+BUILD_METHODS = [
+    ("set", lambda root, data, leaf_size: root.build_subtree(data, leaf_size=leaf_size)),
+    ("set exact", lambda root, data, leaf_size: root.build_subtree(data, leaf_size=leaf_size, policy=EXACT_MEDIAN)),
+    ("array", lambda root, data, leaf_size: root.build_subtree_from_array(list(data), leaf_size=leaf_size)),
+    ("presorted", lambda root, data, leaf_size: root.build_subtree_presorted(data, leaf_size=leaf_size))]
+DUAL_TREE_POINTS = 10000  # the size of each of the two data sets matched up by benchmark_dual_tree.
+DUAL_TREE_LEAF_SIZE = 8
+DUAL_TREE_BLOCK_SIZES = [1, 16, 64, 256]
+STORAGE_LEAF_SIZE = 8
+STORAGE_K = 5  # benchmark_storage measures the recall of searches for this many neighbors.
+
+
+def make_synthetic_array(num_points: int, dimension: int) -> np.ndarray:
+    """
+    creates num_points rows of dimension random floats from 0-100, like K_D_Trees_RunnerFile.build_dataset, in one numpy
+    call, so that even 10^7 points take only moments. numpy is seeded from the random module, so random.seed still makes
+    the data repeatable.
+    :param num_points: how many points to make
+    :param dimension: how many floats in each point
+    :return: an (num_points, dimension) array of the points.
+    """
+    return np.random.default_rng(random.getrandbits(64)).uniform(0, 100, size=(num_points, dimension))
+
+
+def make_synthetic_data(num_points: int, dimension: int) -> Set[Tuple[float, ...]]:
+    """
+    creates a set of num_points Tuples of dimension random floats from 0-100, with make_synthetic_array.
+    :param num_points: how many points to make
+    :param dimension: how many floats in each point
+    :return: the set of points.
+    """
+    result: Set[Tuple[float, ...]] = set(())
+    while len(result) < num_points:  # in case any points came out the same.
+        result.update(map(tuple, make_synthetic_array(num_points - len(result), dimension).tolist()))
+    return result
+
+
+def make_duplicate_heavy_data(num_points: int,
+                              dimension: int,
+                              duplicate_fraction: float = DUPLICATE_FRACTION) -> Set[Tuple[float, ...]]:
+    """
+    creates data full of repeated values, to stress the split policies: axis 0 is 0 for duplicate_fraction of the
+    points (and otherwise uniform from 0-100), axis 1 takes one of only five values, and any other axes are uniform but
+    heavily skewed towards 0.
+    :param num_points: how many points to make
+    :param dimension: how many floats in each point; at least 3, so that the points can all be different.
+    :param duplicate_fraction: the fraction of points that are 0 on axis 0.
+    :return: the set of points.
+    """
+    result: Set[Tuple[float, ...]] = set(())
+    while len(result) < num_points:
+        first = 0.0 if random.random() < duplicate_fraction else random.uniform(0, 100)
+        second = float(random.randrange(5))
+        result.add((first, second) + tuple(100 * random.random() ** 4 for _ in range(dimension - 2)))
+    return result
+
+
+def load_weather_data(filename: str = WEATHER_FILE) -> Set[Tuple[float, ...]]:
+    return set(load_data(filename).keys())
+
+
+def make_target_array(points: np.ndarray, num_targets: int) -> np.ndarray:
+    """
+    creates query targets spread over the same range as the points on every axis, seeded from the random module like
+    make_synthetic_array.
+    :param points: an (n, d) array of the points whose bounding box we should sample
+    :param num_targets: how many targets to make
+    :return: an (num_targets, d) array of targets.
+    """
+    low, high = points.min(axis=0), points.max(axis=0)
+    return np.random.default_rng(random.getrandbits(64)).uniform(low, high, size=(num_targets, points.shape[1]))
+
+
+def make_targets(data: Set[Tuple[float, ...]], num_targets: int) -> List[Tuple[float, ...]]:
+    """
+    creates query targets spread over the same range as the data on every axis, with make_target_array.
+    :param data: the data whose bounding box we should sample
+    :param num_targets: how many targets to make
+    :return: a list of targets.
+    """
+    return list(map(tuple, make_target_array(np.array(list(data), dtype=float), num_targets).tolist()))
+
+
+def benchmark_leaf_sizes(data: Set[Tuple[float, ...]],
+                         leaf_sizes: List[int],
+                         targets: List[Tuple[float, ...]],
+                         bounding_boxes: bool = False) -> List[Dict[str, float]]:
+    """
+    builds a tree over the data for each leaf size and times the build and a run of nearest-neighbor queries.
+    :param data: the data to build trees from
+    :param leaf_sizes: the values of build_subtree's leaf_size to try
+    :param targets: the queries to time on each tree
+    :param bounding_boxes: whether the trees keep a bounding box per SplitterNode to prune with.
+    :return: a list with one dictionary of measurements per leaf size.
+    """
+    results = []
+    for leaf_size in leaf_sizes:
+        root = SplitterNode(0)
+        start = time.perf_counter()
+        root.build_subtree(data, leaf_size=leaf_size, bounding_boxes=bounding_boxes)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for target in targets:
+            root.find_nearest(target, None, float('inf'))
+        query_seconds = time.perf_counter() - start
+
+        stats = SearchStats()  # counted in a separate, untimed pass, so the counting doesn't affect the timing.
+        for target in targets:
+            root.find_nearest(target, None, float('inf'), stats=stats)
+
+        shape = measure_tree(root)
+        results.append({"leaf_size": leaf_size,
+                        "build_ms": 1000 * build_seconds,
+                        "query_us": 1e6 * query_seconds / len(targets),
+                        "visited": stats.nodes_visited / len(targets),
+                        "scanned": stats.leaves_scanned / len(targets),
+                        "distances": stats.distance_computations / len(targets),
+                        "nodes": shape.get_num_nodes(),
+                        "leaves": shape.get_num_leaves(),
+                        "depth": shape.get_max_depth()})
+    return results
+
+
+def benchmark_approximate(data: Set[Tuple[float, ...]],
+                          settings: List[Tuple[float, Optional[int]]],
+                          targets: List[Tuple[float, ...]],
+                          leaf_size: int = APPROXIMATE_LEAF_SIZE) -> List[Dict[str, float]]:
+    """
+    times find_nearest_approximate with each (eps, max_leaves) setting, and measures how often it still finds the true
+    nearest neighbor (its recall), and how much farther away, on average, its answers are than the true ones.
+    :param data: the data to build the tree from
+    :param settings: the (eps, max_leaves) pairs to try
+    :param targets: the queries to time
+    :param leaf_size: the leaf size of the tree to search
+    :return: a list with one dictionary of measurements per setting.
+    """
+    root = SplitterNode(0)
+    root.build_subtree(data, leaf_size=leaf_size)
+    exact_distances = [root.find_nearest(target, None, float('inf'))[1] for target in targets]
+
+    results = []
+    for eps, max_leaves in settings:
+        start = time.perf_counter()
+        found = [root.find_nearest_approximate(target, eps=eps, max_leaves=max_leaves)[1] for target in targets]
+        query_seconds = time.perf_counter() - start
+        num_exact = sum(1 for distance, exact in zip(found, exact_distances) if distance <= exact)
+        ratios = [distance / exact for distance, exact in zip(found, exact_distances) if exact > 0]
+        results.append({"eps": eps,
+                        "max_leaves": "-" if max_leaves is None else max_leaves,
+                        "query_us": 1e6 * query_seconds / len(targets),
+                        "recall_%": 100 * num_exact / len(targets),
+                        "excess_%": 100 * (sum(ratios) / len(ratios) - 1) if ratios else 0.0})
+    return results
+
+
+def benchmark_split_policies(data: Set[Tuple[float, ...]],
+                             policies: List[Tuple[str, Optional[SplitPolicy]]],
+                             targets: List[Tuple[float, ...]],
+                             leaf_sizes: List[int]) -> List[Dict[str, float]]:
+    """
+    builds a tree over the data with each split policy and leaf size, and measures its depth and the cost of a run of
+    nearest-neighbor queries.
+    :param data: the data to build trees from
+    :param policies: the (name, policy) pairs to try
+    :param targets: the queries to time on each tree
+    :param leaf_sizes: the leaf sizes to try with each policy
+    :return: a list with one dictionary of measurements per policy and leaf size.
+    """
+    results = []
+    for name, policy in policies:
+        for leaf_size in leaf_sizes:
+            root = SplitterNode(0)
+            start = time.perf_counter()
+            root.build_subtree(data, leaf_size=leaf_size, policy=policy)
+            build_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for target in targets:
+                root.find_nearest(target, None, float('inf'))
+            query_seconds = time.perf_counter() - start
+
+            stats = SearchStats()
+            for target in targets:
+                root.find_nearest(target, None, float('inf'), stats=stats)
+
+            shape = measure_tree(root)
+            results.append({"policy": name,
+                            "leaf_size": leaf_size,
+                            "build_ms": 1000 * build_seconds,
+                            "query_us": 1e6 * query_seconds / len(targets),
+                            "visited": stats.nodes_visited / len(targets),
+                            "distances": stats.distance_computations / len(targets),
+                            "depth": shape.get_max_depth(),
+                            "mean_depth": shape.get_mean_leaf_depth()})
+    return results
+
+
+def benchmark_builds(data: Set[Tuple[float, ...]],
+                     methods: List[Tuple[str, Callable[[SplitterNode, Set[Tuple[float, ...]], int], None]]],
+                     targets: List[Tuple[float, ...]],
+                     leaf_size: int = BUILD_LEAF_SIZE) -> List[Dict[str, float]]:
+    """
+    builds a tree over the data with each build method, timing it, and measures the tree's shape and the cost of a run
+    of nearest-neighbor queries on it.
+    :param data: the data to build trees from
+    :param methods: the (name, function(root, data, leaf_size)) pairs to try; each builds a tree below root.
+    :param targets: the queries to time on each tree
+    :param leaf_size: the leaf size of every tree
+    :return: a list with one dictionary of measurements per method.
+    """
+    results = []
+    for name, build in methods:
+        root = SplitterNode(0)
+        start = time.perf_counter()
+        build(root, data, leaf_size)
+        build_seconds = time.perf_counter() - start
+
+        stats = SearchStats()
+        start = time.perf_counter()
+        for target in targets:
+            root.find_nearest(target, None, float('inf'), stats=stats)
+        query_seconds = time.perf_counter() - start
+
+        shape = measure_tree(root)
+        results.append({"method": name,
+                        "build_ms": 1000 * build_seconds,
+                        "query_us": 1e6 * query_seconds / len(targets),
+                        "distances": stats.distance_computations / len(targets),
+                        "depth": shape.get_max_depth(),
+                        "mean_depth": shape.get_mean_leaf_depth(),
+                        "imbalance": shape.get_max_imbalance()})
+    return results
+
+
+def benchmark_dual_tree(query_data: Set[Tuple[float, ...]],
+                        reference_data: Set[Tuple[float, ...]],
+                        block_sizes: List[int],
+                        leaf_size: int = DUAL_TREE_LEAF_SIZE) -> List[Dict[str, float]]:
+    """
+    finds the nearest reference datum to every query datum, first with one find_nearest per query datum, then with
+    all_nearest_neighbors at each block size, and measures the time and work each takes.
+    :param query_data: the data to find neighbors for
+    :param reference_data: the data to find them among
+    :param block_sizes: the values of BoxedTree's block_size to try
+    :param leaf_size: the leaf size of both trees
+    :return: a list with one dictionary of measurements for the single-tree searches, then one per block size.
+    """
+    query_root, reference_root = SplitterNode(0), SplitterNode(0)
+    query_root.build_subtree(query_data, leaf_size=leaf_size)
+    reference_root.build_subtree(reference_data, leaf_size=leaf_size)
+
+    stats = SearchStats()
+    start = time.perf_counter()
+    for target in query_data:
+        reference_root.find_nearest(target, None, float('inf'), stats=stats)
+    results = [{"method": "single",
+                "block_size": "-",
+                "setup_ms": 0.0,
+                "search_ms": 1000 * (time.perf_counter() - start),
+                "visited": stats.nodes_visited,
+                "distances": stats.distance_computations}]
+
+    for block_size in block_sizes:
+        start = time.perf_counter()
+        queries, references = BoxedTree(query_root, block_size), BoxedTree(reference_root, block_size)
+        setup_seconds = time.perf_counter() - start
+        stats = SearchStats()
+        start = time.perf_counter()
+        all_nearest_neighbors(queries, references, stats=stats)
+        results.append({"method": "dual",
+                        "block_size": block_size,
+                        "setup_ms": 1000 * setup_seconds,
+                        "search_ms": 1000 * (time.perf_counter() - start),
+                        "visited": stats.nodes_visited,
+                        "distances": stats.distance_computations})
+    return results
+
+
+def benchmark_storage(data: Set[Tuple[float, ...]],
+                      targets: List[Tuple[float, ...]],
+                      k: int = STORAGE_K,
+                      metric: Optional[DistanceMetric] = None,
+                      leaf_size: int = STORAGE_LEAF_SIZE) -> List[Dict[str, float]]:
+    """
+    builds a FlatKDTree over the data in each storage mode, with and without exact re-checking, and measures the memory
+    its points take (stored, and in the exact copy kept for re-checking, which can stay on disk once the tree has been
+    saved and loaded), the time a k-nearest search takes, and the recall of those searches: the share of the neighbors
+    found that are really among the k nearest, by brute force. The first row gives, for comparison, the memory each
+    point takes as a tuple of Python floats, as the object tree holds it.
+    :param data: the data to build trees from
+    :param targets: the queries to run on each tree
+    :param k: how many neighbors each query looks for
+    :param metric: how to measure distance; None means Euclidean distance.
+    :param leaf_size: the leaf size of every tree
+    :return: a list with one dictionary of measurements per kind of storage.
+    """
+    points = np.array(sorted(data), dtype=float)
+    exact_metric = EUCLIDEAN if metric is None else metric
+    # the distance to each target's k-th nearest point: anything found no further away than that is a true neighbor.
+    kth_distances = [np.partition(exact_metric.distances(points, np.asarray(target)), k - 1)[k - 1]
+                     for target in targets]
+    dimension = points.shape[1]
+    results = [{"storage": "tuples",
+                "recheck": "-",
+                "bytes_per_point": float(sys.getsizeof(tuple(range(dimension))) + dimension * sys.getsizeof(1.0)),
+                "exact_bytes": 0.0,
+                "query_us": "-",
+                "recall_%": 100.0}]
+    for mode in STORAGE_MODES:
+        for exact_recheck in (False, True) if mode != STORAGE_FLOAT64 else (False,):
+            tree = FlatKDTree(leaf_size=leaf_size, storage=mode, exact_recheck=exact_recheck)
+            tree.build_from_array(points)
+            start = time.perf_counter()
+            found = [tree.find_k_nearest_rows(target, k, metric=metric) for target in targets]
+            query_seconds = time.perf_counter() - start
+
+            num_true = 0
+            for target, kth_distance, neighbors in zip(targets, kth_distances, found):
+                rows = [tree.get_original_index(row) for row, _ in neighbors]
+                num_true += int(np.count_nonzero(exact_metric.distances(points[rows], np.asarray(target)) <=
+                                                 kth_distance * (1 + 1e-12)))
+            usage = tree.get_memory_usage()
+            results.append({"storage": mode,
+                            "recheck": "yes" if exact_recheck else "no",
+                            "bytes_per_point": usage["points"] / len(points),
+                            "exact_bytes": usage["exact_points"] / len(points),
+                            "query_us": 1e6 * query_seconds / len(targets),
+                            "recall_%": 100 * num_true / (k * len(targets))})
+    return results
+
+
+def print_table(title: str, rows: List[Dict[str, float]]) -> None:
+    print(title)
+    if len(rows) == 0:
+        return
+    columns = list(rows[0].keys())
+    print("\t".join(f"{column:>10}" for column in columns))
+    for row in rows:
+        print("\t".join(f"{row[column]:>10.1f}" if isinstance(row[column], float) else f"{row[column]:>10}"
+                        for column in columns))
+    print()
+
+
+def main():
+    weather = load_weather_data()
+    print_table(f"Leaf size sweep - weather data ({len(weather)} days, 4-d)",
+                benchmark_leaf_sizes(weather, LEAF_SIZES, make_targets(weather, NUM_QUERIES)))
+    print_table(f"Split policies - weather data ({len(weather)} days, 4-d)",
+                benchmark_split_policies(weather, SPLIT_POLICIES, make_targets(weather, NUM_QUERIES),
+                                         POLICY_LEAF_SIZES))
+    duplicates = make_duplicate_heavy_data(NUM_SYNTHETIC_POINTS, 3)
+    print_table(f"Split policies - duplicate-heavy data ({len(duplicates)} points, 3-d, "
+                f"{100 * DUPLICATE_FRACTION:.0f}% zero on axis 0)",
+                benchmark_split_policies(duplicates, SPLIT_POLICIES, make_targets(duplicates, NUM_QUERIES),
+                                         POLICY_LEAF_SIZES))
+
+    print_table(f"Build methods - weather data ({len(weather)} days, 4-d, leaf size {BUILD_LEAF_SIZE})",
+                benchmark_builds(weather, BUILD_METHODS, make_targets(weather, NUM_QUERIES)))
+    print_table(f"Point storage - weather data ({len(weather)} days, 4-d, leaf size {STORAGE_LEAF_SIZE}, weather "
+                f"metric, recall of {STORAGE_K} nearest)",
+                benchmark_storage(weather, make_targets(weather, NUM_QUERIES), metric=WEATHER_METRIC))
+    for num_points in BUILD_SIZES:
+        data = make_synthetic_data(num_points, 4)
+        print_table(f"Build methods - synthetic uniform data ({len(data)} points, 4-d, leaf size {BUILD_LEAF_SIZE})",
+                    benchmark_builds(data, BUILD_METHODS, make_targets(data, NUM_QUERIES)))
+        print_table(f"Point storage - synthetic uniform data ({len(data)} points, 4-d, leaf size {STORAGE_LEAF_SIZE}, "
+                    f"recall of {STORAGE_K} nearest)",
+                    benchmark_storage(data, make_targets(data, NUM_QUERIES)))
+        duplicates = make_duplicate_heavy_data(num_points, 3)
+        print_table(f"Build methods - duplicate-heavy data ({num_points} points, 3-d, leaf size {BUILD_LEAF_SIZE})",
+                    benchmark_builds(duplicates, BUILD_METHODS, make_targets(duplicates, NUM_QUERIES)))
+
+    for dimension in SYNTHETIC_DIMENSIONS:
+        data = make_synthetic_data(NUM_SYNTHETIC_POINTS, dimension)
+        targets = make_targets(data, NUM_QUERIES)
+        print_table(f"Leaf size sweep - synthetic uniform data ({len(data)} points, {dimension}-d)",
+                    benchmark_leaf_sizes(data, LEAF_SIZES, targets))
+        print_table(f"Leaf size sweep with bounding boxes - synthetic uniform data ({len(data)} points, {dimension}-d)",
+                    benchmark_leaf_sizes(data, LEAF_SIZES, targets, bounding_boxes=True))
+        print_table(f"Approximate search - synthetic uniform data ({len(data)} points, {dimension}-d, "
+                    f"leaf size {APPROXIMATE_LEAF_SIZE})",
+                    benchmark_approximate(data, APPROXIMATE_SETTINGS, make_targets(data, NUM_QUERIES)))
+        print_table(f"All nearest neighbors, one search per point vs. dual-tree - synthetic uniform data "
+                    f"({DUAL_TREE_POINTS} against {DUAL_TREE_POINTS} points, {dimension}-d, leaf size "
+                    f"{DUAL_TREE_LEAF_SIZE})",
+                    benchmark_dual_tree(make_synthetic_data(DUAL_TREE_POINTS, dimension),
+                                        make_synthetic_data(DUAL_TREE_POINTS, dimension), DUAL_TREE_BLOCK_SIZES))
+
+
+if __name__ == "__main__":
+    main()
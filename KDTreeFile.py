@@ -0,0 +1,345 @@
+import math
+import threading
+from typing import Iterator, List, Optional, Set, Tuple
+
+from AbstractNodeFile import AbstractNode
+from DistanceMetricsFile import DistanceMetric
+from PointNodeFile import PointNode
+from SearchStatsFile import SearchStats
+from SplitPolicyFile import SplitPolicy
+from SplitterNodeFile import SplitterNode
+
+SCAPEGOAT_ALPHA = 0.75  # a subtree is rebuilt once one child holds more than this fraction of its data.
+MAX_TOMBSTONE_FRACTION = 0.5  # the whole tree is rebuilt once more than this fraction of its leaves are deleted.
+
+
+class KDTree:
+    """
+    A k-d tree of SplitterNodes that can change after it is built. New data are inserted by descending the existing
+    splits to a leaf, which is remade to hold them; deleted data are left in place as tombstones that searches skip.
+    Like a scapegoat tree, any subtree that an insert leaves too tall for its size is rebuilt from scratch, as is the
+    whole tree once too many of its data are tombstones, so that updates take amortised O(log n) time and the depth of
+    the tree stays O(log n).
+
+    Thread safety: any number of threads may search one KDTree at once, while other threads build, insert and delete.
+    Searches take no locks: each keeps its state (its stack, heap or queue, and best so far) in its own local variables,
+    and never changes the nodes. Writers take turns under a writer lock, and never change a part of the tree in a way a
+    reader could see half done: new subtrees (including every rebuild) are built off to the side and then put in place
+    with a single assignment - of a child, or of the root - so a search sees each subtree either as it was or as it now
+    is. A search that runs while a change is made may or may not see that change, as though it had run just before or
+    just after it. (A visualizer, on the other hand, draws to one window, so it should only be used by one thread.)
+    """
+
+    def __init__(self, leaf_size: int = 1, policy: Optional[SplitPolicy] = None, bounding_boxes: bool = False):
+        """
+        :param leaf_size: the most data kept in one leaf, as in SplitterNode.build_subtree.
+        :param policy: how each SplitterNode chooses its axis and threshold, in builds and rebuilds alike; None means
+        build_subtree's default, the round robin of sampled medians.
+        :param bounding_boxes: if True, every SplitterNode keeps the bounding box of its data, for tighter pruning. An
+        insert grows the boxes above the new datum; a delete leaves them as they are, a little bigger than they need to
+        be, until the next rebuild.
+        """
+        self._root: Optional[SplitterNode] = None
+        self._leaf_size: int = max(1, leaf_size)
+        self._policy: Optional[SplitPolicy] = policy
+        self._bounding_boxes: bool = bounding_boxes
+        self._num_live: int = 0  # data that searches can find.
+        self._num_deleted: int = 0  # tombstones still in the tree.
+        self._version: int = 0  # goes up by one with every build, insert and delete; see get_version.
+        self._write_lock = threading.RLock()  # held by build, insert and delete; searches never wait for it.
+
+    def __len__(self) -> int:
+        return self._num_live
+
+    def get_root(self) -> Optional[SplitterNode]:
+        return self._root
+
+    def get_leaf_size(self) -> int:
+        return self._leaf_size
+
+    def get_policy(self) -> Optional[SplitPolicy]:
+        return self._policy
+
+    def has_bounding_boxes(self) -> bool:
+        return self._bounding_boxes
+
+    def get_num_deleted(self) -> int:
+        return self._num_deleted
+
+    def get_version(self) -> int:
+        """
+        :return: a number that changes whenever the contents of this tree do, so that anything holding on to earlier
+        search results (such as a QueryCache) can tell they may be out of date.
+        """
+        return self._version
+
+    def build(self, data: Set[Tuple[float, ...]], visualizer=None) -> None:
+        """
+        replaces the contents of this tree with a freshly built, balanced tree of the given data.
+        :param data: the set of Tuples of floats to put in the tree.
+        :param visualizer: if not None, this is given the new root and shows the build, as in build_subtree.
+        :return: None
+        """
+        with self._write_lock:
+            new_root: Optional[SplitterNode] = None
+            if len(data) > 0:
+                new_root = SplitterNode(0)
+                if visualizer is not None:
+                    visualizer.set_root(new_root)
+                new_root.build_subtree(data, visualizer, leaf_size=self._leaf_size, policy=self._policy,
+                                       bounding_boxes=self._bounding_boxes)
+            # searches keep using the old tree until this swap, and the new one from then on.
+            self._root = new_root
+            self._num_live, self._num_deleted = len(data), 0
+            self._version += 1  # only once the new tree is in place, so that a QueryCache can't cache the old one.
+
+    def find_nearest(self,
+                     target: Tuple[float, ...],
+                     metric: Optional[DistanceMetric] = None,
+                     stats: Optional[SearchStats] = None) -> Tuple[Optional[Tuple[float, ...]], Optional[float]]:
+        """
+        :return: the (datum, distance) closest to the target, or (None, None) if the tree is empty.
+        """
+        root = self._root  # read once, in case a writer swaps in a new root during the search.
+        if root is None:
+            return None, None
+        return root.find_nearest(target, None, float('inf'), metric=metric, stats=stats)
+
+    def find_nearest_approximate(self,
+                                 target: Tuple[float, ...],
+                                 eps: float = 0.0,
+                                 max_leaves: Optional[int] = None,
+                                 metric: Optional[DistanceMetric] = None,
+                                 stats: Optional[SearchStats] = None) -> Tuple[Optional[Tuple[float, ...]],
+                                                                               Optional[float]]:
+        """
+        :return: a (datum, distance) close to the target, or (None, None) if the tree is empty; see
+        AbstractNode.find_nearest_approximate.
+        """
+        root = self._root
+        if root is None:
+            return None, None
+        return root.find_nearest_approximate(target, eps, max_leaves, metric, stats)
+
+    def find_k_nearest(self,
+                       target: Tuple[float, ...],
+                       k: int,
+                       metric: Optional[DistanceMetric] = None,
+                       stats: Optional[SearchStats] = None) -> List[Tuple[Tuple[float, ...], float]]:
+        root = self._root
+        return [] if root is None else root.find_k_nearest(target, k, metric=metric, stats=stats)
+
+    def query_radius(self,
+                     target: Tuple[float, ...],
+                     radius: float,
+                     metric: Optional[DistanceMetric] = None) -> Iterator[Tuple[float, ...]]:
+        root = self._root
+        return iter(()) if root is None else root.query_radius(target, radius, metric)
+
+    def count_radius(self, target: Tuple[float, ...], radius: float, metric: Optional[DistanceMetric] = None) -> int:
+        root = self._root
+        return 0 if root is None else root.count_radius(target, radius, metric)
+
+    def query_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> Iterator[Tuple[float, ...]]:
+        root = self._root
+        return iter(()) if root is None else root.query_box(low, high)
+
+    def count_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> int:
+        root = self._root
+        return 0 if root is None else root.count_box(low, high)
+
+    def insert(self, point: Tuple[float, ...]) -> bool:
+        """
+        adds a datum to the tree. It descends the existing splits (values equal to a threshold go right) until it
+        reaches a leaf or an empty branch. The datum takes an empty branch or a tombstone's place; otherwise the leaf is
+        remade with the new datum in it - as a BucketNode if they fit in one leaf, or as a SplitterNode if not. If that
+        leaves the new datum too deep, the subtree of the lowest unbalanced ancestor (the "scapegoat") is rebuilt.
+        :param point: the datum to add.
+        :return: True if it was added; False if it was already in the tree.
+        """
+        with self._write_lock:
+            if self._root is None:
+                self.build({point})
+                return True
+            if self._find_path(point) is not None:
+                return False
+
+            path: List[Tuple[SplitterNode, bool]] = []  # the (SplitterNode, whether we went left from it) we passed.
+            node: AbstractNode = self._root
+            while not node.is_a_leaf():
+                went_left = point[node.get_axis()] < node.get_threshold()
+                path.append((node, went_left))
+                node.include_in_bounding_box(point)
+                node = node.get_left() if went_left else node.get_right()
+                if node is None:
+                    break
+
+            parent, went_left = path[-1]
+            next_axis = (parent.get_axis() + 1) % parent.get_dimension()
+            if node is None:
+                parent.set_child(went_left, PointNode(point))
+            elif isinstance(node, PointNode) and node.is_deleted():  # reuse the tombstone's place.
+                parent.set_child(went_left, PointNode(point))
+                self._num_deleted -= 1
+            else:
+                # make_child gives a BucketNode if the data still fit in one leaf, or a new SplitterNode otherwise.
+                data = set(node.get_values())
+                data.add(point)
+                parent.set_child(went_left, self._make_subtree(data, next_axis))
+            self._num_live += 1
+            self._version += 1
+
+            # the new leaf may sit below a new SplitterNode, so measure how deep the changed branch now goes.
+            new_branch = parent.get_left() if went_left else parent.get_right()
+            if len(path) + self.subtree_depth(new_branch) > self._max_depth():
+                self._rebuild_scapegoat(path)
+            return True
+
+    def delete(self, point: Tuple[float, ...]) -> bool:
+        """
+        removes a datum from the tree. A PointNode is only marked as deleted (a tombstone); a BucketNode drops the
+        datum at once. Once tombstones make up more than MAX_TOMBSTONE_FRACTION of the tree, it is rebuilt without them.
+        :param point: the datum to remove.
+        :return: True if it was removed; False if it wasn't in the tree.
+        """
+        with self._write_lock:
+            path = self._find_path(point)
+            if path is None:
+                return False
+            leaf, ancestors = path
+            if isinstance(leaf, PointNode):
+                leaf.mark_deleted()
+                self._num_deleted += 1
+            else:
+                parent, went_left = ancestors[-1]
+                remaining = {value for value in leaf.get_values() if value != point}
+                next_axis = (parent.get_axis() + 1) % parent.get_dimension()
+                parent.set_child(went_left, self._make_subtree(remaining, next_axis))
+            self._num_live -= 1
+            self._version += 1
+
+            if self._num_deleted > MAX_TOMBSTONE_FRACTION * (self._num_live + self._num_deleted):
+                self.build(set(self.collect_values(self._root)))
+            return True
+
+    def _make_subtree(self, data: Set[Tuple[float, ...]], axis: int) -> Optional[AbstractNode]:
+        """
+        makes the node that will hold the given data below an existing SplitterNode, with this tree's leaf size, split
+        policy and bounding boxes, as SplitterNode.make_child does.
+        """
+        child = SplitterNode.make_child(data, axis, leaf_size=self._leaf_size, policy=self._policy)
+        if self._bounding_boxes and isinstance(child, SplitterNode):
+            child.compute_bounding_boxes()
+        return child
+
+    def _find_path(self, point: Tuple[float, ...]) -> Optional[Tuple[AbstractNode, List[Tuple[SplitterNode, bool]]]]:
+        """
+        finds the live leaf holding the given datum. Data equal to a threshold may be on either side of it, so both
+        sides are searched in that case.
+        :return: (the leaf, the list of (SplitterNode, whether we went left from it) leading to it), or None.
+        """
+        if self._root is None:
+            return None
+        to_visit: List[Tuple[AbstractNode, List[Tuple[SplitterNode, bool]]]] = [(self._root, [])]
+        while to_visit:
+            node, path = to_visit.pop()
+            if node.is_a_leaf():
+                if point in node.get_values():
+                    return node, path
+                continue
+            value, threshold = point[node.get_axis()], node.get_threshold()
+            if value <= threshold and node.get_left() is not None:
+                to_visit.append((node.get_left(), path + [(node, True)]))
+            if value >= threshold and node.get_right() is not None:
+                to_visit.append((node.get_right(), path + [(node, False)]))
+        return None
+
+    def _max_height(self, size: int) -> float:
+        """
+        :param size: how many data (live or tombstoned) a subtree holds.
+        :return: the most levels that subtree may have before it needs rebuilding. This is log base 1/SCAPEGOAT_ALPHA
+        of its number of leaves, plus a little slack, since build_subtree's coin flips for data that tie with the
+        median can leave a few levels with a single child, even in a freshly built subtree.
+        """
+        num_leaves = math.ceil(size / self._leaf_size)
+        return math.log(max(2, num_leaves), 1 / SCAPEGOAT_ALPHA) + 2
+
+    def _max_depth(self) -> float:
+        """
+        :return: the deepest a leaf may be (counting the root as depth 1) before a scapegoat rebuild is needed.
+        """
+        return self._max_height(self._num_live + self._num_deleted)
+
+    def _rebuild_scapegoat(self, path: List[Tuple[SplitterNode, bool]]) -> None:
+        """
+        walks back up the path just used to insert, working out subtree sizes and heights as it goes, and rebuilds
+        the subtree of the lowest ancestor that is too tall for its size. The whole tree is too tall (that is why we
+        are here), so there is always one to find.
+        :param path: the (SplitterNode, whether we went left from it) pairs from the root to the new datum's parent.
+        :return: None
+        """
+        last_node, last_went_left = path[-1]
+        child = last_node.get_left() if last_went_left else last_node.get_right()
+        child_size, child_height = self.count_leaf_data(child), self.subtree_depth(child)
+        for depth in range(len(path) - 1, -1, -1):
+            node, went_left = path[depth]
+            sibling = node.get_right() if went_left else node.get_left()
+            size = child_size + self.count_leaf_data(sibling)
+            height = 1 + max(child_height, self.subtree_depth(sibling))
+            if height > self._max_height(size):
+                data = set(self.collect_values(node))
+                if depth == 0:
+                    new_root = SplitterNode(node.get_axis())
+                    new_root.build_subtree(data, leaf_size=self._leaf_size, policy=self._policy,
+                                           bounding_boxes=self._bounding_boxes)
+                    self._root = new_root
+                    self._num_deleted = 0
+                else:
+                    self._num_deleted -= size - len(data)  # the rebuild leaves out this subtree's tombstones.
+                    parent, parent_went_left = path[depth - 1]
+                    parent.set_child(parent_went_left, self._make_subtree(data, node.get_axis()))
+                return
+            child_size, child_height = size, height
+
+    @staticmethod
+    def subtree_depth(node: Optional[AbstractNode]) -> int:
+        """
+        :return: how many levels of nodes the subtree at node has (0 for None, 1 for a leaf).
+        """
+        depth = 0
+        level = [] if node is None else [node]
+        while level:
+            depth += 1
+            level = [child for parent in level
+                     for child in (parent.get_left(), parent.get_right()) if child is not None]
+        return depth
+
+    @staticmethod
+    def count_leaf_data(node: Optional[AbstractNode]) -> int:
+        """
+        :return: how many data - live or tombstoned - are held in the leaves of the subtree at node.
+        """
+        count = 0
+        to_visit = [] if node is None else [node]
+        while to_visit:
+            node = to_visit.pop()
+            if isinstance(node, PointNode):
+                count += 1
+            elif node.is_a_leaf():
+                count += len(node.get_values())
+            else:
+                to_visit.extend(child for child in (node.get_left(), node.get_right()) if child is not None)
+        return count
+
+    @staticmethod
+    def collect_values(node: Optional[AbstractNode]) -> List[Tuple[float, ...]]:
+        """
+        :return: every live datum in the subtree at node.
+        """
+        values = []
+        to_visit = [] if node is None else [node]
+        while to_visit:
+            node = to_visit.pop()
+            values.extend(node.get_values())
+            to_visit.extend(child for child in (node.get_left(), node.get_right()) if child is not None)
+        return values
@@ -0,0 +1,134 @@
+import math
+import random
+import sys
+import threading
+import unittest
+
+from KDTreeFile import KDTree
+from QueryCacheFile import QueryCache
+
+
+class KDTreeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(7)
+        self.targets = [tuple(random.uniform(0, 100) for _ in range(3)) for _ in range(30)]
+
+    def random_point(self):
+        # integer coordinates, so that plenty of data tie with a threshold.
+        return tuple(float(random.randrange(0, 100)) for _ in range(3))
+
+    def depth(self, node):
+        if node is None:
+            return 0
+        return 1 + max(self.depth(node.get_left()), self.depth(node.get_right()))
+
+    def check_matches(self, tree, data):
+        self.assertEqual(len(data), len(tree))
+        self.assertCountEqual(data, tree.collect_values(tree.get_root()))
+        for target in self.targets:
+            expected = sorted(math.dist(datum, target) for datum in data)
+            self.assertAlmostEqual(expected[0], tree.find_nearest(target)[1])
+            self.assertEqual([round(d, 9) for d in expected[:4]],
+                             [round(d, 9) for _, d in tree.find_k_nearest(target, 4)])
+            self.assertEqual(sum(1 for d in expected if d <= 20), tree.count_radius(target, 20))
+
+    def check_bounding_boxes(self, tree):
+        to_visit = [tree.get_root()]
+        while to_visit:
+            node = to_visit.pop()
+            if node is None or node.is_a_leaf():
+                continue
+            low, high = node.get_bounding_box()
+            for value in tree.collect_values(node):
+                self.assertTrue(all(lo <= v <= hi for lo, v, hi in zip(low, value, high)))
+            to_visit.extend((node.get_left(), node.get_right()))
+
+    def test_insert_and_delete_match_brute_force(self):
+        for leaf_size, bounding_boxes in ((1, False), (5, False), (2, True)):
+            data = {self.random_point() for _ in range(200)}
+            tree = KDTree(leaf_size=leaf_size, bounding_boxes=bounding_boxes)
+            tree.build(data)
+            for step in range(600):
+                point = self.random_point()
+                if random.random() < 0.5:
+                    self.assertEqual(point not in data, tree.insert(point))
+                    data.add(point)
+                else:
+                    point = random.choice(sorted(data)) if random.random() < 0.8 else point
+                    self.assertEqual(point in data, tree.delete(point))
+                    data.discard(point)
+                if step % 100 == 0:
+                    self.check_matches(tree, data)
+            self.check_matches(tree, data)
+            if bounding_boxes:
+                self.check_bounding_boxes(tree)
+
+    def test_sorted_inserts_stay_shallow(self):
+        tree = KDTree()
+        for i in range(1000):
+            self.assertTrue(tree.insert((float(i), float(i), float(i))))
+        self.assertEqual(1000, len(tree))
+        # without rebuilding, the tree would be a chain 1000 nodes deep.
+        self.assertLessEqual(self.depth(tree.get_root()), math.log(1000, 1 / 0.75) + 2)
+        self.check_matches(tree, {(float(i), float(i), float(i)) for i in range(1000)})
+
+    def test_tombstones_are_cleared(self):
+        data = {self.random_point() for _ in range(100)}
+        tree = KDTree()
+        tree.build(data)
+        for point in sorted(data)[:60]:
+            self.assertTrue(tree.delete(point))
+            data.remove(point)
+        self.assertLessEqual(tree.get_num_deleted(), len(tree))
+        self.check_matches(tree, data)
+        self.assertFalse(tree.delete((-1.0, -1.0, -1.0)))
+
+
+    def test_searches_run_alongside_updates(self):
+        # the stable data never change, and are all within 1 of a target, while the writer inserts and deletes
+        # data (and so triggers rebuilds) far away from them, so every search has a known answer however it interleaves.
+        stable = {(float(x), float(y), 0.0) for x in range(0, 100, 10) for y in range(0, 100, 10)}
+        targets = [(x + 0.25, y + 0.25, 0.0) for x, y, _ in sorted(stable)]
+        tree = KDTree(leaf_size=2, bounding_boxes=True)
+        tree.build(stable)
+        cache = QueryCache(tree, max_size=16)
+        failures = []
+        done = threading.Event()
+
+        def search():
+            while not done.is_set():
+                for target in targets:
+                    value, distance = tree.find_nearest(target)
+                    cached_value, _ = cache.find_nearest(target)
+                    expected = (target[0] - 0.25, target[1] - 0.25, 0.0)
+                    if value != expected or cached_value != expected or len(tree.find_k_nearest(target, 3)) != 3:
+                        failures.append((target, value, cached_value))
+
+        old_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)  # switch threads often, to mix the searches in with the updates.
+        readers = [threading.Thread(target=search) for _ in range(3)]
+        try:
+            for reader in readers:
+                reader.start()
+            extra = []
+            for step in range(1500):
+                if len(extra) > 0 and random.random() < 0.4:
+                    self.assertTrue(tree.delete(extra.pop(random.randrange(len(extra)))))
+                else:
+                    point = (random.uniform(0, 100), random.uniform(0, 100), random.uniform(50, 100))
+                    if tree.insert(point):
+                        extra.append(point)
+                if step % 100 == 0:
+                    tree.build(stable | set(extra))
+        finally:
+            done.set()
+            for reader in readers:
+                reader.join()
+            sys.setswitchinterval(old_interval)
+        self.assertEqual([], failures)
+        self.check_matches(tree, stable | set(extra))
+        self.check_bounding_boxes(tree)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,12 @@
 import random
 import logging
-from KinkaidDecorators import log_start_stop_method
+from KinkaidDecorators import log_start_stop_method, traced_methods
 
+from KDTreeFile import KDTree
 from SplitterNodeFile import SplitterNode
+from PointNodeFile import PointNode
+from BucketNodeFile import BucketNode
+from QueryCacheFile import QueryCache
 from typing import Set, List, Tuple, Optional
 
 from TwoDVisualizerFile import TwoDVisualizer
@@ -20,7 +24,7 @@ def main():
     # create the dataset and empty root splitternode.
     dataset = build_dataset()
     print(dataset)
-    root = SplitterNode()
+    tree = KDTree()
 
     # create the visualizer (if using)
     visualizer = None
@@ -28,23 +32,27 @@ def main():
         visualizer = TwoDVisualizer(data=dataset)
 
     # build the tree, with or without visualizer.
+    tree.build(dataset, visualizer)
+    root = tree.get_root()
+    print(root)
     if visualizer is not None:
-        visualizer.set_root(root)
-        root.build_subtree(dataset, visualizer)
-        print(root)
         visualizer.display(wait_for_key=False)
-    else:
-        root.build_subtree(dataset)
-        print(root)
+    cache = QueryCache(tree)  # repeated targets are answered without searching again... unless we want to watch.
 
     while True:
         # get a target value to search for
         target = ask_for_target()
 
-        closest, distance = root.find_nearest(target,  # the point to which we want the closest point in the dataset
-                                              None,  # the best point so far... we're just starting so there isn't one.
-                                              float('inf'),  # the closest distance point so far... inifinity so far
-                                              visualizer)
+        if visualizer is not None:
+            # log the search we're watching: one call for the whole search, and one for each leaf it reaches.
+            with traced_methods(SplitterNode, "find_nearest"), traced_methods(PointNode, "find_nearest"), \
+                    traced_methods(BucketNode, "find_nearest"):
+                closest, distance = root.find_nearest(target,  # the point to which we want the closest point
+                                                      None,  # the best point so far... we're just starting so none yet.
+                                                      float('inf'),  # the closest distance so far... infinity so far
+                                                      visualizer)
+        else:
+            closest, distance = cache.find_nearest(target)
 
         if visualizer is not None:
             visualizer.show_search_progress(target=target, best_point=closest, wait_for_key=False)
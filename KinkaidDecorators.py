@@ -1,5 +1,7 @@
+import contextlib
 import logging
-from typing import Callable, Any
+import threading
+from typing import Callable, Any, Dict, Iterator, Tuple
 import functools
 import traceback
 """
@@ -15,3 +17,65 @@ def log_start_stop_method(func: Callable[..., Any]) -> Callable[..., Any]:
         return value
     return wrapper
 
+
+# which (class, method name) pairs each thread is tracing, and how many "with traced_methods" blocks deep it is in each.
+_tracing = threading.local()
+_installing = threading.Lock()  # held while a class's methods are swapped for their tracing switches.
+
+
+def _tracing_counts() -> Dict[Tuple[type, str], int]:
+    if not hasattr(_tracing, "counts"):
+        _tracing.counts = {}
+    return _tracing.counts
+
+
+def _install_tracing_switch(cls: type, name: str) -> None:
+    """
+    replaces cls's method with a wrapper that logs the call (as log_start_stop_method does) when the calling thread is
+    tracing it, and otherwise just calls the method. The wrapper stays in place for good, so that starting or stopping
+    tracing never changes the class that other threads are using.
+    """
+    with _installing:
+        method = cls.__dict__[name]
+        if getattr(method, "_tracing_switch", False):
+            return
+        traced = log_start_stop_method(method)
+
+        @functools.wraps(method)
+        def switch(*args: Any, **kwargs: Any) -> Any:
+            counts = getattr(_tracing, "counts", None)
+            if counts and counts.get((cls, name)):
+                return traced(*args, **kwargs)
+            return method(*args, **kwargs)
+        switch._tracing_switch = True
+        setattr(cls, name, switch)
+
+
+@contextlib.contextmanager
+def traced_methods(cls: type, *method_names: str) -> Iterator[None]:
+    """
+    logs the start and end of every call to the named methods of cls, but only inside a "with" block, and only for
+    calls made by the thread running the block:
+        with traced_methods(SplitterNode, "find_nearest"):
+            root.find_nearest(target, None, float('inf'))
+    The first time a method is traced, it is replaced for good by a switch that checks a thread-local flag, so other
+    threads searching the same classes at the same time are neither traced nor disturbed. Untraced calls pay only for
+    that check - unlike decorating the methods permanently, which costs a stack walk and two log calls per call, even
+    with logging switched off.
+
+    Note that SplitterNode.find_nearest searches the whole tree from its own stack, not by calling itself at each
+    splitter, so tracing it logs one call per query. To log each step of a search as well, trace the leaves' searches,
+    which are called once per leaf reached:
+        with traced_methods(SplitterNode, "find_nearest"), traced_methods(PointNode, "find_nearest"), \
+                traced_methods(BucketNode, "find_nearest"):
+    """
+    for name in method_names:
+        _install_tracing_switch(cls, name)
+    counts = _tracing_counts()
+    for name in method_names:
+        counts[(cls, name)] = counts.get((cls, name), 0) + 1
+    try:
+        yield
+    finally:
+        for name in method_names:
+            counts[(cls, name)] -= 1
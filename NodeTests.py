@@ -1,6 +1,12 @@
+import math
+import random
+import sys
 import unittest
 
+from BucketNodeFile import BucketNode
 from PointNodeFile import PointNode
+from SearchStatsFile import SearchStats, measure_tree
+from SplitPolicyFile import SLIDING_MIDPOINT
 from SplitterNodeFile import SplitterNode, NUM_POINTS_FOR_MEDIAN
 
 
@@ -123,5 +129,256 @@ class MyTestCase(unittest.TestCase):
 
         print(f"{val=}\t{dist=}")
 
+    def test_BucketNode_find_nearest(self):
+        bucket = BucketNode({(45.0, 83.0), (18.0, 51.0), (44.0, 66.0)})
+        self.assertEqual(3, len(bucket.get_values()))
+        self.assertIsNone(bucket.get_value())
+
+        val, dist = bucket.find_nearest((40.0, 60.0), None, float('inf'))
+        self.assertEqual((44.0, 66.0), val)
+        self.assertAlmostEqual(7.21, dist, places=2)
+
+        val, dist = bucket.find_nearest((40.0, 60.0), (44.0, 66.0), 7.21)
+        self.assertIsNone(val)
+        self.assertIsNone(dist)
+
+    def test_build_with_leaf_size(self):
+        root = SplitterNode(0)
+        root.build_subtree(self.val_set_B, leaf_size=4)
+        leaves = []
+        to_visit = [root]
+        while to_visit:
+            node = to_visit.pop()
+            if node.is_a_leaf():
+                leaves.append(node)
+            else:
+                to_visit.extend(child for child in (node.get_left(), node.get_right()) if child is not None)
+        self.assertTrue(all(len(leaf.get_values()) <= 4 for leaf in leaves))
+        self.assertEqual(self.val_set_B, {value for leaf in leaves for value in leaf.get_values()})
+
+        target = (0.5, 0.5, 0.5, 0.5, 0.5)
+        val, dist = root.find_nearest(target, None, float('inf'))
+        self.assertAlmostEqual(min(math.dist(target, datum) for datum in self.val_set_B), dist)
+
+    def test_find_k_nearest(self):
+        target = (0.5, 0.5, 0.5, 0.5, 0.5)
+        expected = sorted(math.dist(target, datum) for datum in self.val_set_B)
+        for leaf_size in (1, 4):
+            root = SplitterNode(0)
+            root.build_subtree(self.val_set_B, leaf_size=leaf_size)
+            for k in (1, 3, 18, 25):
+                results = root.find_k_nearest(target, k)
+                self.assertEqual(min(k, 18), len(results))
+                for (value, dist), expected_dist in zip(results, expected):
+                    self.assertIn(value, self.val_set_B)
+                    self.assertAlmostEqual(expected_dist, dist)
+                    self.assertAlmostEqual(math.dist(target, value), dist)
+        self.assertEqual([((45.0, 83.0), 0.0)], PointNode((45.0, 83.0)).find_k_nearest((45.0, 83.0), 2))
+
+    def test_find_nearest_approximate(self):
+        random.seed(5)
+        data = {tuple(random.uniform(0, 1) for _ in range(5)) for _ in range(500)} | self.val_set_B
+        targets = [tuple(random.uniform(0, 1) for _ in range(5)) for _ in range(40)] + sorted(self.val_set_B)[:3]
+        for leaf_size in (1, 4):
+            root = SplitterNode(0)
+            root.build_subtree(data, leaf_size=leaf_size)
+            for target in targets:
+                expected = min(math.dist(target, datum) for datum in data)
+                self.assertAlmostEqual(expected, root.find_nearest_approximate(target)[1])
+                value, dist = root.find_nearest_approximate(target, eps=0.5)
+                self.assertLessEqual(dist, 1.5 * expected + 1e-12)
+                self.assertAlmostEqual(math.dist(target, value), dist)
+                value, dist = root.find_nearest_approximate(target, max_leaves=1)
+                self.assertIn(value, data)
+                self.assertGreaterEqual(dist + 1e-12, expected)
+        self.assertEqual(((45.0, 83.0), 0.0), PointNode((45.0, 83.0)).find_nearest_approximate((45.0, 83.0)))
+
+    def test_query_radius_and_box(self):
+        target = (0.5, 0.5, 0.5, 0.5, 0.5)
+        low = (0.2, float('-inf'), 0.3, 0.0, 0.0)
+        high = (0.7, float('inf'), 0.9, 0.7, 0.7)
+        expected_radius = {datum for datum in self.val_set_B if math.dist(target, datum) <= 0.5}
+        expected_box = {datum for datum in self.val_set_B
+                        if all(lo <= v <= hi for lo, v, hi in zip(low, datum, high))}
+        self.assertLess(0, len(expected_radius))
+        self.assertLess(0, len(expected_box))
+        for leaf_size in (1, 4):
+            root = SplitterNode(0)
+            root.build_subtree(self.val_set_B, leaf_size=leaf_size)
+            self.assertEqual(expected_radius, set(root.query_radius(target, 0.5)))
+            self.assertEqual(len(expected_radius), root.count_radius(target, 0.5))
+            self.assertEqual(expected_box, set(root.query_box(low, high)))
+            self.assertEqual(len(expected_box), root.count_box(low, high))
+
+    def test_parallel_build_matches_seeded_serial_build(self):
+        data = {(float(i % 17), float(i % 23), float(i % 5)) for i in range(2000)}
+        serial_root = SplitterNode(0)
+        serial_root.build_subtree(data, leaf_size=3, seed=1234)
+        parallel_root = SplitterNode(0)
+        parallel_root.build_subtree_parallel(data, max_workers=2, min_subtree_size=100, leaf_size=3, seed=1234)
+        self.assertEqual(str(serial_root), str(parallel_root))
+
+        other_root = SplitterNode(0)
+        other_root.build_subtree(data, leaf_size=3, seed=1234)
+        self.assertEqual(str(serial_root), str(other_root))
+
+    def test_build_from_array_splits_at_exact_median(self):
+        # more data than NUM_POINTS_FOR_MEDIAN, so build_subtree's default would split at the median of a sample; the
+        # array build splits every node at the exact median of its data instead, like the EXACT_MEDIAN policy.
+        random.seed(7)
+        data = {tuple(random.uniform(0, 1) for _ in range(3)) for _ in range(10 * NUM_POINTS_FOR_MEDIAN)}
+        everywhere = ((0.0, 0.0, 0.0), (1.0, 1.0, 1.0))
+        array_root = SplitterNode(0)
+        array_root.build_subtree_from_array(sorted(data))
+        self.assertEqual(data, set(array_root.query_box(*everywhere)))
+        to_visit = [array_root]
+        while to_visit:
+            node = to_visit.pop()
+            if node.is_a_leaf():
+                continue
+            subset = set(node.query_box(*everywhere))
+            self.assertEqual(node.get_median_value(subset, sample_size=0), node.get_threshold())
+            # the values are all different, so only the median datum itself can land on either side.
+            sizes = [0 if child is None else child.count_box(*everywhere)
+                     for child in (node.get_left(), node.get_right())]
+            self.assertLessEqual(abs(sizes[0] - sizes[1]), 2)
+            to_visit.extend(child for child in (node.get_left(), node.get_right()) if child is not None)
+        for _ in range(20):
+            target = tuple(random.uniform(0, 1) for _ in range(3))
+            _, distance = array_root.find_nearest(target, None, float('inf'))
+            self.assertAlmostEqual(min(math.dist(target, datum) for datum in data), distance)
+
+    def test_build_from_array_splits_ties(self):
+        root = SplitterNode(0)
+        root.build_subtree_from_array([(1.0, float(i)) for i in range(64)])
+        self.assertLess(abs(len(list(root.get_left().query_box((0, 0), (2, 64)))) - 32), 20)
+        self.assertEqual(64, root.count_box((0.0, 0.0), (2.0, 64.0)))
+        # bigger than SMALL_SLICE_SIZE, so that the numpy path flips the coins.
+        root = SplitterNode(0)
+        root.build_subtree_from_array([(1.0, float(i)) for i in range(1000)])
+        self.assertLess(abs(root.get_left().count_box((0, 0), (2, 1000)) - 500), 100)
+        self.assertEqual(1000, root.count_box((0.0, 0.0), (2.0, 1000.0)))
+
+    def test_build_presorted_splits_exactly_in_half(self):
+        random.seed(22)
+        data = {(float(random.randrange(10)), random.uniform(0, 1), float(random.randrange(3))) for _ in range(500)}
+        everywhere = ((-1.0, -1.0, -1.0), (11.0, 11.0, 11.0))
+        root = SplitterNode(0)
+        root.build_subtree_presorted(data, leaf_size=3)
+        self.assertEqual(self.node_0.get_median_value(data, sample_size=0), root.get_threshold())
+        self.assertEqual(data, set(root.query_box(*everywhere)))
+        to_visit = [root]
+        while to_visit:
+            node = to_visit.pop()
+            if node.is_a_leaf():
+                continue
+            left, right = list(node.get_left().query_box(*everywhere)), list(node.get_right().query_box(*everywhere))
+            self.assertEqual((len(left) + len(right)) // 2, len(left))
+            self.assertLessEqual(max(datum[node.get_axis()] for datum in left), node.get_threshold())
+            self.assertLessEqual(node.get_threshold(), min(datum[node.get_axis()] for datum in right))
+            to_visit.extend((node.get_left(), node.get_right()))
+
+        # no coin flips, so the same rows always give the same tree, ties and all.
+        first_root, other_root = SplitterNode(0), SplitterNode(0)
+        first_root.build_subtree_presorted(sorted(data), leaf_size=3)
+        other_root.build_subtree_presorted(sorted(data), leaf_size=3)
+        self.assertEqual(str(first_root), str(other_root))
+
+        tied_root = SplitterNode(0)
+        tied_root.build_subtree_presorted([(1.0, float(i)) for i in range(64)])
+        self.assertEqual(32, tied_root.get_left().count_box((0.0, 0.0), (2.0, 64.0)))
+
+    def test_build_presorted_searches(self):
+        random.seed(23)
+        data = [(float(random.randrange(4)), float(random.randrange(4)), random.uniform(0, 1)) for _ in range(400)]
+        targets = [tuple(random.uniform(0, 4) for _ in range(3)) for _ in range(20)]
+        for leaf_size in (1, 5):
+            root, boxed = SplitterNode(0), SplitterNode(0)
+            root.build_subtree_presorted(data, leaf_size=leaf_size)
+            boxed.build_subtree_presorted(data, leaf_size=leaf_size, bounding_boxes=True)
+            self.assertIsNone(root.get_bounding_box())
+            self.assertEqual((tuple(map(min, zip(*data))), tuple(map(max, zip(*data)))), boxed.get_bounding_box())
+            for target in targets:
+                expected = sorted(math.dist(target, datum) for datum in data)
+                self.assertAlmostEqual(expected[0], root.find_nearest(target, None, float('inf'))[1])
+                self.assertAlmostEqual(expected[0], boxed.find_nearest(target, None, float('inf'))[1])
+                for k_nearest in (root.find_k_nearest(target, 4), boxed.find_k_nearest(target, 4)):
+                    self.assertEqual([round(dist, 9) for dist in expected[:4]],
+                                     [round(dist, 9) for _, dist in k_nearest])
+
+        # the boxes built along the way are the same as those worked out afterwards.
+        computed = SplitterNode(0)
+        computed.build_subtree_presorted(data, leaf_size=5)
+        computed.compute_bounding_boxes()
+        self.assertEqual(str(boxed), str(computed))
+        to_visit = [(boxed, computed)]
+        while to_visit:
+            node, other = to_visit.pop()
+            if isinstance(node, SplitterNode):
+                self.assertEqual(node.get_bounding_box(), other.get_bounding_box())
+                to_visit.extend(zip((node.get_left(), node.get_right()), (other.get_left(), other.get_right())))
+
+        empty = SplitterNode(0)
+        empty.build_subtree_presorted(set())
+        self.assertEqual((None, None), (empty.get_left(), empty.get_right()))
+
+    def test_deeper_than_recursion_limit(self):
+        # chain SplitterNodes together, each holding one value on its left, so the tree is far deeper than the
+        # interpreter would allow a recursive search to go.
+        depth = 3 * sys.getrecursionlimit()
+        root = SplitterNode(0)
+        node = root
+        for i in range(depth):
+            node.build_subtree({(float(i),), (float(i + 1),), (float(i + 2),)}, seed=i)  # splits at i + 1.
+            if i + 1 < depth:
+                next_node = SplitterNode(0)
+                node.set_child(False, next_node)
+                node = next_node
+
+        self.assertEqual(((1234.0,), 0.25), root.find_nearest((1234.25,), None, float('inf')))
+        self.assertEqual([0.25, 0.75, 0.75], [dist for _, dist in root.find_k_nearest((1234.25,), 3)])
+        self.assertEqual(((depth + 1.0,), 0.0), root.find_nearest((depth + 1.0,), None, float('inf')))
+        self.assertLessEqual(depth, str(root).count("axis"))
+        # the range queries walk the tree from their own stacks too. (A tie at a threshold can leave a value in
+        # two of the chained nodes, so these compare sets.)
+        everything = list(root.query_box((-1.0,), (depth + 2.0,)))
+        self.assertEqual({(float(i),) for i in range(depth + 2)}, set(everything))
+        self.assertEqual(len(everything), root.count_box((-1.0,), (depth + 2.0,)))
+        self.assertEqual({(1234.0,), (1235.0,)}, set(root.query_box((1233.5,), (1235.5,))))
+        self.assertEqual({(1234.0,), (1235.0,)}, set(root.query_radius((1234.25,), 0.75)))
+        self.assertEqual(len(list(root.query_radius((1234.25,), 1.0))), root.count_radius((1234.25,), 1.0))
+
+        # sliding midpoints halve the space each time, so points that halve their distance from 0 each time make a
+        # very deep, one-sided tree.
+        skewed = SplitterNode(0)
+        skewed_data = {(2.0 ** -i, 2.0 ** -i) for i in range(1500)}
+        skewed.build_subtree(skewed_data, policy=SLIDING_MIDPOINT)
+        self.assertGreater(measure_tree(skewed).get_max_depth(), sys.getrecursionlimit() // 2)
+        self.assertEqual(len(skewed_data), skewed.count_box((0.0, 0.0), (1.0, 1.0)))
+        self.assertEqual(skewed_data, set(skewed.query_box((0.0, 0.0), (1.0, 1.0))))
+        self.assertEqual(len(skewed_data) - 1, skewed.count_radius((0.0, 0.0), 1.0))
+        self.assertEqual(len(skewed_data) - 1, len(list(skewed.query_radius((0.0, 0.0), 1.0))))
+
+        built = SplitterNode(0)
+        built.build_subtree({(float(i),) for i in range(depth + 2)}, leaf_size=2)
+        self.assertEqual(str(built).count("axis"), built.recursive_to_string().count("threshold"))
+
+    def test_bounding_boxes_prune_more(self):
+        random.seed(8)
+        data = {tuple(random.uniform(0, 1) for _ in range(8)) for _ in range(3000)}
+        targets = [tuple(random.uniform(0, 1) for _ in range(8)) for _ in range(20)]
+        plain, boxed = SplitterNode(0), SplitterNode(0)
+        plain.build_subtree(data, leaf_size=4, seed=5)
+        boxed.build_subtree(data, leaf_size=4, seed=5, bounding_boxes=True)
+        self.assertIsNone(plain.get_bounding_box())
+        self.assertEqual((tuple(map(min, zip(*data))), tuple(map(max, zip(*data)))), boxed.get_bounding_box())
+        plain_stats, boxed_stats = SearchStats(), SearchStats()
+        for target in targets:
+            self.assertEqual(plain.find_nearest(target, None, float('inf'), stats=plain_stats),
+                             boxed.find_nearest(target, None, float('inf'), stats=boxed_stats))
+            self.assertEqual(plain.find_k_nearest(target, 4), boxed.find_k_nearest(target, 4))
+            self.assertEqual(plain.find_nearest_approximate(target), boxed.find_nearest_approximate(target))
+        self.assertLess(boxed_stats.leaves_scanned, plain_stats.leaves_scanned / 2)
+
 if __name__ == '__main__':
     unittest.main()
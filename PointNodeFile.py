@@ -1,13 +1,28 @@
 import logging
 import math
-from typing import Tuple, Optional
+from typing import Iterator, List, Tuple, Optional
 
 from AbstractNodeFile import AbstractNode
+from DistanceMetricsFile import DistanceMetric
+from SearchStatsFile import SearchStats
 
 
 class PointNode(AbstractNode):
     def __init__(self, value: Tuple[float, ...]):
         self._value = value
+        self._is_deleted = False  # a "tombstone": a deleted PointNode stays in the tree, but searches ignore it.
+
+    def is_deleted(self) -> bool:
+        return self._is_deleted
+
+    def mark_deleted(self) -> None:
+        self._is_deleted = True
+
+    def get_stored_value(self) -> Tuple[float, ...]:
+        """
+        :return: the datum this node was made with, even if it has since been deleted.
+        """
+        return self._value
 
     def is_a_leaf(self):
         return True
@@ -19,7 +34,7 @@ class PointNode(AbstractNode):
         return None
 
     def get_value(self) -> Optional[Tuple[float, ...]]:
-        return self._value
+        return None if self._is_deleted else self._value
 
     def recursive_to_string(self, depth: int = 0) -> str:
         return "\t" * depth + str(self._value) + "\n"
@@ -28,7 +43,9 @@ class PointNode(AbstractNode):
                      target: Tuple[float, ...],
                      best_value_so_far: Optional[Tuple[float, ...]],
                      best_distance_so_far: float,
-                     visualizer=None) -> Tuple[Optional[Tuple[float, ...]], Optional[float]]:
+                     visualizer=None,
+                     metric: Optional[DistanceMetric] = None,
+                     stats: Optional[SearchStats] = None) -> Tuple[Optional[Tuple[float, ...]], Optional[float]]:
         """
         finds the distance between the target and this node's value. If this distance is shorter than the best distance
         found so far, returns this node's value and the distance we just found. Otherwise, returns None for both value
@@ -38,19 +55,64 @@ class PointNode(AbstractNode):
         one.
         :param best_distance_so_far: the distance from the target upon which we are trying to improve
         :param visualizer: a hook to a visualizer, so we can see progress if this is 2-d. Not used.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :param stats: if not None, this node's visit and distance calculation are counted in it.
         :return: (value, distance) if we can improve, (None, None) otherwise.
         """
+        if stats is not None:
+            stats.nodes_visited += 1
+            stats.leaves_scanned += 1
+            stats.distance_computations += 1
         # TODO #3 - both target and self._value are Tuples of floats (e.g., (0.707, 0.707) or (1.0, 2.0, 3.0, 4.0))
         #           with the same (unspecified) number of floats in them. You need to find the distance between them
         #           via Pythagoras - the square root of the sum of the squares of the differences of the pairs.
-        distance = float('inf')  # replace this line.
+        if metric is None:
+            distance = math.sqrt(sum((t - v) ** 2 for t, v in zip(target, self._value)))
+        else:
+            distance = metric.distance(target, self._value)
 
         # ---------- put the "to do" #3 code above this line.
-        if distance < best_distance_so_far:
-            logging.info(f"Found an improvement: {distance=}")
+        if distance < best_distance_so_far and not self._is_deleted:
+            logging.info("Found an improvement: distance=%s", distance)
             if visualizer is not None:
                 visualizer.show_search_progress(target=target, best_point=self._value, wait_for_key=True)
             return self._value, distance
         else:
             return None, None
 
+    def distance_to(self, target: Tuple[float, ...], metric: Optional[DistanceMetric] = None) -> float:
+        if metric is None:
+            return math.sqrt(sum((t - v) ** 2 for t, v in zip(target, self._value)))
+        return metric.distance(target, self._value)
+
+    def gather_k_nearest(self,
+                         target: Tuple[float, ...],
+                         k: int,
+                         heap: List[Tuple[float, Tuple[float, ...]]],
+                         metric: Optional[DistanceMetric] = None,
+                         stats: Optional[SearchStats] = None) -> None:
+        if stats is not None:
+            stats.nodes_visited += 1
+            stats.leaves_scanned += 1
+            stats.distance_computations += 0 if self._is_deleted else 1
+        if not self._is_deleted:
+            self.offer_to_heap(self._value, self.distance_to(target, metric), k, heap)
+
+    def query_radius(self,
+                     target: Tuple[float, ...],
+                     radius: float,
+                     metric: Optional[DistanceMetric] = None) -> Iterator[Tuple[float, ...]]:
+        if not self._is_deleted and self.distance_to(target, metric) <= radius:
+            yield self._value
+
+    def count_radius(self, target: Tuple[float, ...], radius: float, metric: Optional[DistanceMetric] = None) -> int:
+        return 1 if not self._is_deleted and self.distance_to(target, metric) <= radius else 0
+
+    def query_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> Iterator[Tuple[float, ...]]:
+        if self.count_box(low, high) == 1:
+            yield self._value
+
+    def count_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> int:
+        if self._is_deleted:
+            return 0
+        return 1 if all(lo <= v <= hi for lo, v, hi in zip(low, self._value, high)) else 0
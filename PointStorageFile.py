@@ -0,0 +1,106 @@
+from typing import Dict, Optional
+
+import numpy as np
+
+STORAGE_FLOAT64 = "float64"  # 8 bytes per value; exact.
+STORAGE_FLOAT32 = "float32"  # 4 bytes per value; about 7 significant digits.
+STORAGE_UINT16 = "uint16"  # 2 bytes per value; each axis's range cut into 65,535 even steps.
+STORAGE_UINT8 = "uint8"  # 1 byte per value; each axis's range cut into 255 even steps.
+STORAGE_DTYPES: Dict[str, np.dtype] = {STORAGE_FLOAT64: np.dtype("<f8"),
+                                       STORAGE_FLOAT32: np.dtype("<f4"),
+                                       STORAGE_UINT16: np.dtype("<u2"),
+                                       STORAGE_UINT8: np.dtype("u1")}
+STORAGE_MODES = tuple(STORAGE_DTYPES)  # the order matters: snapshots record a mode by its position here.
+
+
+class PointStorage:
+    """
+    How the points of a FlatKDTree are held in memory: as float64, as float32, or scalar-quantized into uint16 or uint8
+    codes. A quantized value is offset + code * scale, with one offset and scale per axis, fitted so that the smallest
+    value on each axis gets code 0 and the largest gets the biggest code the type can hold.
+
+    Anything stored in fewer than 8 bytes comes back a little different from what went in; get_max_error says by how
+    much, at most, on each axis.
+    """
+
+    def __init__(self, mode: str = STORAGE_FLOAT64, scales: Optional[np.ndarray] = None,
+                 offsets: Optional[np.ndarray] = None):
+        """
+        :param mode: one of STORAGE_MODES.
+        :param scales: for the quantized modes, the size of one step of the codes on each axis; see fit.
+        :param offsets: for the quantized modes, the value that code 0 stands for on each axis.
+        """
+        if mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode {mode!r}; expected one of {STORAGE_MODES}.")
+        if self.is_quantized_mode(mode) and (scales is None or offsets is None):
+            raise ValueError(f"The {mode} storage mode needs a scale and offset for each axis.")
+        self._mode: str = mode
+        self._scales: Optional[np.ndarray] = None if scales is None else np.asarray(scales, dtype=float)
+        self._offsets: Optional[np.ndarray] = None if offsets is None else np.asarray(offsets, dtype=float)
+
+    @staticmethod
+    def is_quantized_mode(mode: str) -> bool:
+        return STORAGE_DTYPES[mode].kind == "u"
+
+    @staticmethod
+    def fit(points: np.ndarray, mode: str = STORAGE_FLOAT64) -> "PointStorage":
+        """
+        :param points: the (n, d) float array of points that will be stored.
+        :param mode: one of STORAGE_MODES.
+        :return: a PointStorage for that mode, whose scales and offsets (if it needs any) fit the range of the points on
+        each axis.
+        """
+        if mode not in STORAGE_MODES or not PointStorage.is_quantized_mode(mode):
+            return PointStorage(mode)
+        levels = np.iinfo(STORAGE_DTYPES[mode]).max
+        offsets = points.min(axis=0)
+        spans = points.max(axis=0) - offsets
+        # an axis on which every value is the same gets a scale of 1, so it still decodes to that one value.
+        scales = np.where(spans > 0, spans / levels, 1.0)
+        return PointStorage(mode, scales, offsets)
+
+    def get_mode(self) -> str:
+        return self._mode
+
+    def get_dtype(self) -> np.dtype:
+        return STORAGE_DTYPES[self._mode]
+
+    def get_scales(self) -> Optional[np.ndarray]:
+        return self._scales
+
+    def get_offsets(self) -> Optional[np.ndarray]:
+        return self._offsets
+
+    def is_exact(self) -> bool:
+        return self._mode == STORAGE_FLOAT64
+
+    def get_max_error(self, points: np.ndarray) -> np.ndarray:
+        """
+        :param points: the (n, d) float array of points this storage holds (or one like it).
+        :return: for each axis, the most by which a stored value can differ from the one that was encoded.
+        """
+        if self._scales is not None:
+            return self._scales / 2  # codes are rounded to the nearest step.
+        if self._mode == STORAGE_FLOAT32:
+            return np.abs(points).max(axis=0) * np.finfo(np.float32).eps / 2
+        return np.zeros(points.shape[1])
+
+    def encode(self, points: np.ndarray) -> np.ndarray:
+        """
+        :param points: an (n, d) float array of points.
+        :return: an (n, d) array of get_dtype() holding those points.
+        """
+        if self._scales is None:
+            return np.asarray(points, dtype=self.get_dtype())
+        levels = np.iinfo(self.get_dtype()).max
+        codes = np.rint((np.asarray(points, dtype=float) - self._offsets) / self._scales)
+        return np.clip(codes, 0, levels).astype(self.get_dtype())
+
+    def decode(self, stored: np.ndarray) -> np.ndarray:
+        """
+        :param stored: an array of get_dtype() made by encode, or any part of one.
+        :return: the float64 values it holds. (For float64 storage, that is stored itself, not a copy.)
+        """
+        if self._scales is None:
+            return np.asarray(stored, dtype=float)
+        return self._offsets + stored * self._scales
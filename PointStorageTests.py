@@ -0,0 +1,51 @@
+import random
+import unittest
+
+import numpy as np
+
+from PointStorageFile import PointStorage, STORAGE_MODES, STORAGE_FLOAT64, STORAGE_FLOAT32, STORAGE_UINT16, \
+    STORAGE_UINT8
+
+
+class PointStorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(23)
+        # the last axis holds a single value, so it has no range to quantize.
+        self.points = np.array([[random.uniform(-5, 5), random.uniform(0, 1000), 3.25] for _ in range(500)])
+
+    def test_round_trip_is_within_the_error(self):
+        for mode in STORAGE_MODES:
+            storage = PointStorage.fit(self.points, mode)
+            stored = storage.encode(self.points)
+            self.assertEqual(storage.get_dtype(), stored.dtype)
+            decoded = storage.decode(stored)
+            self.assertEqual(np.float64, decoded.dtype)
+            self.assertTrue(np.all(np.abs(decoded - self.points) <= storage.get_max_error(self.points) + 1e-12))
+            np.testing.assert_array_equal(np.full(len(self.points), 3.25), decoded[:, 2])
+            np.testing.assert_array_equal(decoded[:10], storage.decode(stored[:10]))
+        self.assertEqual(0.0, PointStorage.fit(self.points).get_max_error(self.points).max())
+
+    def test_quantized_codes_span_the_range(self):
+        for mode, levels in ((STORAGE_UINT16, 65535), (STORAGE_UINT8, 255)):
+            storage = PointStorage.fit(self.points, mode)
+            stored = storage.encode(self.points)
+            self.assertEqual([0, 0, 0], stored.min(axis=0).tolist())
+            self.assertEqual([levels, levels, 0], stored.max(axis=0).tolist())
+            np.testing.assert_allclose(np.ptp(self.points, axis=0)[:2] / levels, storage.get_scales()[:2])
+            # values beyond the fitted range are clipped to the nearest end of it.
+            self.assertEqual([0, levels, 0], storage.encode(np.array([[-99.0, 9999.0, 3.25]]))[0].tolist())
+        for mode in (STORAGE_FLOAT64, STORAGE_FLOAT32):
+            self.assertIsNone(PointStorage.fit(self.points, mode).get_scales())
+        self.assertTrue(PointStorage.fit(self.points).is_exact())
+        self.assertFalse(PointStorage.fit(self.points, STORAGE_FLOAT32).is_exact())
+
+    def test_bad_modes(self):
+        with self.assertRaises(ValueError):
+            PointStorage("float16")
+        with self.assertRaises(ValueError):
+            PointStorage(STORAGE_UINT8)  # has no scales or offsets.
+
+
+if __name__ == '__main__':
+    unittest.main()
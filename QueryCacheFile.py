@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+from DistanceMetricsFile import DistanceMetric
+
+DEFAULT_CACHE_SIZE = 1024  # the most query results a QueryCache keeps at once.
+
+
+class QueryCache:
+    """
+    A least-recently-used cache of nearest and k-nearest search results, in front of a KDTree or FlatKDTree. Repeated
+    targets are answered from the cache without walking the tree. The tree's get_version() is checked on every lookup,
+    and the whole cache is emptied as soon as it changes, so results from before an insert, delete or rebuild are
+    never served.
+
+    Like the trees, a QueryCache may be shared by many threads: its entries and counters are only touched under a lock,
+    but the searches themselves run outside it, so several misses can be searched for at once.
+    """
+
+    def __init__(self, tree, max_size: int = DEFAULT_CACHE_SIZE, resolution: Optional[float] = None):
+        """
+        :param tree: the tree to search: anything with get_version, find_nearest and find_k_nearest, like KDTree or
+        FlatKDTree (and find_k_nearest_rows, to use that).
+        :param max_size: the most results to keep; the least recently used result is dropped to make room for a new one.
+        :param resolution: if not None, each target is snapped to the nearest multiple of this on every axis before it
+        is searched for, so that all the targets in a cell of that size share one cache entry. The results are then
+        those for the snapped target, and distances are measured from it, not from the original target.
+        """
+        if max_size < 1:
+            raise ValueError(f"The cache must hold at least one result, but max_size was {max_size}.")
+        self._tree = tree
+        self._max_size: int = max_size
+        self._resolution: Optional[float] = resolution
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()  # least recently used first.
+        self._tree_version: int = tree.get_version()
+        self._num_hits: int = 0
+        self._num_misses: int = 0
+        self._num_invalidations: int = 0
+        self._lock = threading.Lock()
+
+    def get_num_hits(self) -> int:
+        return self._num_hits
+
+    def get_num_misses(self) -> int:
+        return self._num_misses
+
+    def get_num_invalidations(self) -> int:
+        """
+        :return: how many times the cache has been emptied because the tree changed (or clear() was called).
+        """
+        return self._num_invalidations
+
+    def get_hit_rate(self) -> float:
+        lookups = self._num_hits + self._num_misses
+        return 0.0 if lookups == 0 else self._num_hits / lookups
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._num_invalidations += 1
+
+    def snap(self, target: Tuple[float, ...]) -> Tuple[float, ...]:
+        """
+        :return: the target as it is searched for and cached: unchanged, or rounded to the cache's resolution.
+        """
+        if self._resolution is None:
+            return tuple(target)
+        return tuple(round(value / self._resolution) * self._resolution for value in target)
+
+    def find_nearest(self,
+                     target: Tuple[float, ...],
+                     metric: Optional[DistanceMetric] = None) -> Tuple[Optional[Tuple[float, ...]], Optional[float]]:
+        return self._lookup(("nearest", metric), target,
+                            lambda snapped: self._tree.find_nearest(snapped, metric=metric))
+
+    def find_k_nearest(self,
+                       target: Tuple[float, ...],
+                       k: int,
+                       metric: Optional[DistanceMetric] = None) -> List[Tuple[Tuple[float, ...], float]]:
+        return list(self._lookup(("k_nearest", k, metric), target,
+                                 lambda snapped: tuple(self._tree.find_k_nearest(snapped, k, metric=metric))))
+
+    def find_k_nearest_rows(self,
+                            target: Tuple[float, ...],
+                            k: int,
+                            metric: Optional[DistanceMetric] = None) -> List[Tuple[int, float]]:
+        return list(self._lookup(("k_nearest_rows", k, metric), target,
+                                 lambda snapped: tuple(self._tree.find_k_nearest_rows(snapped, k, metric=metric))))
+
+    def _lookup(self,
+                query: Tuple[Hashable, ...],
+                target: Tuple[float, ...],
+                search: Callable[[Tuple[float, ...]], Any]) -> Any:
+        """
+        returns the cached result of this query for this target, if there is one; otherwise runs the search, caches
+        its result and returns it.
+        :param query: what kind of search this is, and its settings apart from the target.
+        :param target: the target being searched for.
+        :param search: runs the search on the tree for a (snapped) target. Its result must not be modified later, as it
+        is shared by every lookup that hits it.
+        :return: the search's result.
+        """
+        snapped = self.snap(target)
+        key = (query, snapped)
+        with self._lock:
+            version = self._tree.get_version()
+            if version != self._tree_version:
+                self._clear()
+                self._tree_version = version
+            if key in self._entries:
+                self._num_hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self._num_misses += 1
+
+        result = search(snapped)  # outside the lock, so other threads' lookups needn't wait for this search.
+        with self._lock:
+            # if the tree changed during the search, the result may be from before the change, so it isn't kept.
+            if self._tree_version == version and self._tree.get_version() == version:
+                self._entries[key] = result
+                if len(self._entries) > self._max_size:
+                    self._entries.popitem(last=False)
+        return result
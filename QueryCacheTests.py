@@ -0,0 +1,69 @@
+import random
+import unittest
+
+from DistanceMetricsFile import MANHATTAN
+from FlatKDTreeFile import FlatKDTree
+from KDTreeFile import KDTree
+from QueryCacheFile import QueryCache
+
+
+class QueryCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(21)
+        self.data = {tuple(float(random.randrange(0, 100)) for _ in range(3)) for _ in range(200)}
+        self.tree = KDTree(leaf_size=4)
+        self.tree.build(self.data)
+
+    def test_hits_and_misses(self):
+        cache = QueryCache(self.tree)
+        target = (10.0, 20.0, 30.0)
+        self.assertEqual(self.tree.find_nearest(target), cache.find_nearest(target))
+        self.assertEqual(self.tree.find_nearest(target), cache.find_nearest(target))
+        self.assertEqual(self.tree.find_k_nearest(target, 3), cache.find_k_nearest(target, 3))
+        self.assertEqual(self.tree.find_k_nearest(target, 3, MANHATTAN), cache.find_k_nearest(target, 3, MANHATTAN))
+        self.assertEqual(self.tree.find_k_nearest(target, 3), cache.find_k_nearest(target, 3))
+        self.assertEqual((2, 3), (cache.get_num_hits(), cache.get_num_misses()))
+        self.assertAlmostEqual(0.4, cache.get_hit_rate())
+
+    def test_least_recently_used_is_dropped(self):
+        cache = QueryCache(self.tree, max_size=2)
+        cache.find_nearest((1.0, 1.0, 1.0))
+        cache.find_nearest((2.0, 2.0, 2.0))
+        cache.find_nearest((1.0, 1.0, 1.0))
+        cache.find_nearest((3.0, 3.0, 3.0))  # drops (2, 2, 2), which was used longest ago.
+        self.assertEqual(2, len(cache))
+        cache.find_nearest((1.0, 1.0, 1.0))
+        self.assertEqual(2, cache.get_num_hits())
+        cache.find_nearest((2.0, 2.0, 2.0))
+        self.assertEqual(2, cache.get_num_hits())
+
+    def test_resolution_shares_entries(self):
+        cache = QueryCache(self.tree, resolution=0.5)
+        first = cache.find_nearest((10.1, 20.1, 30.1))
+        self.assertEqual(first, cache.find_nearest((9.9, 19.8, 30.2)))
+        self.assertEqual(self.tree.find_nearest((10.0, 20.0, 30.0)), first)
+        self.assertEqual(1, cache.get_num_hits())
+
+    def test_mutation_invalidates(self):
+        cache = QueryCache(self.tree)
+        target = (50.5, 50.5, 50.5)
+        cache.find_nearest(target)
+        self.assertTrue(self.tree.insert(target))
+        self.assertEqual((target, 0.0), cache.find_nearest(target))
+        self.assertTrue(self.tree.delete(target))
+        self.assertNotEqual(target, cache.find_nearest(target)[0])
+        self.assertEqual((0, 3, 2), (cache.get_num_hits(), cache.get_num_misses(), cache.get_num_invalidations()))
+
+        flat = FlatKDTree(leaf_size=4)
+        flat.build_tree(self.data)
+        flat_cache = QueryCache(flat)
+        rows = flat_cache.find_k_nearest_rows(target, 2)
+        self.assertEqual(rows, flat_cache.find_k_nearest_rows(target, 2))
+        flat.build_tree(self.data | {target})
+        self.assertEqual(0.0, flat_cache.find_k_nearest_rows(target, 2)[0][1])
+        self.assertEqual(1, flat_cache.get_num_invalidations())
+
+
+if __name__ == '__main__':
+    unittest.main()
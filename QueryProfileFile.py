@@ -0,0 +1,355 @@
+import argparse
+import json
+import random
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from AbstractNodeFile import AbstractNode
+from DistanceMetricsFile import DistanceMetric
+from SearchStatsFile import SearchStats, SEARCH_COUNTERS, measure_tree
+from SplitterNodeFile import SplitterNode
+
+PROFILE_LEAF_SIZE = 8
+NUM_PROFILE_QUERIES = 1000
+NUM_PROFILE_POINTS = 20000
+POOR_PRUNE_RATE = 0.25  # a splitter or axis that skips its far side less often than this is flagged in the report.
+PROFILE_MIN_TESTS = 20  # ... but only once it has been tested this often, so that a few unlucky queries don't count.
+REPORT_MAX_DEPTH = 10  # the report lists each node down to this depth; deeper ones only count in the totals.
+MAX_FLAGGED_NODES = 20
+HOTTEST_LEAVES = 10  # how many of the most-visited leaves format_report lists.
+HISTOGRAM_WIDTH = 50  # the length, in characters, of the longest bar in format_report's histograms.
+COMPARED_NODE_FIELDS = ["visits", "explored", "pruned"]
+
+
+class QueryProfile:
+    """
+    Counts, node by node, what SplitterNode.find_nearest does over a workload of queries: how often each splitter and
+    leaf is visited, and how often each splitter searches or skips the far side of its threshold. build_report turns
+    the counts into a heat map of the tree, with prune rates per axis, depth histograms and flags on the splitters whose
+    far-side test rarely saves any work.
+
+    A profile is made for one tree and reads its shape once, when it is made, so the tree shouldn't change while it is
+    being profiled. Only find_nearest reports to the profile; the other searches still fill in the SearchStats totals.
+    """
+
+    def __init__(self, root: Optional[AbstractNode]):
+        """
+        :param root: the root of the tree to profile (a SplitterNode, usually), or None for an empty tree.
+        """
+        self._root: Optional[AbstractNode] = root
+        # the nodes in preorder, so that each one comes before its children. Holding them keeps their ids from being
+        # reused while the profile uses those ids to look them up.
+        self._nodes: List[AbstractNode] = []
+        self._paths: List[str] = []  # how to reach each node from the root: "" for the root, then "L"/"R" per step.
+        self._depths: List[int] = []  # 1 for the root, as in measure_tree.
+        self._sizes: List[int] = []  # the data at or below each node.
+        self._index: Dict[int, int] = {}  # id(node) -> its position in the lists above.
+        parents: List[int] = []
+        to_visit: List[Tuple[AbstractNode, str, int, int]] = [] if root is None else [(root, "", 1, -1)]
+        while to_visit:
+            node, path, depth, parent = to_visit.pop()
+            self._index[id(node)] = len(self._nodes)
+            self._nodes.append(node)
+            self._paths.append(path)
+            self._depths.append(depth)
+            self._sizes.append(len(node.get_values()) if node.is_a_leaf() else 0)
+            parents.append(parent)
+            if not node.is_a_leaf():
+                for child, step in ((node.get_right(), "R"), (node.get_left(), "L")):  # so that the left pops first.
+                    if child is not None:
+                        to_visit.append((child, path + step, depth + 1, len(self._nodes) - 1))
+        for position in range(len(self._nodes) - 1, 0, -1):  # children before parents, to total up the sizes.
+            self._sizes[parents[position]] += self._sizes[position]
+
+        self._visits: List[int] = [0] * len(self._nodes)
+        self._explored: List[int] = [0] * len(self._nodes)  # times each splitter searched the far side of its split.
+        self._pruned: List[int] = [0] * len(self._nodes)  # times each splitter skipped it.
+        self._query_depths: List[int] = []  # the deepest node each query reached.
+        self._stats: SearchStats = SearchStats(self)
+
+    def get_root(self) -> Optional[AbstractNode]:
+        return self._root
+
+    def get_stats(self) -> SearchStats:
+        """
+        :return: the totals, over every query run so far, of the usual search counters.
+        """
+        return self._stats
+
+    def get_num_queries(self) -> int:
+        return len(self._query_depths)
+
+    def run_query(self, target: Tuple[float, ...], metric: Optional[DistanceMetric] = None) \
+            -> Tuple[Optional[Tuple[float, ...]], Optional[float]]:
+        """
+        searches the tree for the datum nearest the target, counting the search in this profile.
+        :return: the (datum, distance) closest to the target, or (None, None) if the tree is empty.
+        """
+        self._query_depths.append(0)
+        if self._root is None:
+            return None, None
+        return self._root.find_nearest(target, None, float('inf'), metric=metric, stats=self._stats)
+
+    def count_visit(self, node: AbstractNode) -> None:
+        position = self._index[id(node)]
+        self._visits[position] += 1
+        if self._query_depths and self._depths[position] > self._query_depths[-1]:
+            self._query_depths[-1] = self._depths[position]
+
+    def count_explored(self, splitter: AbstractNode) -> None:
+        self._explored[self._index[id(splitter)]] += 1
+
+    def count_pruned(self, splitter: AbstractNode) -> None:
+        self._pruned[self._index[id(splitter)]] += 1
+
+    def node_entry(self, position: int) -> Dict[str, object]:
+        """
+        :return: what the report says about the node at this position: where it sits, how much it holds, how hot it is
+        and, for a splitter, how often its far-side test pruned.
+        """
+        node = self._nodes[position]
+        entry: Dict[str, object] = {"depth": self._depths[position],
+                                    "size": self._sizes[position],
+                                    "visits": self._visits[position],
+                                    "heat": self._visits[position] / max(1, self.get_num_queries())}
+        if node.is_a_leaf():
+            entry["leaf"] = True
+            return entry
+        # the imbalance of a split, as in BuildStats.get_max_imbalance: 0 for even halves, 1 for all on one side.
+        left, right = (0 if child is None else self._sizes[self._index[id(child)]]
+                       for child in (node.get_left(), node.get_right()))
+        tests = self._explored[position] + self._pruned[position]
+        entry.update({"leaf": False,
+                      "axis": node.get_axis(),
+                      "threshold": node.get_threshold(),
+                      "imbalance": abs(left - right) / (left + right) if left + right > 0 else 0.0,
+                      "explored": self._explored[position],
+                      "pruned": self._pruned[position],
+                      "prune_rate": self._pruned[position] / tests if tests > 0 else None})
+        return entry
+
+    def build_report(self, max_depth: int = REPORT_MAX_DEPTH) -> Dict[str, object]:
+        """
+        sums up the profile as a dictionary, ready to be saved as json, which holds nothing (such as times) that would
+        differ between two runs of the same workload on the same tree, so that the reports of two versions of an index
+        can be diffed, or lined up with compare_reports.
+        :param max_depth: the "nodes" section lists the nodes down to this depth, keyed by path; the other sections
+        count every node.
+        :return: a dictionary of
+            "queries": the number of queries run,
+            "search": the average of each SearchStats counter per query,
+            "tree": the measure_tree shape of the tree,
+            "axes": for each axis (as a string), its splitters, the far-side tests they made, how many of those
+                    pruned, and the prune_rate,
+            "depths": histograms of {depth (as a string): count} of the leaves of the tree ("leaves"), of the visits
+                      to nodes ("visits") and of the deepest node reached by each query ("queries"),
+            "nodes": {path: node_entry} for the visited nodes down to max_depth,
+            "flags": the "axes" and "nodes" that were tested at least PROFILE_MIN_TESTS times but pruned less than
+                     POOR_PRUNE_RATE of the time; the nodes (at most MAX_FLAGGED_NODES) most-tested first.
+        """
+        num_queries = self.get_num_queries()
+        axes: Dict[int, Dict[str, object]] = {}
+        leaf_depths: Dict[int, int] = {}
+        visit_depths: Dict[int, int] = {}
+        query_depths: Dict[int, int] = {}
+        for depth in self._query_depths:
+            query_depths[depth] = query_depths.get(depth, 0) + 1
+        nodes: Dict[str, Dict[str, object]] = {}
+        poor_nodes: List[Tuple[int, str, int]] = []  # (-tests, path, position), to sort the most-tested first.
+        for position, node in enumerate(self._nodes):
+            depth = self._depths[position]
+            visit_depths[depth] = visit_depths.get(depth, 0) + self._visits[position]
+            if node.is_a_leaf():
+                leaf_depths[depth] = leaf_depths.get(depth, 0) + 1
+            else:
+                axis = axes.setdefault(node.get_axis(), {"splitters": 0, "tests": 0, "pruned": 0})
+                tests = self._explored[position] + self._pruned[position]
+                axis["splitters"] += 1
+                axis["tests"] += tests
+                axis["pruned"] += self._pruned[position]
+                if tests >= PROFILE_MIN_TESTS and self._pruned[position] < POOR_PRUNE_RATE * tests:
+                    poor_nodes.append((-tests, self._paths[position], position))
+            if depth <= max_depth and self._visits[position] > 0:
+                nodes[self._paths[position]] = self.node_entry(position)
+        for axis in axes.values():
+            axis["prune_rate"] = axis["pruned"] / axis["tests"] if axis["tests"] > 0 else None
+
+        flagged_nodes = []
+        for _, path, position in sorted(poor_nodes)[:MAX_FLAGGED_NODES]:
+            entry = self.node_entry(position)
+            flagged_nodes.append({"path": path, "depth": entry["depth"], "axis": entry["axis"],
+                                  "tests": entry["explored"] + entry["pruned"], "prune_rate": entry["prune_rate"]})
+        flagged_axes = [{"axis": axis, "tests": counts["tests"], "prune_rate": counts["prune_rate"]}
+                        for axis, counts in sorted(axes.items())
+                        if counts["tests"] >= PROFILE_MIN_TESTS and counts["prune_rate"] < POOR_PRUNE_RATE]
+
+        def histogram(counts: Dict[int, int]) -> Dict[str, int]:
+            return {str(depth): counts[depth] for depth in sorted(counts)}
+
+        totals = self._stats.as_dict()
+        return {"queries": num_queries,
+                "search": {name: totals[name] / max(1, num_queries) for name in SEARCH_COUNTERS},
+                "tree": measure_tree(self._root).as_dict(),
+                "axes": {str(axis): axes[axis] for axis in sorted(axes)},
+                "depths": {"leaves": histogram(leaf_depths),
+                           "visits": histogram(visit_depths),
+                           "queries": histogram(query_depths)},
+                "nodes": nodes,
+                "flags": {"axes": flagged_axes, "nodes": flagged_nodes}}
+
+
+def profile_queries(root: Optional[AbstractNode],
+                    targets: Sequence[Tuple[float, ...]],
+                    metric: Optional[DistanceMetric] = None) -> QueryProfile:
+    """
+    runs a workload of nearest-neighbor queries against a tree, counting what each one does.
+    :param root: the root of the tree, such as KDTree.get_root(), or None for an empty tree.
+    :param targets: the queries to run.
+    :param metric: how to measure distance; None means Euclidean distance.
+    :return: the QueryProfile of the workload; see QueryProfile.build_report.
+    """
+    profile = QueryProfile(root)
+    for target in targets:
+        profile.run_query(target, metric)
+    return profile
+
+
+def format_path(path: str) -> str:
+    return path if path != "" else "(root)"
+
+
+def format_rate(rate: Optional[float]) -> str:
+    return "-" if rate is None else f"{100 * rate:.1f}%"
+
+
+def format_histogram(title: str, counts: Dict[str, int]) -> List[str]:
+    lines = [title]
+    biggest = max(counts.values(), default=0)
+    for depth, count in counts.items():
+        bar = "#" * (round(HISTOGRAM_WIDTH * count / biggest) if biggest > 0 else 0)
+        lines.append(f"  {depth:>4} {count:>10} {bar}")
+    return lines
+
+
+def format_report(report: Dict[str, object]) -> str:
+    """
+    :param report: a dictionary made by QueryProfile.build_report (or loaded back from its json).
+    :return: the report laid out as text, for reading in a terminal.
+    """
+    lines = [f"Query profile: {report['queries']} queries on a tree of "
+             + ", ".join(f"{name}={value:.4g}" if isinstance(value, float) else f"{name}={value}"
+                         for name, value in report["tree"].items()),
+             "Per query: " + ", ".join(f"{name}={value:.1f}" for name, value in report["search"].items()),
+             "",
+             "Far-side tests by axis:",
+             f"  {'axis':>4} {'splitters':>10} {'tests':>10} {'pruned':>10} {'rate':>7}"]
+    for axis, counts in report["axes"].items():
+        lines.append(f"  {axis:>4} {counts['splitters']:>10} {counts['tests']:>10} {counts['pruned']:>10} "
+                     f"{format_rate(counts['prune_rate']):>7}")
+    lines.append("")
+    lines.extend(format_histogram("Leaves of the tree by depth:", report["depths"]["leaves"]))
+    lines.extend(format_histogram("Node visits by depth:", report["depths"]["visits"]))
+    lines.extend(format_histogram("Queries by deepest node reached:", report["depths"]["queries"]))
+    lines.append("")
+
+    leaves = sorted(((entry["visits"], path) for path, entry in report["nodes"].items() if entry["leaf"]),
+                    key=lambda pair: (-pair[0], pair[1]))[:HOTTEST_LEAVES]
+    lines.append("Hottest leaves (of those listed, down to the report's depth):")
+    for visits, path in leaves:
+        entry = report["nodes"][path]
+        lines.append(f"  {format_path(path):<24} visits={visits} heat={entry['heat']:.3f} size={entry['size']}")
+    lines.append("")
+
+    lines.append(f"Flagged axes (tested at least {PROFILE_MIN_TESTS} times, pruning under "
+                 f"{format_rate(POOR_PRUNE_RATE)}):")
+    lines.extend(f"  axis {flag['axis']}: tests={flag['tests']} rate={format_rate(flag['prune_rate'])}"
+                 for flag in report["flags"]["axes"])
+    lines.append("Flagged splitters:")
+    lines.extend(f"  {format_path(flag['path']):<24} depth={flag['depth']} axis={flag['axis']} "
+                 f"tests={flag['tests']} rate={format_rate(flag['prune_rate'])}"
+                 for flag in report["flags"]["nodes"])
+    return "\n".join(lines)
+
+
+def compare_reports(old_report: Dict[str, object], new_report: Dict[str, object]) -> List[Dict[str, object]]:
+    """
+    lines up the reports of two profiles - of two versions of an index, say, under the same workload - to spot where
+    the searches got more or less expensive.
+    :return: a row of new / old for each per-query search counter; then, for each axis in both reports, the ratio of its
+    tests and the change in its prune rate; then the same, plus the ratio of the visits, for each node path that both
+    reports list.
+    """
+    comparisons: List[Dict[str, object]] = []
+    search = {"name": "search"}
+    for name in SEARCH_COUNTERS:
+        if old_report["search"].get(name, 0) > 0 and name in new_report["search"]:
+            search[f"{name}_ratio"] = new_report["search"][name] / old_report["search"][name]
+    comparisons.append(search)
+
+    def compare(name: str, old: Dict[str, object], new: Dict[str, object], fields: List[str]) -> Dict[str, object]:
+        comparison: Dict[str, object] = {"name": name}
+        for field in fields:
+            if old.get(field) and field in new:
+                comparison[f"{field}_ratio"] = new[field] / old[field]
+        if old.get("prune_rate") is not None and new.get("prune_rate") is not None:
+            comparison["prune_rate_change"] = new["prune_rate"] - old["prune_rate"]
+        return comparison
+
+    for axis, new in new_report["axes"].items():
+        if axis in old_report["axes"]:
+            comparisons.append(compare(f"axis {axis}", old_report["axes"][axis], new, ["tests"]))
+    for path, new in new_report["nodes"].items():
+        if path in old_report["nodes"]:
+            comparisons.append(compare(format_path(path), old_report["nodes"][path], new, COMPARED_NODE_FIELDS))
+    return comparisons
+
+
+def main(arguments: Optional[List[str]] = None):
+    # imported here, since the benchmark module pulls in a great deal that the profile itself doesn't need.
+    from KDTreeBenchmarkFile import WEATHER_FILE, load_weather_data, make_duplicate_heavy_data, make_synthetic_data, \
+        make_targets
+    from WeatherRunnerFile import WEATHER_METRIC
+
+    parser = argparse.ArgumentParser(description="Profiles where k-d tree nearest-neighbor searches spend their time.")
+    parser.add_argument("--data", choices=["weather", "synthetic", "duplicates"], default="weather")
+    parser.add_argument("--file", default=WEATHER_FILE, help="the weather data, for --data weather")
+    parser.add_argument("--points", type=int, default=NUM_PROFILE_POINTS, help="synthetic data set size")
+    parser.add_argument("--dimension", type=int, default=3, help="synthetic dimension")
+    parser.add_argument("--queries", type=int, default=NUM_PROFILE_QUERIES)
+    parser.add_argument("--leaf-size", type=int, default=PROFILE_LEAF_SIZE)
+    parser.add_argument("--max-depth", type=int, default=REPORT_MAX_DEPTH, help="list nodes down to this depth")
+    parser.add_argument("--seed", type=int, default=0, help="seeds the data and queries, so that runs can be compared")
+    parser.add_argument("--output", help="where to write the report as json")
+    parser.add_argument("--compare", help="a previous report's json file, to print each measurement's ratio to it")
+    options = parser.parse_args(arguments)
+
+    random.seed(options.seed)
+    metric: Optional[DistanceMetric] = None
+    if options.data == "weather":
+        data: Set[Tuple[float, ...]] = load_weather_data(options.file)
+        metric = WEATHER_METRIC
+    elif options.data == "synthetic":
+        data = make_synthetic_data(options.points, options.dimension)
+    else:
+        data = make_duplicate_heavy_data(options.points, max(3, options.dimension))
+    targets = make_targets(data, options.queries)
+    root = SplitterNode(0)
+    root.build_subtree(data, leaf_size=options.leaf_size)
+
+    report = profile_queries(root, targets, metric).build_report(options.max_depth)
+    print(format_report(report))
+    if options.output is not None:
+        with open(options.output, "w") as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+        print(f"Wrote the report to {options.output}.")
+
+    if options.compare is not None:
+        with open(options.compare) as old_file:
+            old_report = json.load(old_file)
+        print(f"Compared with {options.compare} (new / old):")
+        for comparison in compare_reports(old_report, report):
+            print("  ".join(f"{name}={value:.4g}" if isinstance(value, float) else f"{name}={value}"
+                            for name, value in comparison.items()))
+
+
+if __name__ == "__main__":
+    main()
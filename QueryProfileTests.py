@@ -0,0 +1,102 @@
+import json
+import random
+import unittest
+
+from DistanceMetricsFile import MANHATTAN
+from QueryProfileFile import QueryProfile, profile_queries, format_report, compare_reports, POOR_PRUNE_RATE
+from SearchStatsFile import SearchStats, measure_tree
+from SplitterNodeFile import SplitterNode
+
+
+class QueryProfileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(29)
+        self.data = {tuple(random.uniform(0, 100) for _ in range(3)) for _ in range(800)}
+        self.targets = [tuple(random.uniform(0, 100) for _ in range(3)) for _ in range(100)]
+
+    @staticmethod
+    def build(data, leaf_size):
+        root = SplitterNode(0)
+        root.build_subtree(data, leaf_size=leaf_size)
+        return root
+
+    def test_counts_match_search_stats(self):
+        for leaf_size in (1, 8):
+            root = self.build(self.data, leaf_size)
+            for metric in (None, MANHATTAN):
+                profile = QueryProfile(root)
+                for target in self.targets:
+                    # the profile changes nothing about the search itself.
+                    self.assertEqual(root.find_nearest(target, None, float('inf'), metric=metric),
+                                     profile.run_query(target, metric))
+                stats = SearchStats()
+                for target in self.targets:
+                    root.find_nearest(target, None, float('inf'), metric=metric, stats=stats)
+                self.assertEqual(stats.as_dict(), profile.get_stats().as_dict())
+
+                report = profile.build_report(max_depth=100)
+                self.assertEqual(len(self.targets), report["queries"])
+                self.assertEqual(measure_tree(root).as_dict(), report["tree"])
+                self.assertEqual(stats.nodes_visited, sum(report["depths"]["visits"].values()))
+                self.assertEqual(stats.nodes_visited, sum(entry["visits"] for entry in report["nodes"].values()))
+                self.assertEqual(stats.branches_pruned, sum(axis["pruned"] for axis in report["axes"].values()))
+                self.assertEqual(stats.branches_explored + stats.branches_pruned,
+                                 sum(axis["tests"] for axis in report["axes"].values()))
+                self.assertEqual(measure_tree(root).get_num_leaves(), sum(report["depths"]["leaves"].values()))
+                self.assertEqual(len(self.targets), sum(report["depths"]["queries"].values()))
+
+                root_entry = report["nodes"][""]
+                self.assertEqual(len(self.targets), root_entry["visits"])
+                self.assertEqual(1.0, root_entry["heat"])
+                self.assertEqual(len(self.data), root_entry["size"])
+                self.assertEqual(len(self.data), report["nodes"]["L"]["size"] + report["nodes"]["R"]["size"])
+
+    def test_flags_poor_pruning(self):
+        # the data are spread over only 0-1 on axis 1, much less than the distance to a nearest neighbor, so every
+        # target is close to every axis 1 threshold and those splitters can hardly ever skip their far sides. The
+        # other axes are spread widely enough for most of their thresholds to be far from any one target.
+        data = {(random.uniform(0, 100), random.uniform(0, 1), random.uniform(-1000, 1000)) for _ in range(800)}
+        targets = [(random.uniform(0, 100), random.uniform(0, 1), 0.0) for _ in range(100)]
+        root = self.build(data, 4)
+        report = profile_queries(root, targets, MANHATTAN).build_report()
+        rates = {axis: counts["prune_rate"] for axis, counts in report["axes"].items()}
+        self.assertGreater(rates["2"], POOR_PRUNE_RATE)
+        self.assertIn(1, [flag["axis"] for flag in report["flags"]["axes"]])
+        for flag in report["flags"]["nodes"]:
+            self.assertLess(flag["prune_rate"], POOR_PRUNE_RATE)
+        self.assertGreater(len(report["flags"]["nodes"]), 0)
+        self.assertIn("Flagged splitters:", format_report(report))
+
+    def test_report_round_trip_and_compare(self):
+        # the presorted build always builds the same tree from the same rows, where build_subtree samples at random.
+        trees = []
+        for _ in range(2):
+            trees.append(SplitterNode(0))
+            trees[-1].build_subtree_presorted(sorted(self.data), leaf_size=4)
+        first, second = (profile_queries(root, self.targets).build_report(max_depth=4) for root in trees)
+        self.assertEqual(json.dumps(first, sort_keys=True), json.dumps(second, sort_keys=True))
+        loaded = json.loads(json.dumps(first))
+        self.assertEqual(format_report(first), format_report(loaded))
+        self.assertTrue(all(entry["depth"] <= 4 for entry in first["nodes"].values()))
+
+        comparisons = compare_reports(loaded, second)
+        self.assertEqual("search", comparisons[0]["name"])
+        self.assertAlmostEqual(1.0, comparisons[0]["nodes_visited_ratio"])
+        for comparison in comparisons[1:]:
+            self.assertAlmostEqual(0.0, comparison.get("prune_rate_change", 0.0))
+
+        bigger_leaves = profile_queries(self.build(self.data, 16), self.targets).build_report()
+        self.assertLess(compare_reports(first, bigger_leaves)[0]["nodes_visited_ratio"], 1.0)
+
+    def test_empty_tree(self):
+        profile = profile_queries(None, self.targets)
+        self.assertEqual((None, None), profile.run_query(self.targets[0]))
+        report = profile.build_report()
+        self.assertEqual(len(self.targets) + 1, report["queries"])
+        self.assertEqual({}, report["nodes"])
+        format_report(report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:  # AbstractNodeFile imports this file, so this import is only for the type hints.
+    from AbstractNodeFile import AbstractNode
+    from QueryProfileFile import QueryProfile
+
+SEARCH_COUNTERS = ("nodes_visited", "leaves_scanned", "distance_computations", "branches_explored", "branches_pruned")
+
+
+class SearchStats:
+    """
+    Counters describing the work done by one or more searches. Pass one as the stats argument of find_nearest,
+    find_k_nearest or find_nearest_approximate and the search adds to it as it goes; leave stats as None (the default)
+    and the only cost is one "is not None" check per node visited.
+
+    The counters are plain public attributes, rather than private with getters like most of this code, since they are
+    incremented on the search's hot path, where every method call shows up in the timings.
+
+    Given a QueryProfile as well, SplitterNode.find_nearest also tells it which nodes it visited and which branches it
+    searched or skipped at each one; see QueryProfileFile.
+    """
+    __slots__ = SEARCH_COUNTERS + ("profile",)
+
+    def __init__(self, profile: Optional["QueryProfile"] = None):
+        self.nodes_visited: int = 0  # splitters and leaves entered.
+        self.leaves_scanned: int = 0  # leaves whose data were checked.
+        self.distance_computations: int = 0  # distances measured from the target to a datum.
+        self.branches_explored: int = 0  # far sides of a threshold that were searched, because they might be closer.
+        self.branches_pruned: int = 0  # far sides of a threshold that were skipped, because they couldn't be.
+        self.profile: Optional["QueryProfile"] = profile  # if not None, also counts what happened at each node.
+
+    def reset(self) -> None:
+        for name in SEARCH_COUNTERS:
+            setattr(self, name, 0)
+
+    def add(self, other: "SearchStats") -> None:
+        """
+        adds the counts in other to this one's, to total up several searches' stats.
+        """
+        for name in SEARCH_COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in SEARCH_COUNTERS}
+
+    def __repr__(self):
+        return f"SearchStats({', '.join(f'{name}={value}' for name, value in self.as_dict().items())})"
+
+
+class BuildStats:
+    """
+    The shape of a built tree: how big, how deep and how evenly split it is. Measured after the build by measure_tree,
+    so it costs the build itself nothing.
+    """
+
+    def __init__(self, num_nodes: int, num_leaves: int, num_data: int, max_depth: int, mean_leaf_depth: float,
+                 max_imbalance: float):
+        self._num_nodes = num_nodes
+        self._num_leaves = num_leaves
+        self._num_data = num_data
+        self._max_depth = max_depth
+        self._mean_leaf_depth = mean_leaf_depth
+        self._max_imbalance = max_imbalance
+
+    def get_num_nodes(self) -> int:
+        return self._num_nodes
+
+    def get_num_leaves(self) -> int:
+        return self._num_leaves
+
+    def get_num_data(self) -> int:
+        return self._num_data
+
+    def get_max_depth(self) -> int:
+        """
+        :return: the number of nodes on the longest path from the root to a leaf.
+        """
+        return self._max_depth
+
+    def get_mean_leaf_depth(self) -> float:
+        return self._mean_leaf_depth
+
+    def get_max_imbalance(self) -> float:
+        """
+        :return: the worst split in the tree, as |left data - right data| / all data below that splitter: 0 for a split
+        into two equal halves, 1 for a splitter with all of its data on one side.
+        """
+        return self._max_imbalance
+
+    def as_dict(self) -> Dict[str, float]:
+        return {"nodes": self._num_nodes, "leaves": self._num_leaves, "data": self._num_data,
+                "max_depth": self._max_depth, "mean_leaf_depth": self._mean_leaf_depth,
+                "max_imbalance": self._max_imbalance}
+
+    def __repr__(self):
+        return f"BuildStats({', '.join(f'{name}={value}' for name, value in self.as_dict().items())})"
+
+
+def measure_tree(root: Optional["AbstractNode"]) -> BuildStats:
+    """
+    walks a tree of nodes (SplitterNode/PointNode/BucketNode, or a FlatKDTree's get_root()) without recursion and
+    measures its shape.
+    :param root: the root of the tree, or None for an empty tree.
+    :return: the tree's BuildStats.
+    """
+    num_nodes, num_leaves, max_depth, total_leaf_depth, max_imbalance = 0, 0, 0, 0, 0.0
+    sizes: Dict[int, int] = {}  # id(node) -> the data below it, for nodes whose parents aren't finished yet.
+    # entries are (node, depth, None) the first time a node is reached, and (node, depth, its children) once its
+    # children have been queued, to finish it after them. Holding the children here keeps their ids from being reused.
+    to_visit: List[Tuple["AbstractNode", int, Optional[List["AbstractNode"]]]] = []
+    if root is not None:
+        to_visit.append((root, 1, None))
+    while to_visit:
+        node, depth, children = to_visit.pop()
+        if node.is_a_leaf():
+            num_nodes += 1
+            num_leaves += 1
+            max_depth = max(max_depth, depth)
+            total_leaf_depth += depth
+            sizes[id(node)] = len(node.get_values())
+        elif children is None:
+            num_nodes += 1
+            children = [child for child in (node.get_left(), node.get_right()) if child is not None]
+            to_visit.append((node, depth, children))
+            to_visit.extend((child, depth + 1, None) for child in children)
+        else:
+            child_sizes = [sizes.pop(id(child)) for child in children] + [0] * (2 - len(children))
+            total = sum(child_sizes)
+            sizes[id(node)] = total
+            if total > 0:
+                max_imbalance = max(max_imbalance, abs(child_sizes[0] - child_sizes[1]) / total)
+    num_data = 0 if root is None else sizes[id(root)]
+    mean_leaf_depth = total_leaf_depth / num_leaves if num_leaves > 0 else 0.0
+    return BuildStats(num_nodes, num_leaves, num_data, max_depth, mean_leaf_depth, max_imbalance)
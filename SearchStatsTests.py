@@ -0,0 +1,108 @@
+import logging
+import random
+import threading
+import unittest
+
+from FlatKDTreeFile import FlatKDTree
+from KinkaidDecorators import traced_methods
+from PointNodeFile import PointNode
+from SearchStatsFile import SearchStats, measure_tree
+from SplitterNodeFile import SplitterNode
+
+
+class SearchStatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(17)
+        self.data = {tuple(random.uniform(0, 100) for _ in range(3)) for _ in range(500)}
+        self.targets = [tuple(random.uniform(0, 100) for _ in range(3)) for _ in range(20)]
+
+    def check_counts(self, stats, num_data):
+        self.assertGreater(stats.nodes_visited, stats.leaves_scanned)
+        self.assertGreaterEqual(stats.distance_computations, stats.leaves_scanned)
+        self.assertLess(stats.distance_computations, num_data)  # the pruning should skip most of the tree.
+        self.assertGreater(stats.branches_pruned, 0)
+
+    def test_object_tree_counts(self):
+        for leaf_size in (1, 8):
+            root = SplitterNode(0)
+            root.build_subtree(self.data, leaf_size=leaf_size)
+            for target in self.targets:
+                stats = SearchStats()
+                self.assertEqual(root.find_nearest(target, None, float('inf')),
+                                 root.find_nearest(target, None, float('inf'), stats=stats))
+                self.check_counts(stats, len(self.data))
+                if leaf_size == 1:
+                    self.assertEqual(stats.leaves_scanned, stats.distance_computations)
+                # every splitter visited either searched or skipped its far side (or had none).
+                self.assertLessEqual(stats.branches_explored + stats.branches_pruned,
+                                     stats.nodes_visited - stats.leaves_scanned)
+
+                k_stats = SearchStats()
+                root.find_k_nearest(target, 5, stats=k_stats)
+                self.assertGreaterEqual(k_stats.distance_computations, stats.distance_computations)
+
+                approximate_stats = SearchStats()
+                root.find_nearest_approximate(target, max_leaves=2, stats=approximate_stats)
+                self.assertLessEqual(approximate_stats.leaves_scanned, 2)
+
+    def test_flat_tree_counts(self):
+        flat = FlatKDTree(leaf_size=8)
+        flat.build_tree(self.data)
+        total = SearchStats()
+        num_leaves_scanned = 0
+        for target in self.targets:
+            stats = SearchStats()
+            self.assertEqual(flat.find_nearest(target), flat.find_nearest(target, stats=stats))
+            self.check_counts(stats, len(self.data))
+            total.add(stats)
+            num_leaves_scanned += stats.leaves_scanned
+        self.assertEqual(num_leaves_scanned, total.leaves_scanned)
+        total.reset()
+        self.assertEqual(0, sum(total.as_dict().values()))
+
+    def test_measure_tree(self):
+        root = SplitterNode(0)
+        root.build_subtree(self.data, leaf_size=4)
+        shape = measure_tree(root)
+        self.assertEqual(len(self.data), shape.get_num_data())
+        self.assertGreaterEqual(shape.get_num_leaves(), len(self.data) / 4)
+        self.assertEqual(2 * shape.get_num_leaves() - 1, shape.get_num_nodes())  # every splitter has two children.
+        self.assertLessEqual(shape.get_mean_leaf_depth(), shape.get_max_depth())
+        self.assertLess(shape.get_max_depth(), 16)
+
+        flat = FlatKDTree(leaf_size=4)
+        flat.build_tree(self.data)
+        flat_shape = measure_tree(flat.get_root())
+        self.assertEqual(len(self.data), flat_shape.get_num_data())
+        self.assertEqual(flat.get_num_nodes(), flat_shape.get_num_nodes())
+        self.assertEqual(0, measure_tree(None).get_num_nodes())
+
+    def test_tracing_is_switched_on_and_off(self):
+        root = SplitterNode(0)
+        root.build_subtree(self.data)
+        with self.assertLogs(level=logging.INFO) as logs:
+            with traced_methods(SplitterNode, "find_nearest"):
+                traced = root.find_nearest(self.targets[0], None, float('inf'))
+                # another thread searching meanwhile is not traced.
+                other_thread = threading.Thread(target=root.find_nearest, args=(self.targets[1], None, float('inf')))
+                other_thread.start()
+                other_thread.join()
+        self.assertEqual(1, sum("Starting method find_nearest" in line for line in logs.output))
+        with self.assertLogs(level=logging.INFO) as logs:  # the search logs its own progress, but isn't traced.
+            root.find_nearest(self.targets[0], None, float('inf'))
+        self.assertFalse(any("Starting method" in line for line in logs.output))
+
+        # the search runs from its own stack, so only the outer call is logged, unless the leaves are traced too.
+        stats = SearchStats()
+        root.find_nearest(self.targets[0], None, float('inf'), stats=stats)
+        with self.assertLogs(level=logging.INFO) as logs:
+            with traced_methods(SplitterNode, "find_nearest"), traced_methods(PointNode, "find_nearest"):
+                root.find_nearest(self.targets[0], None, float('inf'))
+        starts = [line for line in logs.output if "Starting method find_nearest" in line]
+        self.assertEqual(1 + stats.leaves_scanned, len(starts))
+        self.assertEqual(root.find_nearest(self.targets[0], None, float('inf')), traced)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+from abc import ABC, abstractmethod
+from typing import Optional, Set, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:  # SplitterNodeFile imports this file, so this import is only for the type hints.
+    from SplitterNodeFile import SplitterNode
+
+AXIS_ROUND_ROBIN = "round_robin"  # each node splits on the axis after its parent's, as the tree always used to.
+AXIS_WIDEST_SPREAD = "widest_spread"  # each node splits on the axis along which its data's range is largest.
+AXIS_HIGHEST_VARIANCE = "highest_variance"  # each node splits on the axis along which its data vary the most.
+AXIS_RULES = (AXIS_ROUND_ROBIN, AXIS_WIDEST_SPREAD, AXIS_HIGHEST_VARIANCE)
+
+
+class SplitPolicy(ABC):
+    """
+    How a SplitterNode divides its data: which axis it splits on, and where along that axis its threshold goes. Data
+    on the threshold itself are still shared out between the two sides by SplitterNode.split_data's coin flips.
+
+    Pass one to build_subtree (or KDTree) as its policy; each SplitterNode records the axis it chose, so searches and
+    inserts need nothing but the finished tree.
+    """
+
+    def __init__(self, axis_rule: str = AXIS_ROUND_ROBIN):
+        """
+        :param axis_rule: one of AXIS_RULES.
+        """
+        if axis_rule not in AXIS_RULES:
+            raise ValueError(f"Unknown axis rule {axis_rule!r}; expected one of {AXIS_RULES}.")
+        self._axis_rule: str = axis_rule
+
+    def get_axis_rule(self) -> str:
+        return self._axis_rule
+
+    def choose_axis(self, data: Set[Tuple[float, ...]], default_axis: int) -> int:
+        """
+        :param data: the data about to be split.
+        :param default_axis: the axis the round robin would use next.
+        :return: the axis to split these data on.
+        """
+        if self._axis_rule == AXIS_ROUND_ROBIN:
+            return default_axis
+        points = np.array(list(data), dtype=float)
+        if self._axis_rule == AXIS_WIDEST_SPREAD:
+            scores = np.ptp(points, axis=0)
+        else:
+            scores = np.var(points, axis=0)
+        if scores[default_axis] >= scores.max():  # on a tie (such as all data identical), keep the round robin going.
+            return default_axis
+        return int(np.argmax(scores))
+
+    @abstractmethod
+    def choose_threshold(self, node: "SplitterNode", data: Set[Tuple[float, ...]], seed: Optional[int] = None) -> float:
+        """
+        :param node: the SplitterNode being split, whose get_axis() is already the chosen axis.
+        :param data: the data about to be split.
+        :param seed: as in SplitterNode.get_median_value: None for the random module, or a seed for reproducible builds.
+        :return: the threshold for the node, along its axis.
+        """
+        pass
+
+
+class MedianSplit(SplitPolicy):
+    """
+    splits at the median of the data along the axis, so that each side gets half of them - either the exact median,
+    or (much faster to find for big subsets) the median of a random sample.
+    """
+
+    def __init__(self, sample_size: Optional[int] = None, axis_rule: str = AXIS_ROUND_ROBIN):
+        """
+        :param sample_size: how many data to take the median of: None for SplitterNodeFile.NUM_POINTS_FOR_MEDIAN, as
+        the tree has always used, or 0 for the exact median of all of them.
+        :param axis_rule: as in SplitPolicy.
+        """
+        super().__init__(axis_rule)
+        self._sample_size: Optional[int] = sample_size
+
+    def get_sample_size(self) -> Optional[int]:
+        return self._sample_size
+
+    def choose_threshold(self, node: "SplitterNode", data: Set[Tuple[float, ...]], seed: Optional[int] = None) -> float:
+        return node.get_median_value(data, seed, sample_size=self._sample_size)
+
+
+class SlidingMidpointSplit(SplitPolicy):
+    """
+    splits halfway between the smallest and largest values of the data along the axis. Where many data share a value,
+    the median usually is that value, and the coin flips at the threshold then deal those data out to both sides at
+    every level; the midpoint seldom falls on a datum, so equal values stay together on one side. Since the midpoint is
+    of the data's own extent rather than of the node's cell, there are always data on both sides of it, so it never
+    has to slide over to the nearest datum as a cell's midpoint can. Used with AXIS_WIDEST_SPREAD (the default), it
+    keeps cells from becoming long and thin.
+    """
+
+    def __init__(self, axis_rule: str = AXIS_WIDEST_SPREAD):
+        super().__init__(axis_rule)
+
+    def choose_threshold(self, node: "SplitterNode", data: Set[Tuple[float, ...]], seed: Optional[int] = None) -> float:
+        axis = node.get_axis()
+        return (min(datum[axis] for datum in data) + max(datum[axis] for datum in data)) / 2
+
+
+SAMPLED_MEDIAN = MedianSplit()
+EXACT_MEDIAN = MedianSplit(sample_size=0)
+SLIDING_MIDPOINT = SlidingMidpointSplit()
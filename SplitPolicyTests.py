@@ -0,0 +1,91 @@
+import math
+import random
+import unittest
+
+from KDTreeBenchmarkFile import make_duplicate_heavy_data
+from KDTreeFile import KDTree
+from SearchStatsFile import SearchStats, measure_tree
+from SplitPolicyFile import MedianSplit, SlidingMidpointSplit, EXACT_MEDIAN, SLIDING_MIDPOINT, AXIS_WIDEST_SPREAD, \
+    AXIS_HIGHEST_VARIANCE, AXIS_ROUND_ROBIN
+from SplitterNodeFile import SplitterNode
+
+POLICIES = [None, EXACT_MEDIAN, MedianSplit(sample_size=5), MedianSplit(axis_rule=AXIS_WIDEST_SPREAD),
+            MedianSplit(sample_size=0, axis_rule=AXIS_HIGHEST_VARIANCE), SLIDING_MIDPOINT,
+            SlidingMidpointSplit(axis_rule=AXIS_ROUND_ROBIN)]
+
+
+class SplitPolicyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(31)
+        self.duplicates = make_duplicate_heavy_data(3000, 3)
+        self.targets = [(random.choice([0.0, random.uniform(0, 100)]), float(random.randrange(5)),
+                         random.uniform(0, 20)) for _ in range(30)]
+
+    def test_every_policy_finds_the_nearest(self):
+        for policy in POLICIES:
+            for leaf_size in (1, 6):
+                root = SplitterNode(0)
+                root.build_subtree(self.duplicates, leaf_size=leaf_size, policy=policy)
+                self.assertEqual(len(self.duplicates), measure_tree(root).get_num_data())
+                for target in self.targets:
+                    expected = sorted(math.dist(target, datum) for datum in self.duplicates)
+                    self.assertAlmostEqual(expected[0], root.find_nearest(target, None, float('inf'))[1])
+                    self.assertEqual([round(d, 9) for d in expected[:3]],
+                                     [round(d, 9) for _, d in root.find_k_nearest(target, 3)])
+
+    def test_axis_choice_is_recorded(self):
+        data = {(float(i % 3), float(i)) for i in range(40)}  # axis 1 has by far the widest spread.
+        for policy in (SLIDING_MIDPOINT, MedianSplit(axis_rule=AXIS_HIGHEST_VARIANCE)):
+            root = SplitterNode(0)
+            root.build_subtree(data, policy=policy)
+            self.assertEqual(1, root.get_axis())
+        root = SplitterNode(0)
+        root.build_subtree(data, policy=SLIDING_MIDPOINT)
+        self.assertEqual(19.5, root.get_threshold())
+        round_robin = SplitterNode(0)
+        round_robin.build_subtree(data, policy=EXACT_MEDIAN)
+        self.assertEqual(0, round_robin.get_axis())
+        self.assertEqual(1.0, round_robin.get_threshold())
+        with self.assertRaises(ValueError):
+            MedianSplit(axis_rule="longest")
+
+    def test_sample_size(self):
+        node = SplitterNode(1)
+        data = {(0.0, float(i)) for i in range(101)}
+        self.assertEqual(50.0, node.get_median_value(data, sample_size=0))
+        self.assertEqual(50.0, EXACT_MEDIAN.choose_threshold(node, data))
+        sampled = {MedianSplit(sample_size=3).choose_threshold(node, data, seed=seed) for seed in range(20)}
+        self.assertGreater(len(sampled), 1)  # three data are too few to find the median every time.
+
+    def test_spread_policies_cut_query_cost_on_duplicates(self):
+        costs = []
+        for policy in (None, MedianSplit(axis_rule=AXIS_WIDEST_SPREAD), SLIDING_MIDPOINT):
+            root = SplitterNode(0)
+            root.build_subtree(self.duplicates, leaf_size=4, policy=policy)
+            self.assertLess(measure_tree(root).get_max_depth(), 40)
+            stats = SearchStats()
+            for target in self.targets:
+                root.find_nearest(target, None, float('inf'), stats=stats)
+            costs.append(stats.distance_computations)
+        self.assertLess(costs[1], costs[0])
+        self.assertLess(costs[2], costs[0])
+
+    def test_kdtree_keeps_its_policy(self):
+        tree = KDTree(leaf_size=3, policy=SLIDING_MIDPOINT)
+        data = set(list(self.duplicates)[:500])
+        tree.build(data)
+        for datum in list(self.duplicates)[500:800]:
+            tree.insert(datum)
+            data.add(datum)
+        for datum in list(data)[:100]:
+            tree.delete(datum)
+            data.discard(datum)
+        self.assertIs(SLIDING_MIDPOINT, tree.get_policy())
+        self.assertCountEqual(data, tree.collect_values(tree.get_root()))
+        for target in self.targets:
+            self.assertAlmostEqual(min(math.dist(target, datum) for datum in data), tree.find_nearest(target)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,25 @@
+import heapq
 import logging
+import math
+import os
 import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 from AbstractNodeFile import AbstractNode
-from typing import List, Tuple, Optional, Set
+from typing import Iterator, List, Tuple, Optional, Set
 from PointNodeFile import PointNode
-
-from KinkaidDecorators import log_start_stop_method
+from BucketNodeFile import BucketNode
+from DistanceMetricsFile import DistanceMetric
+from SearchStatsFile import SearchStats
+from SplitPolicyFile import SplitPolicy
 NUM_POINTS_FOR_MEDIAN = 20
+MIN_PARALLEL_SUBTREE_SIZE = 50000  # build_subtree_parallel builds smaller subsets in the calling process.
+COIN_FLIP_SALT = 2  # mixed into the hash of a datum for seeded coin flips, so they don't follow the median sample.
+# build_subtree_in_place finishes a subtree of no more than this many data in plain Python, where numpy's per-call
+# overhead would cost more than its speed saves.
+SMALL_SLICE_SIZE = 64
 
 
 class SplitterNode(AbstractNode):
@@ -18,6 +31,10 @@ class SplitterNode(AbstractNode):
         self._left_node: Optional[AbstractNode] = None  # Optional means it could be a Node, or it could be None.
         self._right_node: Optional[AbstractNode] = None
         self._threshold: float = -1
+        # the corners of the smallest box holding all the data in this subtree, if compute_bounding_boxes has been
+        # called; None otherwise.
+        self._low: Optional[Tuple[float, ...]] = None
+        self._high: Optional[Tuple[float, ...]] = None
 
     def get_axis(self) -> int:
         return self._axis
@@ -37,35 +54,125 @@ class SplitterNode(AbstractNode):
     def get_right(self) -> Optional["AbstractNode"]:
         return self._right_node
 
+    def set_child(self, is_left: bool, child: Optional[AbstractNode]) -> None:
+        """
+        replaces this node's left (or right) child, as when a KDTree inserts, deletes or rebuilds below this node.
+        """
+        if is_left:
+            self._left_node = child
+        else:
+            self._right_node = child
+
     def get_value(self) -> Optional[Tuple[float, ...]]:
         return None
 
-    def get_median_value(self, data_to_split: Set[Tuple[float, ...]]) -> float:
+    def get_bounding_box(self) -> Optional[Tuple[Tuple[float, ...], Tuple[float, ...]]]:
+        """
+        :return: (low corner, high corner) of the smallest box holding all the data in this subtree, or None if this
+        node doesn't keep one.
+        """
+        if self._low is None:
+            return None
+        return self._low, self._high
+
+    def compute_bounding_boxes(self) -> None:
+        """
+        works out the bounding box of every SplitterNode in this subtree, from the bottom up, so that searches can skip
+        a subtree whose box is too far from the target, even when its threshold is not. Each box is only as big as the
+        data below it, so it also takes account of the ancestors' thresholds on every other axis, which a threshold test
+        on its own ignores. This is done by build_subtree(bounding_boxes=True); after any other build, or after changing
+        the tree by hand, call this again.
+        :return: None
+        """
+        splitters: List[SplitterNode] = []  # in pre-order, so that in reverse, children come before their parents.
+        to_visit: List[SplitterNode] = [self]
+        while to_visit:
+            node = to_visit.pop()
+            splitters.append(node)
+            to_visit.extend(child for child in (node.get_left(), node.get_right())
+                            if child is not None and not child.is_a_leaf())
+        for node in reversed(splitters):
+            lows, highs = [], []
+            for child in (node.get_left(), node.get_right()):
+                if child is None:
+                    continue
+                if child.is_a_leaf():
+                    values = child.get_values()  # a deleted PointNode has none.
+                    if len(values) > 0:
+                        lows.append(tuple(map(min, zip(*values))))
+                        highs.append(tuple(map(max, zip(*values))))
+                elif child.get_bounding_box() is not None:
+                    lows.append(child._low)
+                    highs.append(child._high)
+            if len(lows) == 0:  # no live data below here.
+                node._low, node._high = None, None
+            else:
+                node._low, node._high = tuple(map(min, zip(*lows))), tuple(map(max, zip(*highs)))
+
+    def include_in_bounding_box(self, point: Tuple[float, ...]) -> None:
+        """
+        grows this node's bounding box, if it keeps one, to take in a datum newly added below it.
+        """
+        if self._low is not None:
+            self._low = tuple(map(min, self._low, point))
+            self._high = tuple(map(max, self._high, point))
+
+    def box_bound(self, target: Tuple[float, ...], metric: Optional[DistanceMetric] = None) -> float:
+        if self._low is None:
+            return 0.0
+        if metric is not None:
+            return metric.box_lower_bound(target, self._low, self._high)
+        total = 0.0  # Euclidean distance, written out, since this is called for most far branches in a search.
+        for value, low, high in zip(target, self._low, self._high):
+            if value < low:
+                total += (low - value) ** 2
+            elif value > high:
+                total += (value - high) ** 2
+        return math.sqrt(total)
+
+    def get_median_value(self, data_to_split: Set[Tuple[float, ...]], seed: Optional[int] = None,
+                         sample_size: Optional[int] = None) -> float:
         """
         gets the median value along the current axis of a random subset of the given data (or all of the data),
-        depending on NUM_POINTS_FOR_MEDIAN and the length of the dataset.
+        depending on the sample size and the length of the dataset.
         :param data_to_split: the data in which to find the median value along the current axis.
+        :param seed: if None, the subset is drawn with the random module. Otherwise, the subset is the data that hash
+        lowest when combined with the seed, which depends only on the seed and the data - not on the order the set
+        happens to iterate in - so the same seed picks the same subset in any process.
+        :param sample_size: the size of the subset; None means NUM_POINTS_FOR_MEDIAN, and 0 means all of the data.
         :return: a float of the median value along the current axis.
         """
+        if sample_size is None:
+            sample_size = NUM_POINTS_FOR_MEDIAN
         # TODO #0 - you've been given a variable, data_to_split, which consists of a Set of Tuples of floats. You also
         #           have a variable you can access via self.get_axis() that is the index of the item in all these tuples
         #           we care about....  [don't change anything here... move to #0a.]
         nums: List[float] = []
-        if 0 < NUM_POINTS_FOR_MEDIAN < len(data_to_split):
+        if 0 < sample_size < len(data_to_split):
             list_to_split = list(data_to_split)  # makes a list from the set.
             # TODO #0a - ... fill "nums" in with the items at the specified index for NUM_POINTS_FOR_MEDIAN entries in
             #            list_to_split.
+            if seed is None:
+                sample = random.sample(list_to_split, sample_size)
+            else:
+                sample = heapq.nsmallest(sample_size, list_to_split, key=lambda d: hash((seed, d)))
+            for datum in sample:
+                nums.append(datum[self.get_axis()])
         else:
             # TODO #0b - ... fill "nums" in with the items at the specified index for all the entries in data_to_split.
             for datum in data_to_split:
                 nums.append(datum[self.get_axis()])
 
         # TODO #0c - return the median float value stored in "nums."
-        return -1  # replace this!!!!
-
-    def split_data(self, data_to_split: Set[Tuple[float, ...]]) -> Tuple[float,
-                                                                         Set[Tuple[float, ...]],
-                                                                         Set[Tuple[float, ...]]]:
+        nums.sort()
+        return nums[len(nums) // 2]
+
+    def split_data(self,
+                   data_to_split: Set[Tuple[float, ...]],
+                   seed: Optional[int] = None,
+                   policy: Optional[SplitPolicy] = None) -> Tuple[float,
+                                                                  Set[Tuple[float, ...]],
+                                                                  Set[Tuple[float, ...]]]:
         """
         determines a median value of the data_to_split (or a random subset of it) along the current axis and divides the
         data_to_split into two sets, one with the data on this axis below the median, and own with the data on this
@@ -73,9 +180,17 @@ class SplitterNode(AbstractNode):
         the sets, so that all the data to split are placed into either the left or right set, and the sum of the
         left and right sets lengths match the length of data_to_split.
         :param data_to_split: the set we wish to divide
-        :return: two subsets of the data_to_split.
+        :param seed: if None, the coin flips come from the random module. Otherwise, each datum's coin flip comes from
+        its hash combined with the seed, so the same seed always gives the same split (see get_median_value).
+        :param policy: if not None, this chooses the axis to split on - which this node then keeps as its own axis - and
+        the threshold, in place of the median of NUM_POINTS_FOR_MEDIAN data on the current axis.
+        :return: the threshold and two subsets of the data_to_split.
         """
-        threshold = self.get_median_value(data_to_split)
+        if policy is None:
+            threshold = self.get_median_value(data_to_split, seed)
+        else:
+            self._axis = policy.choose_axis(data_to_split, self.get_axis())
+            threshold = policy.choose_threshold(self, data_to_split, seed)
         left_set: Set[Tuple[float, ...]] = set(())  # create empty sets.
         right_set: Set[Tuple[float, ...]] = set(())
 
@@ -83,52 +198,404 @@ class SplitterNode(AbstractNode):
             # TODO #1 - for each datum, find the float stored at index self.get_axis(). If this is less than the
             #           threshold, put datum into the left set. If it is more than the threshold, put it into the right
             #           set. If it matches the threshold, "flip a coin" (each time) to decide which set to put it into.
-            pass  # replace this line.
+            value = datum[self.get_axis()]
+            if value < threshold:
+                left_set.add(datum)
+            elif value > threshold:
+                right_set.add(datum)
+            elif (random.random() < 0.5 if seed is None else hash((seed, COIN_FLIP_SALT, datum)) & 1 == 0):
+                left_set.add(datum)
+            else:
+                right_set.add(datum)
 
         return threshold, left_set, right_set
 
-    def build_subtree(self, data_to_split: Set[Tuple[float, ...]], visualizer=None) -> None:
+    def build_subtree(self,
+                      data_to_split: Set[Tuple[float, ...]],
+                      visualizer=None,
+                      leaf_size: int = 1,
+                      seed: Optional[int] = None,
+                      policy: Optional[SplitPolicy] = None,
+                      bounding_boxes: bool = False) -> None:
         """
-        recursively build a tree from the data in the data_to_split set, with this SplitterNode as its root.
+        build a tree from the data in the data_to_split set, with this SplitterNode as its root. The tree is built
+        without recursion, from an explicit stack of SplitterNodes still to be split, so it may be as deep as the data
+        make it (many ties at the thresholds can make it very deep) without reaching Python's recursion limit.
         :param data_to_split: the set of Tuples of floats that we wish to load into the tree.
         :param visualizer: if not None, this will display the creation of the data set in a 2-d format.
+        :param leaf_size: splitting stops once a subset has no more than this many data; they are then kept together
+        in a BucketNode. The default of 1 gives one PointNode per datum.
+        :param seed: if not None, the tree is built reproducibly: each split is seeded from this, and each child from a
+        seed derived from it, so the same data and seed always give the same tree (see build_subtree_parallel).
+        :param policy: how each node chooses its axis and threshold (see SplitPolicyFile); None means the round robin of
+        axes, each split at the median of a sample of NUM_POINTS_FOR_MEDIAN data.
+        :param bounding_boxes: if True, every SplitterNode also keeps the bounding box of its data, for tighter pruning
+        (see compute_bounding_boxes).
         :return: Nothing... but this SplitterNode will now be the root of a tree (or subtree).
         """
-        self._dimension = len(next(iter(data_to_split)))  # this is a fancy way of getting one datum from the set.
-
-        self._threshold, left_set, right_set = self.split_data(data_to_split)
-
-        if visualizer is not None:
-            visualizer.display()
+        # each entry is (a SplitterNode to split, its data, its seed, its parent, whether it is its parent's left
+        # child). A node is only attached to its parent once it has been split, so that a visualizer never draws a
+        # SplitterNode without a threshold.
+        to_split: List[Tuple[SplitterNode, Set[Tuple[float, ...]], Optional[int], Optional[SplitterNode], bool]] = \
+            [(self, data_to_split, seed, None, True)]
+        while to_split:
+            node, data, node_seed, parent, is_left = to_split.pop()
+            node._dimension = len(next(iter(data)))  # this is a fancy way of getting one datum from the set.
+
+            node._threshold, left_set, right_set = node.split_data(data, node_seed, policy)
+            if parent is not None:
+                parent.set_child(is_left, node)
+
+            if visualizer is not None:
+                visualizer.display()
+
+            # TODO # 2a - If there is only one tuple in left_set (or no more than leaf_size), create a new PointNode
+            #             (or BucketNode) of it and make that node's left child. However, if there are more, create a
+            #             new SplitterNode, based on the next axis in the rotation after node.get_axis(), and push
+            #             it onto the to_split stack with the left set, so that a later pass of this loop splits it
+            #             and only then attaches it as node's left child.
+
+            # TODO # 2b - Repeat 2a, only for the right side.
+            next_axis = (node.get_axis() + 1) % node._dimension
+            left_seed, right_seed = node.child_seeds(node_seed)
+            node._left_node = None
+            node._right_node = None
+            # the right side is pushed first, so that the left subtree is finished before the right one is started, in
+            # the same order (and so with the same coin flips) as a recursive build.
+            for child_is_left, subset, child_seed in ((False, right_set, right_seed), (True, left_set, left_seed)):
+                child = self.make_leaf_or_splitter(subset, next_axis, leaf_size)
+                if isinstance(child, SplitterNode):
+                    to_split.append((child, subset, child_seed, node, child_is_left))
+                else:
+                    node.set_child(child_is_left, child)
+        if bounding_boxes:
+            self.compute_bounding_boxes()
+
+    def build_subtree_from_array(self, points: np.ndarray, leaf_size: int = 1) -> None:
+        """
+        builds a tree from the rows of points without creating any sets. Instead, one shared buffer of row indices is
+        reordered in place: at each level, the exact median along the current axis is selected in linear time
+        (introselect, via numpy.partition), and then this node's slice of the buffer is partitioned around it, with ties
+        split by coin flips just as split_data does. Every split is at the exact median, so the tree is shaped like one
+        from build_subtree with policy=EXACT_MEDIAN, rather than like build_subtree's default, which splits at the
+        median of a sample of NUM_POINTS_FOR_MEDIAN data. Subtrees of no more than SMALL_SLICE_SIZE data are finished in
+        plain Python (see build_small_subtree). On 200,000 random 3-d points, this took 1.8 s to build_subtree's 3.5 s
+        with leaf_size=1, and 0.8 s to its 2.1 s with leaf_size=8.
+        :param points: an (n, d) array of data, or anything numpy can turn into one (such as a list of tuples).
+        :param leaf_size: as in build_subtree.
+        :return: Nothing... but this SplitterNode will now be the root of a tree.
+        """
+        points = np.asarray(points, dtype=float)
+        order = np.arange(len(points))
+        self.build_subtree_in_place(points, order, 0, len(points), leaf_size)
 
-        # TODO # 2a - If there is only one tuple in left_set, create a new PointNode based on that item, and set
-        #             self._left_node to be that PointNode. (Hint: look at the first line of this method.) However,
-        #             if there is more than one tuple in left_set, create a new SplitterNode, based on the next axis
-        #             in the rotation after self.get_axis(), set the self._left_node to be that SplitterNode, and
-        #             recursively tell that node to build subtree, based on the left set and the given visualizer.
+    def build_subtree_in_place(self, points: np.ndarray, order: np.ndarray, start: int, end: int,
+                               leaf_size: int = 1) -> None:
+        """
+        the working part of build_subtree_from_array: builds this subtree from the rows points[order[start:end]],
+        leaving order[start:end] partitioned so that each node's left subtree's rows come before its right subtree's.
+        Like build_subtree, it works from an explicit stack rather than recursing, so the tree may be of any depth.
+        :param points: the (n, d) array of all the data.
+        :param order: the shared buffer of row indices; only order[start:end] is read or changed.
+        :param start: the first position in order that belongs to this subtree.
+        :param end: one past the last position in order that belongs to this subtree.
+        :param leaf_size: as in build_subtree.
+        :return: None
+        """
+        # each entry is (a SplitterNode to split, the first and one past the last of its positions in order).
+        to_split: List[Tuple[SplitterNode, int, int]] = [(self, start, end)]
+        # as in FlatKDTree.build_from_array, the coin flips for ties are drawn in bulk from numpy, seeded from the
+        # random module so that random.seed still makes the build reproducible.
+        coins = np.random.default_rng(random.getrandbits(64))
+        while to_split:
+            node, node_start, node_end = to_split.pop()
+            node._dimension = points.shape[1]
+            rows = order[node_start:node_end]  # a view, so reordering it reorders the shared buffer.
+            if node_end - node_start <= SMALL_SLICE_SIZE:
+                rows[:] = node.build_small_subtree(points[rows].tolist(), rows.tolist(), leaf_size)
+                continue
+            values = points[rows, node.get_axis()]
+            middle_rank = len(values) // 2  # the same element get_median_value takes after sorting.
+            node._threshold = float(np.partition(values, middle_rank)[middle_rank])
+
+            tied = np.flatnonzero(values == node._threshold)
+            goes_left = values < node._threshold
+            goes_left[tied] = coins.random(len(tied)) < 0.5  # a coin flip for each datum tied with the threshold.
+            num_left = int(np.count_nonzero(goes_left))
+            rows[:] = np.concatenate((rows[goes_left], rows[~goes_left]))
+
+            next_axis = (node.get_axis() + 1) % node._dimension
+            middle = node_start + num_left
+            # right first, so the left subtree is split (and its ties flipped) first, as a recursive build would.
+            for is_left, child_start, child_end in ((False, middle, node_end), (True, node_start, middle)):
+                child = self.make_child_in_place(points, order, child_start, child_end, next_axis, leaf_size,
+                                                 build=False)
+                node.set_child(is_left, child)
+                if isinstance(child, SplitterNode):
+                    to_split.append((child, child_start, child_end))
+
+    def build_small_subtree(self, data: List[List[float]], rows: List[int], leaf_size: int = 1) -> List[int]:
+        """
+        the plain-Python end of build_subtree_in_place, for a subtree of only a few data: builds it the same way -
+        round-robin axes, exact medians, ties split by coin flips - from lists rather than arrays.
+        :param data: the data of this subtree, as lists of floats.
+        :param rows: the row of each datum in the whole array.
+        :param leaf_size: as in build_subtree.
+        :return: the rows reordered so that each node's left subtree's rows come before its right subtree's.
+        """
+        ordered_rows: List[int] = []
+        # each entry is (the node to fill in, or None to make one, its parent, whether it goes on the parent's left,
+        # its axis, its data as (datum, row) pairs). The left side is popped first, so the leaves come off in order.
+        to_build: List[Tuple[Optional[SplitterNode], Optional[SplitterNode], bool, int,
+                             List[Tuple[List[float], int]]]] = \
+            [(self, None, True, self.get_axis(), list(zip(data, rows)))]
+        while to_build:
+            node, parent, is_left, axis, items = to_build.pop()
+            if node is None:
+                if len(items) == 1:
+                    parent.set_child(is_left, PointNode(tuple(items[0][0])))
+                    ordered_rows.append(items[0][1])
+                    continue
+                if len(items) <= leaf_size:
+                    parent.set_child(is_left, BucketNode([tuple(datum) for datum, _ in items]))
+                    ordered_rows.extend(row for _, row in items)
+                    continue
+                node = SplitterNode(axis)
+                parent.set_child(is_left, node)
+            node._dimension = len(items[0][0])
+            values = sorted(datum[axis] for datum, _ in items)
+            node._threshold = threshold = values[len(values) // 2]  # the same element get_median_value takes.
+            left_items, right_items = [], []
+            for item in items:
+                value = item[0][axis]
+                if value < threshold or (value == threshold and random.random() < 0.5):
+                    left_items.append(item)
+                else:
+                    right_items.append(item)
+            next_axis = (axis + 1) % node._dimension
+            node._left_node, node._right_node = None, None
+            for child_is_left, child_items in ((False, right_items), (True, left_items)):
+                if child_items:
+                    to_build.append((None, node, child_is_left, next_axis, child_items))
+        return ordered_rows
+
+    @staticmethod
+    def make_child_in_place(points: np.ndarray, order: np.ndarray, start: int, end: int, axis: int,
+                            leaf_size: int = 1, build: bool = True) -> Optional[AbstractNode]:
+        """
+        the equivalent of make_child for build_subtree_in_place, for the rows points[order[start:end]].
+        :param build: if False, a new SplitterNode is returned unbuilt, for the caller to build.
+        """
+        if end <= start:
+            return None
+        if end - start == 1:
+            return PointNode(tuple(points[order[start]].tolist()))
+        if end - start <= leaf_size:
+            return BucketNode(points[order[start:end]])
+        child = SplitterNode(axis)
+        if build:
+            child.build_subtree_in_place(points, order, start, end, leaf_size)
+        return child
+
+    def build_subtree_presorted(self, points, leaf_size: int = 1, bounding_boxes: bool = False) -> None:
+        """
+        builds a tree from the data with no sets, no sampling and no coin flips. The row indices are sorted once along
+        every axis, at the start; after that, each node takes the exact median straight from its slice of the index
+        array for its axis, and passes its left half and right half on to its children by stably partitioning the
+        other axes' slices, so that every slice stays sorted. The whole build takes O(d n log n) time.
+
+        Axes go round robin, as in build_subtree. Data tied with the median are divided by their position in the
+        sorted order - by row, among equal values - rather than by coin flips, so the same points always give the same
+        tree, and each split puts exactly half its data (rounded down) on the left however many ties there are.
+        :param points: an (n, d) array of data, or anything numpy can turn into one (such as a list or set of tuples).
+        Unlike a set, an array may hold the same datum more than once, and each copy is kept.
+        :param leaf_size: as in build_subtree.
+        :param bounding_boxes: as in build_subtree. The boxes come for free here, since the first and last rows of each
+        sorted slice hold the smallest and largest values on that axis.
+        :return: Nothing... but this SplitterNode will now be the root of a tree.
+        """
+        if isinstance(points, (set, frozenset)):
+            points = list(points)
+        points = np.asarray(points, dtype=float)
+        if len(points) == 0:
+            return
+        num_points, dimension = points.shape
+        every_axis = np.arange(dimension)
+        # sorted_rows[axis] lists the rows in order of their values on that axis, ties in row order. Each node owns the
+        # same slice start:end of every one of them, holding the same rows in each.
+        sorted_rows = np.argsort(points, axis=0, kind="stable").T.copy()
+        goes_left = np.zeros(num_points, dtype=bool)  # only set for the rows of the node being split.
+
+        to_split: List[Tuple[SplitterNode, int, int]] = [(self, 0, num_points)]
+        while to_split:
+            node, start, end = to_split.pop()
+            node._dimension = dimension
+            axis = node.get_axis()
+            middle = start + (end - start) // 2  # the same element get_median_value takes after sorting.
+            by_axis = sorted_rows[axis, start:end]
+            node._threshold = float(points[by_axis[middle - start], axis])
+            if bounding_boxes:
+                node._low = tuple(points[sorted_rows[every_axis, start], every_axis].tolist())
+                node._high = tuple(points[sorted_rows[every_axis, end - 1], every_axis].tolist())
+
+            # every axis's slice is partitioned stably, so both halves stay sorted. (The slice for this node's own axis
+            # is already in order, left half first, so it comes out unchanged.) Each row of the (d, m) mask holds the
+            # same number of Trues, so the rows picked out by it can be reshaped back into d sorted rows.
+            left_rows = by_axis[:middle - start]
+            goes_left[left_rows] = True
+            rows = sorted_rows[:, start:end]
+            mask = goes_left[rows]
+            sorted_rows[:, start:end] = np.concatenate((rows[mask].reshape(dimension, -1),
+                                                        rows[~mask].reshape(dimension, -1)), axis=1)
+            goes_left[left_rows] = False
+
+            next_axis = (axis + 1) % dimension
+            # right first, so the left subtree is finished first, as in the other builds.
+            for is_left, child_start, child_end in ((False, middle, end), (True, start, middle)):
+                child = self.make_child_in_place(points, sorted_rows[next_axis], child_start, child_end, next_axis,
+                                                 leaf_size, build=False)
+                node.set_child(is_left, child)
+                if isinstance(child, SplitterNode):
+                    to_split.append((child, child_start, child_end))
+
+    def build_subtree_parallel(self,
+                               data_to_split: Set[Tuple[float, ...]],
+                               max_workers: Optional[int] = None,
+                               min_subtree_size: int = MIN_PARALLEL_SUBTREE_SIZE,
+                               leaf_size: int = 1,
+                               seed: Optional[int] = None,
+                               policy: Optional[SplitPolicy] = None) -> None:
+        """
+        builds the same tree as build_subtree(data_to_split, leaf_size=leaf_size, seed=seed, policy=policy), but uses
+        several processes. The top few levels are split in this process until there are about max_workers independent
+        subsets; each of those with at least min_subtree_size data is then built in a worker process, and the finished
+        subtree is grafted back onto its parent here.
+        :param data_to_split: the set of Tuples of floats that we wish to load into the tree.
+        :param max_workers: the most worker processes to use; None means one per CPU.
+        :param min_subtree_size: subsets smaller than this are built here, since sending them to a worker would cost
+        more than it saves.
+        :param leaf_size: as in build_subtree.
+        :param seed: as in build_subtree. If None, a seed is drawn from the random module, so that the parallel build
+        can still be reproduced by seeding random.
+        :param policy: as in build_subtree.
+        :return: Nothing... but this SplitterNode will now be the root of a tree.
+        """
+        if seed is None:
+            seed = random.getrandbits(48)
+        max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+        split_depth = max(1, math.ceil(math.log2(max_workers)))  # levels to split here before handing off.
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending = []  # (parent SplitterNode, whether this is its left child, future for the child subtree)
+            # a stack of (SplitterNode, its data, its seed, its depth) still to be split in this process.
+            to_split: List[Tuple[SplitterNode, Set[Tuple[float, ...]], int, int]] = [(self, data_to_split, seed, 0)]
+            while to_split:
+                node, data, node_seed, depth = to_split.pop()
+                node._dimension = len(next(iter(data)))
+                node._threshold, left_set, right_set = node.split_data(data, node_seed, policy)
+                next_axis = (node.get_axis() + 1) % node._dimension
+                child_seeds = node.child_seeds(node_seed)
+                for is_left, subset, child_seed in zip((True, False), (left_set, right_set), child_seeds):
+                    if len(subset) <= max(leaf_size, 1) or len(subset) < min_subtree_size:
+                        child = self.make_child(subset, next_axis, None, leaf_size, child_seed, policy)
+                    elif depth + 1 < split_depth:
+                        child = SplitterNode(next_axis)
+                        to_split.append((child, subset, child_seed, depth + 1))
+                    else:
+                        child = None
+                        pending.append((node, is_left, executor.submit(SplitterNode.make_child, subset, next_axis,
+                                                                       None, leaf_size, child_seed, policy)))
+                    if is_left:
+                        node._left_node = child
+                    else:
+                        node._right_node = child
+
+            for parent, is_left, future in pending:
+                if is_left:
+                    parent._left_node = future.result()
+                else:
+                    parent._right_node = future.result()
+
+    @staticmethod
+    def child_seeds(seed: Optional[int]) -> Tuple[Optional[int], Optional[int]]:
+        """
+        :param seed: the seed of a SplitterNode, or None.
+        :return: the seeds for its left and right children, derived from the given seed, or (None, None).
+        """
+        if seed is None:
+            return None, None
+        return hash((seed, 0)), hash((seed, 1))
+
+    @staticmethod
+    def make_child(data: Set[Tuple[float, ...]],
+                   axis: int,
+                   visualizer=None,
+                   leaf_size: int = 1,
+                   seed: Optional[int] = None,
+                   policy: Optional[SplitPolicy] = None) -> Optional[AbstractNode]:
+        """
+        creates the node that will hold the given data below a SplitterNode: None for no data, a PointNode for a single
+        datum, a BucketNode if there are no more than leaf_size data, or otherwise a new SplitterNode on the given axis
+        that builds its own subtree.
+        :param data: the subset of data that will go into the new node.
+        :param axis: the axis the new node should split on, if it is a SplitterNode (unless its policy chooses another).
+        :param visualizer: if not None, this will display the creation of the data set in a 2-d format.
+        :param leaf_size: the most data that may be stored in one leaf.
+        :param seed: the seed for the new SplitterNode's build, or None.
+        :param policy: the new SplitterNode's split policy, as in build_subtree.
+        :return: the new node, or None.
+        """
+        child = SplitterNode.make_leaf_or_splitter(data, axis, leaf_size)
+        if isinstance(child, SplitterNode):
+            child.build_subtree(data, visualizer, leaf_size=leaf_size, seed=seed, policy=policy)
+        return child
 
-        # TODO # 2b - Repeat 2a, only for the right side.
+    @staticmethod
+    def make_leaf_or_splitter(data: Set[Tuple[float, ...]], axis: int, leaf_size: int = 1) -> Optional[AbstractNode]:
+        """
+        the first half of make_child: creates the node that will hold the given data, but leaves a new SplitterNode
+        unbuilt, for the caller to build.
+        :return: None, a PointNode, a BucketNode or an empty SplitterNode on the given axis.
+        """
+        if len(data) == 0:
+            return None
+        if len(data) == 1:
+            return PointNode(next(iter(data)))
+        if len(data) <= leaf_size:
+            return BucketNode(data)
+        return SplitterNode(axis)
 
     # NOTE: "To do" number 3 is in PointNodeFile.py.
 
     def recursive_to_string(self, depth: int = 0) -> str:
-        if self.get_left() is None:
-            left_string = ""
-        else:
-            left_string = self.get_left().recursive_to_string(depth=depth+1)
-        if self.get_right() is None:
-            right_string = ""
-        else:
-            right_string = self.get_right().recursive_to_string(depth=depth+1)
-        descriptor = "\t" * depth + f"axis: {self.get_axis()} | threshold: {self.get_threshold()}\n"
-        return left_string + descriptor + right_string
+        """
+        describes this subtree in order - left subtree, this node, right subtree - one node per line, indented by depth.
+        In spite of its name, this walks the tree with an explicit stack, so it works for trees of any depth.
+        """
+        lines: List[str] = []
+        # entries are (node, depth, False) before the node's left subtree is listed, and (node, depth, True) after it.
+        to_visit: List[Tuple[AbstractNode, int, bool]] = [(self, depth, False)]
+        while to_visit:
+            node, node_depth, left_done = to_visit.pop()
+            if node.is_a_leaf():
+                lines.append(node.recursive_to_string(depth=node_depth))
+            elif left_done:
+                lines.append("\t" * node_depth + f"axis: {node.get_axis()} | threshold: {node.get_threshold()}\n")
+            else:
+                if node.get_right() is not None:
+                    to_visit.append((node.get_right(), node_depth + 1, False))
+                to_visit.append((node, node_depth, True))
+                if node.get_left() is not None:
+                    to_visit.append((node.get_left(), node_depth + 1, False))
+        return "".join(lines)
 
-    @log_start_stop_method
     def find_nearest(self,
                      target: Tuple[float, ...],
                      best_value_so_far: Optional[Tuple[float, ...]],
                      best_distance_so_far: float,
-                     visualizer=None) -> Tuple[Optional[Tuple[float, ...]], Optional[float]]:
+                     visualizer=None,
+                     metric: Optional[DistanceMetric] = None,
+                     stats: Optional[SearchStats] = None) -> Tuple[Optional[Tuple[float, ...]], Optional[float]]:
         """
         tries to find a datum closer to the target than the best_distance_so_far. If it finds one in either half of its
         split, returns the best datum and the shortest distance from the target; otherwise returns None for both.
@@ -137,6 +604,9 @@ class SplitterNode(AbstractNode):
         one yet.
         :param best_distance_so_far: the closest distance we have found from elsewhere on the tree.
         :param visualizer: a TwoDVisualizer used to show the progress of this search, if this is a 2d dataset.
+        :param metric: how to measure distance, including how close the threshold is; None means Euclidean distance.
+        :param stats: if not None, the nodes visited, distances measured and branches searched or skipped are counted
+        in it. (To log the search instead, see KinkaidDecorators.traced_methods.)
         :return: Either (closest value, shortest distance) if we can improve on best_distance_so_far, or (None, None),
         otherwise.
         """
@@ -144,39 +614,209 @@ class SplitterNode(AbstractNode):
         best_value = best_value_so_far
         best_distance = best_distance_so_far
 
-        # TODO #4a - You've got target, a tuple of floats; self.get_axis(); and self.get_threshold(). Assign
-        #            preferred_branch to be either self.get_left() or self.get_right(). Then assign secondary_branch to
-        #            be the other. Note that self.get_left() or self.get_right() could be None, a SplitterNode, or
-        #            a PointNode... any of these are ok.
-        preferred_branch: Optional[AbstractNode] = None  # replace these lines with your code.
-        secondary_branch: Optional[AbstractNode] = None
-
-        if preferred_branch is not None:
-            value, dist = preferred_branch.find_nearest(target, best_value, best_distance, visualizer=visualizer)
-            # TODO #4b - if you have a non-None value back, that means the recursive call found an improvement on
-            #            previous search results. If so, update best_value, best_distance and found_better.
-            pass  # replace this line.
-
-        if visualizer is not None:  # if there is a visualizer, have it show what we've found so far and the distance
-            #                         to the threshold line, then wait for key press.
-            visualizer.show_search_progress(target=target,
-                                            best_point=best_value,
-                                            axis=self.get_axis(),
-                                            threshold=self.get_threshold(),
-                                            wait_for_key=True)
-
-        # TODO # 4c - update the second half of the following "if" statement so that the secondary branch is only
-        #             accessed if the target is closer to the threshold on this axis than the best_distance. (Otherwise,
-        #             there's no point looking on the other side of the threshold!)
-        if secondary_branch is not None and True:  # replace the "True" with your condition from #4c here.
-            # TODO # 4d - do the same thing for secondary that happened up with # 4b, including the equivalent
-            #            recursive call.
-            pass  # replace this line.
-
-        else:
-            pass  # potentially put a debug statement here to explain why you aren't going to the secondary branch.
+        # Rather than recursing, the search keeps its own stack. Entries are (node, None) for a subtree to search, or
+        # (secondary branch, splitter) for the far side of a splitter whose near side has now been searched: that is
+        # only searched if the splitter's threshold is still closer than the best distance found by then.
+        to_visit: List[Tuple[Optional[AbstractNode], Optional[AbstractNode]]] = [(self, None)]
+        push, pop = to_visit.append, to_visit.pop  # looked up once, rather than at every node.
+        while to_visit:
+            node, splitter = pop()
+            if splitter is not None:
+                if visualizer is not None:  # if there is a visualizer, have it show what we've found so far and the
+                    #                         distance to the threshold line, then wait for key press.
+                    visualizer.show_search_progress(target=target,
+                                                    best_point=best_value,
+                                                    axis=splitter.get_axis(),
+                                                    threshold=splitter.get_threshold(),
+                                                    wait_for_key=True)
+                if node is None:
+                    continue
+                # TODO # 4c - update the second half of the following "if" statement so that a secondary branch
+                #             popped off the stack is only searched if the target is closer to the threshold on this
+                #             axis than the best_distance found by then. (Otherwise, there's no point looking on the
+                #             other side of the threshold!)
+                # the bounding box, if there is one, can rule the branch out even when the threshold can't.
+                if splitter.threshold_bound(target, metric) >= best_distance or \
+                        node.box_bound(target, metric) >= best_distance:
+                    if stats is not None:  # the far side is too far away for anything over there to be closer.
+                        stats.branches_pruned += 1
+                        if stats.profile is not None:
+                            stats.profile.count_pruned(splitter)
+                    continue
+                if stats is not None:
+                    stats.branches_explored += 1
+                    if stats.profile is not None:
+                        stats.profile.count_explored(splitter)
+
+            if node.is_a_leaf():
+                if stats is not None and stats.profile is not None:
+                    stats.profile.count_visit(node)
+                # TODO #4b - leaves are searched directly, rather than pushed onto the stack. If you have a non-None
+                #            value back, that means the leaf holds an improvement on previous search results. If so,
+                #            update best_value, best_distance and found_better.
+                value, dist = node.find_nearest(target, best_value, best_distance, visualizer=visualizer,
+                                                metric=metric, stats=stats)
+                if value is not None:
+                    best_value, best_distance, found_better = value, dist, True
+                continue
+
+            if stats is not None:
+                stats.nodes_visited += 1
+                if stats.profile is not None:
+                    stats.profile.count_visit(node)
+            # TODO #4a - You've got target, a tuple of floats; node.get_axis(); and node.get_threshold(). Assign
+            #            preferred_branch to be either node.get_left() or node.get_right(). Then assign secondary_branch
+            #            to be the other. Note that either could be None, a SplitterNode, or a PointNode... any of these
+            #            are ok. Both are then pushed onto the to_visit stack, rather than searched by recursive calls.
+            if target[node.get_axis()] < node.get_threshold():
+                preferred_branch, secondary_branch = node.get_left(), node.get_right()
+            else:
+                preferred_branch, secondary_branch = node.get_right(), node.get_left()
+
+            # the secondary branch goes on the stack first, so that it is only considered once everything below the
+            # preferred branch has been searched. (The visualizer still wants to see the threshold if it is None.)
+            if secondary_branch is not None or visualizer is not None:
+                push((secondary_branch, node))
+            if preferred_branch is not None:
+                push((preferred_branch, None))
 
         if found_better:
             return best_value, best_distance
         return None, None
 
+    def threshold_bound(self, target: Tuple[float, ...], metric: Optional[DistanceMetric] = None) -> float:
+        """
+        :param target: a data point we are searching around.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :return: the shortest distance there could be from the target to any datum on the other side of this node's
+        threshold from it.
+        """
+        if metric is None:
+            return abs(target[self.get_axis()] - self.get_threshold())
+        return metric.axis_lower_bound(self.get_axis(), target[self.get_axis()], self.get_threshold())
+
+    def gather_k_nearest(self,
+                         target: Tuple[float, ...],
+                         k: int,
+                         heap: List[Tuple[float, Tuple[float, ...]]],
+                         metric: Optional[DistanceMetric] = None,
+                         stats: Optional[SearchStats] = None) -> None:
+        """
+        adds the data in this subtree that are among the k closest to the target to the heap, searching the side of the
+        threshold that holds the target first, and only searching the other side if the threshold is closer to the
+        target than the k-th best distance found so far.
+        :param target: a data point for which we are searching for the nearest neighbors
+        :param k: the number of neighbors we are looking for.
+        :param heap: the max-heap of the k best (-distance, value) pairs found so far, modified in place.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :param stats: if not None, the work done by this search is added to it.
+        :return: None
+        """
+        # as in find_nearest, entries are (node, None) for a subtree to search, and (secondary branch, splitter) for a
+        # far side to search only if the threshold is still closer than the k-th best distance once the near side is.
+        to_visit: List[Tuple[AbstractNode, Optional[AbstractNode]]] = [(self, None)]
+        push, pop = to_visit.append, to_visit.pop
+        while to_visit:
+            node, splitter = pop()
+            if splitter is not None:
+                kth_best_distance = self.kth_best_distance(k, heap)
+                if splitter.threshold_bound(target, metric) >= kth_best_distance or \
+                        node.box_bound(target, metric) >= kth_best_distance:
+                    if stats is not None:
+                        stats.branches_pruned += 1
+                    continue
+                if stats is not None:
+                    stats.branches_explored += 1
+
+            if node.is_a_leaf():
+                node.gather_k_nearest(target, k, heap, metric, stats)
+                continue
+
+            if stats is not None:
+                stats.nodes_visited += 1
+            if target[node.get_axis()] < node.get_threshold():
+                preferred_branch, secondary_branch = node.get_left(), node.get_right()
+            else:
+                preferred_branch, secondary_branch = node.get_right(), node.get_left()
+            if secondary_branch is not None:
+                push((secondary_branch, node))
+            if preferred_branch is not None:
+                push((preferred_branch, None))
+
+    def branches_touching(self, low_edge: float, high_edge: float) -> List[AbstractNode]:
+        """
+        finds which of this node's children could hold data whose value on this node's axis lies in the range
+        [low_edge, high_edge]. Data equal to the threshold may be on either side, so both edges are inclusive.
+        :param low_edge: the smallest value on this axis we are interested in.
+        :param high_edge: the largest value on this axis we are interested in.
+        :return: a list of zero, one or two children.
+        """
+        branches = []
+        if self.get_left() is not None and low_edge <= self.get_threshold():
+            branches.append(self.get_left())
+        if self.get_right() is not None and high_edge >= self.get_threshold():
+            branches.append(self.get_right())
+        return branches
+
+    def branches_within(self,
+                        target: Tuple[float, ...],
+                        radius: float,
+                        metric: Optional[DistanceMetric] = None) -> List[AbstractNode]:
+        """
+        finds which of this node's children could hold data within radius of the target: the side of the threshold the
+        target is on, and the other side too if the threshold is within radius of the target.
+        :return: a list of zero, one or two children.
+        """
+        if target[self.get_axis()] < self.get_threshold():
+            preferred_branch, secondary_branch = self.get_left(), self.get_right()
+        else:
+            preferred_branch, secondary_branch = self.get_right(), self.get_left()
+        branches = [] if preferred_branch is None else [preferred_branch]
+        if secondary_branch is not None and self.threshold_bound(target, metric) <= radius:
+            branches.append(secondary_branch)
+        return branches
+
+    def query_radius(self,
+                     target: Tuple[float, ...],
+                     radius: float,
+                     metric: Optional[DistanceMetric] = None) -> Iterator[Tuple[float, ...]]:
+        # like find_nearest, this walks the tree from its own stack rather than recursing, so a deep tree can't reach
+        # Python's recursion limit. Only the leaves are asked for their data.
+        to_visit: List[AbstractNode] = [self]
+        while to_visit:
+            node = to_visit.pop()
+            if node.is_a_leaf():
+                yield from node.query_radius(target, radius, metric)
+            else:
+                to_visit.extend(reversed(node.branches_within(target, radius, metric)))  # the nearer side first.
+
+    def count_radius(self, target: Tuple[float, ...], radius: float, metric: Optional[DistanceMetric] = None) -> int:
+        count = 0
+        to_visit: List[AbstractNode] = [self]
+        while to_visit:
+            node = to_visit.pop()
+            if node.is_a_leaf():
+                count += node.count_radius(target, radius, metric)
+            else:
+                to_visit.extend(node.branches_within(target, radius, metric))
+        return count
+
+    def query_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> Iterator[Tuple[float, ...]]:
+        to_visit: List[AbstractNode] = [self]
+        while to_visit:
+            node = to_visit.pop()
+            if node.is_a_leaf():
+                yield from node.query_box(low, high)
+            else:  # the left side first, as before.
+                to_visit.extend(reversed(node.branches_touching(low[node.get_axis()], high[node.get_axis()])))
+
+    def count_box(self, low: Tuple[float, ...], high: Tuple[float, ...]) -> int:
+        count = 0
+        to_visit: List[AbstractNode] = [self]
+        while to_visit:
+            node = to_visit.pop()
+            if node.is_a_leaf():
+                count += node.count_box(low, high)
+            else:
+                to_visit.extend(node.branches_touching(low[node.get_axis()], high[node.get_axis()]))
+        return count
@@ -0,0 +1,125 @@
+import itertools
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 65536  # rows parsed at a time; this bounds the memory used by parsing, beyond the result itself.
+COMMENT_PREFIX = "#"  # lines starting with this (after any leading spaces) are skipped, like blank lines.
+
+
+def count_lines(filename: str, block_size: int = 1 << 20) -> int:
+    """
+    counts the lines in a file by reading it in fixed-size binary blocks, without decoding or splitting it.
+    :param filename: the file to count
+    :param block_size: how many bytes to read at a time.
+    :return: the number of lines, counting a last line that has no newline at the end.
+    """
+    num_lines = 0
+    last_byte = b"\n"
+    with open(filename, "rb") as file:
+        while block := file.read(block_size):
+            num_lines += block.count(b"\n")
+            last_byte = block[-1:]
+    return num_lines + (0 if last_byte == b"\n" else 1)
+
+
+def iterate_chunks(filename: str,
+                   numeric_columns: Sequence[int],
+                   payload_column: Optional[int] = None,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   delimiter: str = "\t",
+                   header_lines: int = 1) -> Iterator[Tuple[np.ndarray, Optional[List[str]]]]:
+    """
+    parses a delimited text file (tsv, csv...) chunk_size lines at a time, converting each chunk's numeric columns to
+    floats in one bulk numpy.loadtxt call. Every row is kept, including duplicates, but blank lines and comment lines
+    (starting with COMMENT_PREFIX) are skipped. If a chunk holds a line that can't be parsed, that chunk is parsed
+    again line by line, and the bad lines are skipped.
+    :param filename: the file to read.
+    :param numeric_columns: the indices of the columns that make up each point, in order.
+    :param payload_column: the index of a column to keep as a string alongside each point, or None.
+    :param chunk_size: the most lines to parse at once.
+    :param delimiter: the column separator.
+    :param header_lines: how many lines at the top of the file to skip.
+    :return: a generator of (an (m, len(numeric_columns)) array of points, a list of m payloads or None) per chunk.
+    """
+    # a line with fewer fields than this is bad, even if it has all its numbers: it is missing its payload.
+    min_fields = 1 + max(list(numeric_columns) + ([] if payload_column is None else [payload_column]))
+    with open(filename, encoding="utf-8") as file:
+        lines = itertools.islice(file, header_lines, None)
+        while chunk := list(itertools.islice(lines, chunk_size)):
+            # dropped here rather than by loadtxt, so that the payloads are taken from the very lines it parses.
+            # (comments=None also stops loadtxt cutting a line short at a "#" part way along it.)
+            chunk = [line for line in chunk if line.strip() and not line.lstrip().startswith(COMMENT_PREFIX)]
+            if not chunk:
+                continue
+            try:
+                points = np.loadtxt(chunk, delimiter=delimiter, usecols=numeric_columns, ndmin=2, dtype=float,
+                                    comments=None)
+                good_lines = chunk
+                if payload_column is not None:
+                    fields = [line.rstrip("\r\n").split(delimiter) for line in good_lines]
+                    if any(len(line_fields) < min_fields for line_fields in fields):
+                        raise ValueError("A line is missing its payload.")
+            except ValueError:
+                points, good_lines = _parse_lines_individually(chunk, numeric_columns, delimiter, min_fields)
+                fields = [line.rstrip("\r\n").split(delimiter) for line in good_lines]
+            payloads = None
+            if payload_column is not None:
+                payloads = [line_fields[payload_column] for line_fields in fields]
+            yield points, payloads
+
+
+def _parse_lines_individually(lines: List[str],
+                              numeric_columns: Sequence[int],
+                              delimiter: str,
+                              min_fields: int = 0) -> Tuple[np.ndarray, List[str]]:
+    """
+    the slow path of iterate_chunks, for a chunk with a bad line in it.
+    :param min_fields: a line with fewer fields than this is bad, even if its numeric columns can be parsed.
+    :return: (the points from the lines that could be parsed, those lines).
+    """
+    points = np.empty((len(lines), len(numeric_columns)), dtype=float)
+    good_lines = []
+    for line in lines:
+        fields = line.rstrip("\r\n").split(delimiter)
+        try:
+            if len(fields) < min_fields:
+                raise IndexError("too few fields")
+            points[len(good_lines)] = [float(fields[column]) for column in numeric_columns]
+            good_lines.append(line)
+        except (ValueError, IndexError):
+            print(f"skipping line: {fields}.")
+    return points[:len(good_lines)], good_lines
+
+
+def load_table(filename: str,
+               numeric_columns: Sequence[int],
+               payload_column: Optional[int] = None,
+               chunk_size: int = DEFAULT_CHUNK_SIZE,
+               delimiter: str = "\t",
+               header_lines: int = 1) -> Tuple[np.ndarray, Optional[List[str]]]:
+    """
+    reads a whole delimited text file into one array of points (plus, optionally, a list of payloads with the same
+    row order), ready for FlatKDTree.build_from_array. The file's lines are counted first, so the result array is
+    allocated once at its final size and filled in chunk by chunk, rather than grown and copied. (If any lines are
+    skipped, it is copied once at the end, down to the rows actually read.)
+    :param filename: the file to read.
+    :param numeric_columns: the indices of the columns that make up each point, in order.
+    :param payload_column: the index of a column to keep as a string alongside each point, or None.
+    :param chunk_size: the most lines to parse at once.
+    :param delimiter: the column separator.
+    :param header_lines: how many lines at the top of the file to skip.
+    :return: (an (n, len(numeric_columns)) array of points, a list of n payloads or None).
+    """
+    points = np.empty((max(0, count_lines(filename) - header_lines), len(numeric_columns)), dtype=float)
+    payloads: Optional[List[str]] = [] if payload_column is not None else None
+    num_rows = 0
+    for chunk_points, chunk_payloads in iterate_chunks(filename, numeric_columns, payload_column, chunk_size,
+                                                       delimiter, header_lines):
+        points[num_rows:num_rows + len(chunk_points)] = chunk_points
+        num_rows += len(chunk_points)
+        if payloads is not None:
+            payloads.extend(chunk_payloads)
+    if num_rows < len(points):  # some lines were skipped: copy, so the unused end of the buffer can be freed.
+        points = points[:num_rows].copy()
+    return points, payloads
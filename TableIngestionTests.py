@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from TableIngestionFile import count_lines, iterate_chunks, load_table
+from WeatherRunnerFile import load_data
+
+
+class TableIngestionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "table.tsv")
+        with open(self.filename, "w", encoding="utf-8") as file:
+            file.write("A\tB\tName\n")
+            for row in range(10):
+                file.write(f"{row % 3}\t{row * 0.5}\tday {row}\n")
+            file.write("not\ta\trow\n")
+            file.write("0\t0.0\tday 0 again")  # a duplicate point, with no newline at the end of the file.
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_count_lines(self):
+        self.assertEqual(13, count_lines(self.filename))
+
+    def test_chunks_keep_duplicates_and_skip_bad_lines(self):
+        chunks = list(iterate_chunks(self.filename, numeric_columns=(0, 1), payload_column=2, chunk_size=4))
+        self.assertEqual([4, 4, 3], [len(points) for points, _ in chunks])
+        points = np.concatenate([points for points, _ in chunks])
+        payloads = [payload for _, chunk_payloads in chunks for payload in chunk_payloads]
+        self.assertEqual(11, len(points))
+        self.assertEqual(["day 0", "day 0 again"], [payloads[row] for row in (0, 10)])
+        np.testing.assert_array_equal(points[0], points[10])
+
+    def test_load_table(self):
+        points, payloads = load_table(self.filename, numeric_columns=(1, 0), payload_column=2, chunk_size=5)
+        self.assertEqual((11, 2), points.shape)
+        np.testing.assert_array_equal([4.5, 0.0], points[9])
+        self.assertEqual("day 9", payloads[9])
+        points, payloads = load_table(self.filename, numeric_columns=(0,))
+        self.assertEqual((11, 1), points.shape)
+        self.assertIsNone(payloads)
+
+    def test_blank_and_comment_lines(self):
+        with open(self.filename, "w", encoding="utf-8") as file:
+            file.write("A\tB\tName\n1\t2\tx\n\n# a comment\n  \n3\t4\ty #1\n\n")
+        for chunk_size in (1, 2, 100):
+            points, payloads = load_table(self.filename, (0, 1), 2, chunk_size=chunk_size)
+            np.testing.assert_array_equal([[1.0, 2.0], [3.0, 4.0]], points)
+            self.assertEqual(["x", "y #1"], payloads)
+        with open(self.filename, "w", encoding="utf-8") as file:
+            file.write("A\tB\tName\n\n#only comments\n")
+        points, payloads = load_table(self.filename, (0, 1), 2)
+        self.assertEqual((0, 2), points.shape)
+        self.assertEqual([], payloads)
+
+    def test_short_lines_are_skipped(self):
+        with open(self.filename, "w", encoding="utf-8") as file:
+            file.write("A\tB\tName\n1\t2\tx\n3\t4\n5\t6\tz\n")
+        for chunk_size in (1, 100):
+            points, payloads = load_table(self.filename, (0, 1), 2, chunk_size=chunk_size)
+            np.testing.assert_array_equal([[1.0, 2.0], [5.0, 6.0]], points)
+            self.assertEqual(["x", "z"], payloads)
+            self.assertTrue(points.flags.owndata)  # not a view of the bigger buffer that was allocated.
+        points, payloads = load_table(self.filename, (0, 1))  # without a payload, the short line is fine.
+        self.assertEqual((3, 2), points.shape)
+
+    def test_weather_file(self):
+        points, descriptions = load_table("Weather Data 2014-2024.tsv", numeric_columns=(0, 1, 2, 3), payload_column=4,
+                                          chunk_size=1000)
+        by_weather = load_data("Weather Data 2014-2024.tsv")
+        self.assertEqual(count_lines("Weather Data 2014-2024.tsv") - 1, len(points))
+        self.assertEqual(set(by_weather.keys()), {tuple(row) for row in points.tolist()})
+        self.assertEqual(len(points), len(descriptions))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 import math
-import random
+import os
+import struct
+import zlib
+from abc import ABC, abstractmethod
 
-import cv2
 import numpy as np
 from typing import List, Tuple, Optional, Set
 
@@ -11,114 +13,409 @@ from SplitterNodeFile import SplitterNode
 SCALE = 4
 MARGIN = 10
 DELAY_MS = 250
+CANVAS_SIZE = 200 * SCALE + 2 * MARGIN  # the canvas is this many pixels wide and high.
+HELD_FRAME_MS = 1000  # how long an animation shows a frame that a window would wait for a key press on.
+
+# colors are (blue, green, red), as cv2 expects them.
+DATA_COLOR = (128, 128, 128)
+LEAF_COLOR = (255, 255, 255)
+VERTICAL_SPLIT_COLOR = (255, 128, 128)  # the edges of the rectangles on either side of a split on axis 0...
+HORIZONTAL_SPLIT_COLOR = (128, 128, 255)  # ... and on axis 1.
+SEARCH_COLOR = (0, 255, 0)  # the target, the best point so far, and the threshold being considered.
+THRESHOLD_LINE_COLOR = (0, 255, 255)
+HIGHLIGHT_OPACITY = 0.3
+HIGHLIGHT_THICKNESS = 3
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_COMPRESSION_LEVEL = 6
+
+
+def load_cv2():
+    """
+    imports cv2 only when a window is actually wanted, so that headless runs (which write their frames to files) don't
+    need it installed at all.
+    :return: the cv2 module.
+    """
+    try:
+        import cv2
+    except ImportError as error:
+        raise ImportError("Showing the visualizer in a window needs OpenCV (pip install opencv-python); to run without "
+                          "it, give TwoDVisualizer a PngFrameBackend or AnimationBackend instead.") from error
+    return cv2
+
+
+def to_pixel(value: float) -> int:
+    """
+    :return: the pixel column (or row) at which a data value from 0 to 100 is drawn.
+    """
+    return int(MARGIN + 2 * SCALE * value)
+
+
+def draw_dots(canvas: np.ndarray, points: np.ndarray, radius: int, color: Tuple[int, int, int]) -> None:
+    """
+    draws a filled circle at each of the points, all in one step.
+    :param canvas: the (height, width, 3) uint8 image to draw on.
+    :param points: an (n, 2) array of pixel positions (x, y).
+    :param radius: the radius of each dot, in pixels.
+    :param color: the color of the dots.
+    :return: None
+    """
+    if len(points) == 0:
+        return
+    offsets = np.arange(-radius, radius + 1)
+    dx, dy = np.meshgrid(offsets, offsets)
+    inside = dx ** 2 + dy ** 2 <= radius ** 2
+    xs = (points[:, 0, np.newaxis] + dx[inside]).ravel()
+    ys = (points[:, 1, np.newaxis] + dy[inside]).ravel()
+    on_canvas = (xs >= 0) & (xs < canvas.shape[1]) & (ys >= 0) & (ys < canvas.shape[0])
+    canvas[ys[on_canvas], xs[on_canvas]] = color
+
+
+def draw_pixels(canvas: np.ndarray, xs: np.ndarray, ys: np.ndarray, color: Tuple[int, int, int]) -> None:
+    """
+    colors the pixels at (xs[i], ys[i]), skipping any that fall off the canvas.
+    """
+    xs, ys = np.rint(xs).astype(np.int64), np.rint(ys).astype(np.int64)
+    on_canvas = (xs >= 0) & (xs < canvas.shape[1]) & (ys >= 0) & (ys < canvas.shape[0])
+    canvas[ys[on_canvas], xs[on_canvas]] = color
+
+
+def draw_line(canvas: np.ndarray, start: Tuple[int, int], end: Tuple[int, int], color: Tuple[int, int, int]) -> None:
+    """
+    draws a one-pixel line from start to end, both (x, y) in pixels.
+    """
+    steps = max(abs(end[0] - start[0]), abs(end[1] - start[1])) + 1
+    draw_pixels(canvas, np.linspace(start[0], end[0], steps), np.linspace(start[1], end[1], steps), color)
+
+
+def draw_circle(canvas: np.ndarray, center: Tuple[int, int], radius: int, color: Tuple[int, int, int]) -> None:
+    """
+    draws the one-pixel outline of a circle.
+    """
+    angles = np.linspace(0, 2 * math.pi, max(8, int(8 * radius)), endpoint=False)
+    draw_pixels(canvas, center[0] + radius * np.cos(angles), center[1] + radius * np.sin(angles), color)
+
+
+def draw_rectangles(canvas: np.ndarray, corners: np.ndarray, colors: np.ndarray) -> None:
+    """
+    draws the one-pixel outlines of many rectangles at once. Where they overlap, the later ones are drawn on top.
+    :param canvas: the (height, width, 3) uint8 image to draw on.
+    :param corners: an (n, 4) int array of (left, top, right, bottom) pixels, with left <= right and top <= bottom.
+    :param colors: an (n, 3) array of the color of each rectangle.
+    :return: None
+    """
+    if len(corners) == 0:
+        return
+    left, top, right, bottom = corners.T
+    xs, ys, pixel_colors = [], [], []
+    # the top and bottom edges run along x, the left and right ones along y; each edge becomes the run of pixels from
+    # start to end (inclusive) along its direction, at a fixed position across it.
+    for along_x, fixed, start, end in ((True, top, left, right), (True, bottom, left, right),
+                                       (False, left, top, bottom), (False, right, top, bottom)):
+        lengths = end - start + 1
+        steps = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        run = np.repeat(start, lengths) + steps
+        across = np.repeat(fixed, lengths)
+        xs.append(run if along_x else across)
+        ys.append(across if along_x else run)
+        pixel_colors.append(np.repeat(colors, lengths, axis=0))
+    # the edges of each rectangle are interleaved back into drawing order, so that later rectangles come out on top.
+    order = np.argsort(np.concatenate([np.repeat(np.arange(len(corners)), end - start + 1)
+                                       for start, end in ((left, right), (left, right), (top, bottom), (top, bottom))]),
+                       kind="stable")
+    xs, ys, pixel_colors = np.concatenate(xs)[order], np.concatenate(ys)[order], np.concatenate(pixel_colors)[order]
+    on_canvas = (xs >= 0) & (xs < canvas.shape[1]) & (ys >= 0) & (ys < canvas.shape[0])
+    xs, ys, pixel_colors = xs[on_canvas], ys[on_canvas], pixel_colors[on_canvas]
+    # numpy doesn't promise which of several writes to the same pixel lands last, so only the last is kept.
+    pixels = ys * canvas.shape[1] + xs
+    _, last_from_end = np.unique(pixels[::-1], return_index=True)
+    last = len(pixels) - 1 - last_from_end
+    canvas[ys[last], xs[last]] = pixel_colors[last]
+
+
+def encode_png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def compress_image(image: np.ndarray) -> bytes:
+    """
+    :param image: a (height, width, 3) uint8 image, in (blue, green, red) order as it is drawn.
+    :return: the image as the compressed rows of an 8-bit RGB PNG, each starting with filter type 0 (none).
+    """
+    rgb = np.ascontiguousarray(image[:, :, ::-1])
+    rows = np.hstack((np.zeros((len(rgb), 1), dtype=np.uint8), rgb.reshape(len(rgb), -1)))
+    return zlib.compress(rows.tobytes(), PNG_COMPRESSION_LEVEL)
+
+
+def png_header(image: np.ndarray) -> bytes:
+    height, width = image.shape[:2]
+    return PNG_SIGNATURE + encode_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """
+    :param image: a (height, width, 3) uint8 image, in (blue, green, red) order as it is drawn.
+    :return: the bytes of a PNG file holding it.
+    """
+    return png_header(image) + encode_png_chunk(b"IDAT", compress_image(image)) + encode_png_chunk(b"IEND", b"")
+
+
+class DisplayBackend(ABC):
+    """
+    Where a TwoDVisualizer's frames go: a WindowBackend shows them on screen, with cv2; a PngFrameBackend or an
+    AnimationBackend writes them to files, so needs neither cv2 nor a display.
+    """
+
+    @abstractmethod
+    def show(self, frame: np.ndarray, wait_for_key: bool = False) -> None:
+        """
+        shows (or records) the frame, then, in a window, waits for the user to press a key or for DELAY_MS milliseconds.
+        :param frame: the (height, width, 3) uint8 image, in (blue, green, red) order. It may be drawn over once this
+        returns.
+        :param wait_for_key: whether to wait for a key press.
+        :return: None
+        """
+        pass
+
+    def close(self) -> None:
+        """
+        finishes with the frames: closes the window, or writes out the file.
+        :return: None
+        """
+        pass
+
+
+class WindowBackend(DisplayBackend):
+    """
+    Shows each frame in a window, with cv2, which is only imported when the first frame is shown.
+    """
+
+    def __init__(self, window_name: str = "Data"):
+        self._window_name = window_name
+        self._cv2 = None
+
+    def show(self, frame: np.ndarray, wait_for_key: bool = False) -> None:
+        if self._cv2 is None:
+            self._cv2 = load_cv2()
+        self._cv2.imshow(self._window_name, frame)
+        if wait_for_key:
+            self._cv2.waitKey()
+        else:
+            self._cv2.waitKey(DELAY_MS)
+
+    def close(self) -> None:
+        if self._cv2 is not None:
+            self._cv2.destroyWindow(self._window_name)
+
+
+class PngFrameBackend(DisplayBackend):
+    """
+    Writes each frame to its own numbered PNG file in a directory, rather than showing it, and never waits.
+    """
+
+    def __init__(self, directory: str, prefix: str = "frame"):
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._prefix = prefix
+        self._num_frames = 0
+
+    def get_num_frames(self) -> int:
+        return self._num_frames
+
+    def show(self, frame: np.ndarray, wait_for_key: bool = False) -> None:
+        path = os.path.join(self._directory, f"{self._prefix}_{self._num_frames:05d}.png")
+        with open(path, "wb") as png_file:
+            png_file.write(encode_png(frame))
+        self._num_frames += 1
+
+
+class AnimationBackend(DisplayBackend):
+    """
+    Collects the frames, compressed, and writes them all to one animated PNG file when it is closed. Each frame shows
+    for DELAY_MS, or HELD_FRAME_MS if a window would have waited for a key press on it. Any browser can play the file;
+    viewers that don't know animated PNGs show the first frame.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._header: Optional[bytes] = None
+        self._frames: List[Tuple[bytes, int]] = []  # (compressed image, how many ms to show it)
+
+    def get_num_frames(self) -> int:
+        return len(self._frames)
+
+    def show(self, frame: np.ndarray, wait_for_key: bool = False) -> None:
+        if self._header is None:
+            self._header = png_header(frame)
+        self._frames.append((compress_image(frame), HELD_FRAME_MS if wait_for_key else DELAY_MS))
+
+    def close(self) -> None:
+        """
+        writes the animation: a PNG header, an acTL chunk giving the number of frames, then for each frame an fcTL
+        chunk giving its size and delay followed by its image - in IDAT chunks for the first, so that it is also the
+        still image, and fdAT chunks for the rest. fcTL and fdAT chunks share one sequence of numbers.
+        """
+        if self._header is None:
+            return
+        width, height = struct.unpack(">II", self._header[16:24])
+        chunks = [self._header, encode_png_chunk(b"acTL", struct.pack(">II", len(self._frames), 0))]
+        sequence = 0
+        for index, (compressed, delay_ms) in enumerate(self._frames):
+            chunks.append(encode_png_chunk(b"fcTL", struct.pack(">IIIIIHHBB", sequence, width, height, 0, 0,
+                                                                delay_ms, 1000, 0, 0)))
+            sequence += 1
+            if index == 0:
+                chunks.append(encode_png_chunk(b"IDAT", compressed))
+            else:
+                chunks.append(encode_png_chunk(b"fdAT", struct.pack(">I", sequence) + compressed))
+                sequence += 1
+        chunks.append(encode_png_chunk(b"IEND", b""))
+        with open(self._path, "wb") as animation_file:
+            animation_file.write(b"".join(chunks))
+        self._header, self._frames = None, []
+
 
 class TwoDVisualizer:
+    """
+    Draws a 2-d tree and its data, and the steps of a search through it. The dots and divisions are drawn once into a
+    cached layer, which is only redrawn by display() (which a build calls after each split) or when the root changes;
+    each search step copies that layer and draws just the target, the best point so far and the threshold on top.
+    """
 
-    def __init__(self, root: Optional[AbstractNode] = None, data: Optional[Set[Tuple[float, ...]]] = None):
-        self.myCanvas = None
-        self.clear()
-        self.rect_stack: Optional[List[Tuple[float, float, float, float]]] = None  # used later to display the boxes.
+    def __init__(self, root: Optional[AbstractNode] = None, data: Optional[Set[Tuple[float, ...]]] = None,
+                 backend: Optional[DisplayBackend] = None):
+        """
+        :param root: the root of the tree to show, if it has been built.
+        :param data: the data to draw as dots.
+        :param backend: where to show the frames; None means in a window, with cv2.
+        """
+        self.myCanvas = np.zeros((CANVAS_SIZE, CANVAS_SIZE, 3), dtype=np.uint8)  # the frame being drawn.
+        self._static_layer: Optional[np.ndarray] = None  # the dots and divisions, once drawn; see get_static_layer.
         self._root = root  # a SplitterNode that will serve as the root of the tree displayed by this visualizer.
         self._data = data  # a set of the Tuples of floats that are being incoporated into the tree and should be drawn
         #                    as dots later.
+        self._backend = WindowBackend() if backend is None else backend
 
     def set_root(self, root: AbstractNode):
         self._root = root
+        self.invalidate()
 
     def has_root(self) -> bool:
         return self._root is not None
 
+    def get_backend(self) -> DisplayBackend:
+        return self._backend
+
+    def invalidate(self) -> None:
+        """
+        forgets the cached dots and divisions, so that they are drawn again for the next frame. Call this if the tree or
+        the data change other than through display() or set_root().
+        :return: None
+        """
+        self._static_layer = None
+
     def clear(self) -> None:
         """
-        creates a blank canvas.
+        blanks the canvas, without allocating a new one.
         :return: None
         """
-        self.myCanvas = np.zeros((200*SCALE+2*MARGIN, 200*SCALE+2*MARGIN, 3), dtype=float)
+        self.myCanvas.fill(0)
+
+    def get_static_layer(self) -> np.ndarray:
+        """
+        :return: the image of the dots and divisions, drawing it first if it isn't cached.
+        """
+        if self._static_layer is None:
+            self.clear()
+            self.show_dots_and_divisions()
+            self._static_layer = self.myCanvas.copy()
+        return self._static_layer
 
     def display(self, wait_for_key: bool = False) -> None:
         """
-        draws all the data points and a representation of the tree, updates the "Data" window, and either waits for
-        the user to press a key or for DELAY_MS milliseconds before returning from this method
+        draws all the data points and a representation of the tree (which may have changed since the last frame),
+        shows them, and either waits for the user to press a key or for DELAY_MS milliseconds before returning.
         :param wait_for_key: whether to wait for a keypress or a given amount of time after displaying the window.
         :return: None
         """
-        self.clear()
-        self.show_dots_and_divisions()
+        self.invalidate()
+        np.copyto(self.myCanvas, self.get_static_layer())
+        self._backend.show(self.myCanvas, wait_for_key)
 
-        cv2.imshow("Data", self.myCanvas)
-        if wait_for_key:
-            cv2.waitKey()
-        else:
-            cv2.waitKey(DELAY_MS)
+    def close(self) -> None:
+        """
+        finishes with the backend: closes its window, or writes out its animation.
+        :return: None
+        """
+        self._backend.close()
 
     def show_dots_and_divisions(self):
         """
         draws all the data points and the structure of the tree to self.myCanvas.
         :return: None
         """
-        for d in self._data:
-            cv2.circle(img=self.myCanvas, center=(int(MARGIN + 2 * SCALE * d[0]), int(MARGIN + 2 * SCALE * d[1])),
-                       radius=SCALE,
-                       color=(0.5, 0.5, 0.5), thickness=-1)
-        self.rect_stack = [(0, 0, 100, 100)]  # a stack keeping track of which rectangular area is currently being
-        #                                       subdivided.
+        data = np.array([datum[:2] for datum in self._data or ()], dtype=float).reshape(-1, 2)
+        draw_dots(self.myCanvas, (MARGIN + 2 * SCALE * data).astype(np.int64), SCALE, DATA_COLOR)
         self.display_subtree(self._root)
 
-    def display_subtree(self, sub_root: Optional[AbstractNode]):
+    def display_subtree(self,
+                        root: Optional[AbstractNode],
+                        rect: Tuple[float, float, float, float] = (0, 0, 100, 100)) -> None:
         """
-        recursively draws the structure of this tree to the self.myCanvas array, for display later.
-        :param sub_root: the root of the subtree under consideration, which will be taking place in the area outlined
-        by the rectangle at the top of the self.rect_stack.
+        draws the structure of this tree to the self.myCanvas array, for display later.
+        :param root: the root of the subtree to draw.
+        :param rect: the rectangular area that holds all the data points in this subtree.
         :return: None
         """
-        rect = self.rect_stack.pop(-1)  # get the top rectangle, which should hold all the data points in this subtree.
+        # a stack of (subtree, the rectangular area it subdivides) still to draw. It is local to this call, rather than
+        # kept on the visualizer, so that nothing is left over from one drawing to the next.
+        rect_stack: List[Tuple[Optional[AbstractNode], Tuple[float, float, float, float]]] = [(root, rect)]
+        # the rectangles and leaf points are collected as the tree is walked, then each drawn all at once.
+        rectangles: List[Tuple[float, float, float, float, int]] = []
+        leaf_points: List[Tuple[float, ...]] = []
+        while rect_stack:
+            sub_root, rect = rect_stack.pop(-1)
+            self.display_node(sub_root, rect, rect_stack, rectangles, leaf_points)
+
+        rectangles_array = np.array(rectangles, dtype=float).reshape(-1, 5)
+        corners = (MARGIN + 2 * SCALE * rectangles_array[:, :4]).astype(np.int64)
+        corners[:, 0:3:2].sort(axis=1)  # so that left <= right...
+        corners[:, 1:4:2].sort(axis=1)  # ... and top <= bottom.
+        colors = np.where(rectangles_array[:, 4:] == 0, VERTICAL_SPLIT_COLOR, HORIZONTAL_SPLIT_COLOR)
+        draw_rectangles(self.myCanvas, corners, colors)
+        points = np.array([point[:2] for point in leaf_points], dtype=float).reshape(-1, 2)
+        draw_dots(self.myCanvas, (MARGIN + 2 * SCALE * points).astype(np.int64), SCALE, LEAF_COLOR)
+
+    def display_node(self,
+                     sub_root: Optional[AbstractNode],
+                     rect: Tuple[float, float, float, float],
+                     rect_stack: List[Tuple[Optional[AbstractNode], Tuple[float, float, float, float]]],
+                     rectangles: List[Tuple[float, float, float, float, int]],
+                     leaf_points: List[Tuple[float, ...]]) -> None:
+        """
+        collects what to draw for one node of the tree: for a leaf, its points, in leaf_points, to be drawn as dots;
+        for a SplitterNode, the two halves of its rectangle (each followed by the node's axis, which sets its color),
+        in rectangles. The halves also go on the rect_stack, with the children that subdivide them.
+        """
         if sub_root is None:
             return
 
         if sub_root.is_a_leaf():
-            pt = sub_root.get_value()
-            cv2.circle(img=self.myCanvas,
-                       center=(int(MARGIN+2 * SCALE * pt[0]), int(MARGIN+2 * SCALE * pt[1])),
-                       radius=SCALE,
-                       color=(1.0, 1.0, 1.0), thickness=-1)
+            leaf_points.extend(sub_root.get_values())  # a bucket leaf may hold several points.
         else:
             splitter: SplitterNode = sub_root
             axis = splitter.get_axis()
             threshold = splitter.get_threshold()
             if axis == 0:  # split this rectangle horizontally into a left portion and a right portion.
-                left_rect = (rect[0], rect[1], threshold, rect[3])
-                right_rect = (threshold, rect[1], rect[2], rect[3])
-                cv2.rectangle(img=self.myCanvas,
-                              pt1=(int(MARGIN + 2 * SCALE * left_rect[0]), int(MARGIN + 2 * SCALE * left_rect[1])),
-                              pt2=(int(MARGIN + 2 * SCALE * left_rect[2]), int(MARGIN + 2 * SCALE * left_rect[3])),
-                              color=(1.0, 0.5, 0.5),
-                              thickness=1)
-                self.rect_stack.append(left_rect)
-                cv2.rectangle(img=self.myCanvas,
-                              pt1=(int(MARGIN + 2 * SCALE * right_rect[0]), int(MARGIN + 2 * SCALE * right_rect[1])),
-                              pt2=(int(MARGIN + 2 * SCALE * right_rect[2]), int(MARGIN + 2 * SCALE * right_rect[3])),
-                              color=(1.0, 0.5, 0.5),
-                              thickness=1)
-                self.rect_stack.append(right_rect)
-                self.display_subtree(sub_root.get_right())
-                self.display_subtree(sub_root.get_left())
+                first_rect = (rect[0], rect[1], threshold, rect[3])
+                second_rect = (threshold, rect[1], rect[2], rect[3])
             else:  # split this rectangle vertically into a top portion and a bottom portion
-                top_rect = (rect[0], rect[1], rect[2], threshold)
-                bottom_rect = (rect[0], threshold, rect[2], rect[3])
-                cv2.rectangle(img=self.myCanvas,
-                              pt1=(int(MARGIN + 2 * SCALE * top_rect[0]), int(MARGIN + 2 * SCALE * top_rect[1])),
-                              pt2=(int(MARGIN + 2 * SCALE * top_rect[2]), int(MARGIN + 2 * SCALE * top_rect[3])),
-                              color=( 0.5, 0.5, 1.0),
-                              thickness=1)
-                self.rect_stack.append(top_rect)
-                cv2.rectangle(img=self.myCanvas,
-                              pt1=(int(MARGIN + 2 * SCALE * bottom_rect[0]), int(MARGIN + 2 * SCALE * bottom_rect[1])),
-                              pt2=(int(MARGIN + 2 * SCALE * bottom_rect[2]), int(MARGIN + 2 * SCALE * bottom_rect[3])),
-                              color=(0.5, 0.5, 1.0),
-                              thickness=1)
-                self.rect_stack.append(bottom_rect)
-                self.display_subtree(sub_root.get_right())
-                self.display_subtree(sub_root.get_left())
+                first_rect = (rect[0], rect[1], rect[2], threshold)
+                second_rect = (rect[0], threshold, rect[2], rect[3])
+            rectangles.append((*first_rect, axis))
+            rectangles.append((*second_rect, axis))
+            rect_stack.append((sub_root.get_left(), first_rect))  # pushed first, so drawn after the right.
+            rect_stack.append((sub_root.get_right(), second_rect))
 
     def show_search_progress(self,
                              target: Tuple[float, ...],
@@ -129,7 +426,7 @@ class TwoDVisualizer:
         """
         Draws the data and tree into self.myCanvas, but also shows the target datum, the closest datum found so far (if
         any) and potentially a horizontal or vertical line to the nearest threshold line, highlighting that line across
-        the screen.
+        the screen. The data and tree come from the cached static layer, so only these overlays are drawn each time.
         :param target: the datum point from which we are searching for a nearby point.
         :param best_point: if not None, draw this datum dot and draw a line from the target to this point. Draw a circle
         around the target intersecting this point.
@@ -140,55 +437,28 @@ class TwoDVisualizer:
         amount of time (DELAY_MS).
         :return: None
         """
-        self.clear()
-        self.show_dots_and_divisions()
+        np.copyto(self.myCanvas, self.get_static_layer())
+        target_pixel = (to_pixel(target[0]), to_pixel(target[1]))
         # draw the target dot in green.
-        cv2.circle(img=self.myCanvas,
-                   center=(int(MARGIN + 2 * SCALE * target[0]), int(MARGIN + 2 * SCALE * target[1])),
-                   radius=SCALE,
-                   color=(0, 1.0, 0),
-                   thickness=-1)
+        draw_dots(self.myCanvas, np.array([target_pixel]), SCALE, SEARCH_COLOR)
 
         if best_point is not None:  # draw the line from target to best point and the large circle around target.
             d = math.sqrt(pow(target[0] - best_point[0], 2)+pow(target[1] - best_point[1], 2))
-            cv2.line(img=self.myCanvas,
-                     pt1=(int(MARGIN + 2 * SCALE * target[0]), int(MARGIN + 2 * SCALE * target[1])),
-                     pt2=(int(MARGIN + 2 * SCALE * best_point[0]), int(MARGIN + 2 * SCALE * best_point[1])),
-                     color=(0, 1.0, 0),
-                     thickness=1)
-            cv2.circle(img=self.myCanvas,
-                       center=(int(MARGIN + 2 * SCALE * target[0]), int(MARGIN + 2 * SCALE * target[1])),
-                       radius=int(2 * SCALE * d),
-                       color=(0, 1.0, 0),
-                       thickness=1)
+            draw_line(self.myCanvas, target_pixel, (to_pixel(best_point[0]), to_pixel(best_point[1])), SEARCH_COLOR)
+            draw_circle(self.myCanvas, target_pixel, int(2 * SCALE * d), SEARCH_COLOR)
 
         # if a threshold is given, draw a horizontal or vertical yellow line from target to that threshold.
         if threshold > -1:
             edge_pt = [target[0], target[1]]
             edge_pt[axis] = threshold
-            cv2.line(img=self.myCanvas,
-                     pt1=(int(MARGIN + 2 * SCALE * target[0]), int(MARGIN + 2 * SCALE * target[1])),
-                     pt2=(int(MARGIN + 2 * SCALE * edge_pt[0]), int(MARGIN + 2 * SCALE * edge_pt[1])),
-                     color=(0, 1.0, 1.0),
-                     thickness=1)
-            # ... and highlight that threshold in green.
-            overlay = self.myCanvas.copy()
-            if axis == 1:  # horizontal line to threshold, so threshold itself is vertical.
-                cv2.line(img=overlay,
-                         pt1=(MARGIN, int(MARGIN + 2 * SCALE * edge_pt[1])),
-                         pt2=(int(MARGIN + 2 * SCALE * 100), int(MARGIN + 2 * SCALE * edge_pt[1])),
-                         color=(0, 1.0, 0),
-                         thickness=3)
-            else:  # vertical line to threshold, so threshold itself is horizontal.
-                cv2.line(img=overlay,
-                         pt1=(int(MARGIN + 2 * SCALE * edge_pt[0]), MARGIN),
-                         pt2=(int(MARGIN + 2 * SCALE * edge_pt[0]), int(MARGIN + 2 * SCALE * 100)),
-                         color=(0, 1.0, 0),
-                         thickness=3)
-            self.myCanvas = cv2.addWeighted(overlay, 0.3, self.myCanvas, 0.7, 0)  # blend to give line 0.3 translucency
-
-        cv2.imshow("Data", self.myCanvas)
-        if wait_for_key:
-            cv2.waitKey()
-        else:
-            cv2.waitKey(DELAY_MS)
+            draw_line(self.myCanvas, target_pixel, (to_pixel(edge_pt[0]), to_pixel(edge_pt[1])), THRESHOLD_LINE_COLOR)
+            # ... and highlight that threshold in translucent green, blending only the band of pixels it covers.
+            low = to_pixel(edge_pt[axis]) - HIGHLIGHT_THICKNESS // 2
+            band = slice(max(low, 0), max(low + HIGHLIGHT_THICKNESS, 0))
+            span = slice(MARGIN, to_pixel(100) + 1)
+            # axis 1 means a vertical line to the threshold, so the threshold itself is horizontal - a band of rows.
+            region = (band, span) if axis == 1 else (span, band)
+            blended = HIGHLIGHT_OPACITY * np.array(SEARCH_COLOR) + (1 - HIGHLIGHT_OPACITY) * self.myCanvas[region]
+            self.myCanvas[region] = np.rint(blended).astype(np.uint8)
+
+        self._backend.show(self.myCanvas, wait_for_key)
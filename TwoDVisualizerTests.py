@@ -0,0 +1,170 @@
+import importlib.util
+import os
+import random
+import struct
+import sys
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+
+from SplitterNodeFile import SplitterNode
+from TwoDVisualizerFile import TwoDVisualizer, PngFrameBackend, AnimationBackend, DisplayBackend, WindowBackend, \
+    CANVAS_SIZE, DATA_COLOR, LEAF_COLOR, SEARCH_COLOR, PNG_SIGNATURE, SCALE, to_pixel, load_cv2, \
+    draw_rectangles
+
+
+class RecordingBackend(DisplayBackend):
+    """
+    keeps a copy of every frame shown, and whether it would have waited for a key.
+    """
+
+    def __init__(self):
+        self.frames = []
+
+    def show(self, frame: np.ndarray, wait_for_key: bool = False) -> None:
+        self.frames.append((frame.copy(), wait_for_key))
+
+
+def read_png_chunks(data: bytes):
+    """
+    :return: the (type, data) of each chunk of a PNG file, after checking its signature and each chunk's CRC.
+    """
+    assert data.startswith(PNG_SIGNATURE)
+    chunks, position = [], len(PNG_SIGNATURE)
+    while position < len(data):
+        length, = struct.unpack(">I", data[position:position + 4])
+        chunk_type, chunk_data = data[position + 4:position + 8], data[position + 8:position + 8 + length]
+        crc, = struct.unpack(">I", data[position + 8 + length:position + 12 + length])
+        assert crc == zlib.crc32(chunk_type + chunk_data)
+        chunks.append((chunk_type, chunk_data))
+        position += 12 + length
+    return chunks
+
+
+def decode_png_rows(compressed: bytes, width: int, height: int) -> np.ndarray:
+    """
+    :return: the (height, width, 3) RGB image held by the concatenated IDAT (or fdAT) data of an unfiltered PNG.
+    """
+    rows = np.frombuffer(zlib.decompress(compressed), dtype=np.uint8).reshape(height, 1 + 3 * width)
+    assert not rows[:, 0].any()  # every row uses filter type 0.
+    return rows[:, 1:].reshape(height, width, 3)
+
+
+def count_near(image: np.ndarray, point, color) -> int:
+    """
+    :return: how many pixels of the color there are within SCALE pixels of where the point is drawn.
+    """
+    x, y = to_pixel(point[0]), to_pixel(point[1])
+    return int(np.count_nonzero(np.all(image[y - SCALE:y + SCALE + 1, x - SCALE:x + SCALE + 1] == color, axis=2)))
+
+
+class TwoDVisualizerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(24)
+        self.data = {(float(random.randrange(0, 100)), float(random.randrange(0, 100))) for _ in range(60)}
+        self.root = SplitterNode(0)
+        self.root.build_subtree(self.data, leaf_size=2)
+
+    def test_importing_does_not_need_cv2(self):
+        self.assertNotIn("cv2", sys.modules)
+        if importlib.util.find_spec("cv2") is None:
+            with self.assertRaises(ImportError):
+                load_cv2()
+            WindowBackend().close()  # nothing was shown, so there is nothing to close.
+
+    def test_static_layer_is_drawn_once(self):
+        backend = RecordingBackend()
+        visualizer = TwoDVisualizer(self.root, self.data, backend=backend)
+        static_layer = visualizer.get_static_layer()
+        self.assertEqual((CANVAS_SIZE, CANVAS_SIZE, 3), static_layer.shape)
+        self.assertEqual(np.uint8, static_layer.dtype)
+        for datum in self.data:
+            self.assertEqual(list(LEAF_COLOR), static_layer[to_pixel(datum[1]), to_pixel(datum[0])].tolist())
+
+        target = (50.5, 49.5)
+        closest, _ = self.root.find_nearest(target, None, float('inf'), visualizer=visualizer)
+        self.assertGreater(len(backend.frames), 1)
+        self.assertIs(static_layer, visualizer.get_static_layer())  # no step redrew the dots and divisions.
+        frame, waited = backend.frames[-1]
+        self.assertTrue(waited)
+        # the target's dot (with the lines from it drawn over a few of its pixels).
+        self.assertGreater(count_near(frame, target, SEARCH_COLOR), 30)
+        # only the overlays differ from the static layer.
+        changed = np.any(frame != static_layer, axis=2)
+        self.assertLess(np.count_nonzero(changed), changed.size / 10)
+
+        other = SplitterNode(0)
+        other.build_subtree(self.data, leaf_size=8)
+        visualizer.set_root(other)
+        self.assertIsNot(static_layer, visualizer.get_static_layer())
+        visualizer.display()
+        self.assertFalse(backend.frames[-1][1])
+
+    def test_data_without_a_tree(self):
+        visualizer = TwoDVisualizer(data=self.data, backend=RecordingBackend())
+        datum, static_layer = next(iter(self.data)), visualizer.get_static_layer()
+        self.assertEqual(list(DATA_COLOR), static_layer[to_pixel(datum[1]), to_pixel(datum[0])].tolist())
+        self.assertGreaterEqual(count_near(static_layer, datum, DATA_COLOR), 49)  # the whole dot.
+        visualizer.show_search_progress((200.0, -50.0), (0.0, 0.0), axis=1, threshold=30.0)  # overlays off the canvas.
+
+    def test_draw_rectangles(self):
+        rng = np.random.default_rng(24)
+        corners = rng.integers(-50, CANVAS_SIZE + 50, (200, 4))
+        corners[:, 0:3:2].sort(axis=1)
+        corners[:, 1:4:2].sort(axis=1)
+        colors = rng.integers(1, 256, (200, 3))
+        expected = np.zeros((CANVAS_SIZE, CANVAS_SIZE, 3), dtype=np.uint8)
+        for (left, top, right, bottom), color in zip(corners.tolist(), colors):
+            edges = [(x, y) for x in range(left, right + 1) for y in (top, bottom)] + \
+                    [(x, y) for y in range(top, bottom + 1) for x in (left, right)]
+            for x, y in edges:
+                if 0 <= x < CANVAS_SIZE and 0 <= y < CANVAS_SIZE:
+                    expected[y, x] = color
+        drawn = np.zeros_like(expected)
+        draw_rectangles(drawn, corners, colors)
+        np.testing.assert_array_equal(expected, drawn)
+
+    def test_png_frames(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = PngFrameBackend(directory)
+            visualizer = TwoDVisualizer(self.root, self.data, backend=backend)
+            visualizer.show_search_progress((10.0, 20.0), (12.0, 25.0), axis=0, threshold=15.0)
+            visualizer.display()
+            visualizer.close()
+            self.assertEqual(2, backend.get_num_frames())
+            self.assertEqual(["frame_00000.png", "frame_00001.png"], sorted(os.listdir(directory)))
+            with open(os.path.join(directory, "frame_00001.png"), "rb") as png_file:
+                chunks = read_png_chunks(png_file.read())
+        self.assertEqual([b"IHDR", b"IDAT", b"IEND"], [chunk_type for chunk_type, _ in chunks])
+        width, height = struct.unpack(">II", chunks[0][1][:8])
+        image = decode_png_rows(chunks[1][1], width, height)
+        np.testing.assert_array_equal(visualizer.get_static_layer()[:, :, ::-1], image)
+
+    def test_animation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "search.png")
+            backend = AnimationBackend(path)
+            visualizer = TwoDVisualizer(self.root, self.data, backend=backend)
+            self.root.find_nearest((30.0, 70.0), None, float('inf'), visualizer=visualizer)
+            num_frames = backend.get_num_frames()
+            visualizer.close()
+            with open(path, "rb") as animation_file:
+                chunks = read_png_chunks(animation_file.read())
+        types = [chunk_type for chunk_type, _ in chunks]
+        self.assertEqual([b"IHDR", b"acTL", b"fcTL", b"IDAT"], types[:4])
+        self.assertEqual((num_frames, 0), struct.unpack(">II", dict(chunks)[b"acTL"]))
+        self.assertEqual(num_frames, types.count(b"fcTL"))
+        self.assertEqual(num_frames - 1, types.count(b"fdAT"))
+        sequence_numbers = [struct.unpack(">I", data[:4])[0] for chunk_type, data in chunks
+                            if chunk_type in (b"fcTL", b"fdAT")]
+        self.assertEqual(list(range(len(sequence_numbers))), sequence_numbers)
+        last = chunks[-2][1]
+        image = decode_png_rows(last[4:], CANVAS_SIZE, CANVAS_SIZE)
+        self.assertGreater(count_near(image, (30.0, 70.0), SEARCH_COLOR[::-1]), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
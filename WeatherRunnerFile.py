@@ -1,29 +1,79 @@
 import csv
+import os
 from typing import Dict, Tuple
 
-from SplitterNodeFile import SplitterNode
+from DistanceMetricsFile import WeightedEuclideanMetric
+from FlatKDTreeFile import FlatKDTree
+from PointStorageFile import STORAGE_FLOAT64
+from QueryCacheFile import QueryCache
+from TableIngestionFile import load_table
+
+WEATHER_FILE = "Weather Data 2014-2024.tsv"
+WEATHER_SNAPSHOT = "Weather Data 2014-2024.kdt"  # the tree built from WEATHER_FILE, saved so restarts needn't rebuild.
+WEATHER_LEAF_SIZE = 8
+WEATHER_STORAGE = STORAGE_FLOAT64
+WEATHER_NUMERIC_COLUMNS = (0, 1, 2, 3)
+WEATHER_PAYLOAD_COLUMN = 4
+
+NUM_SIMILAR_DAYS = 5  # how many of the most similar days to show for each search.
+# (precipitation, max_temp, min_temp, day_of_year) are in different units, so they are weighted to count a difference
+# of 0.05 inches of rain, or of 2 days in the year, about the same as a difference of 1°F. Day of year wraps around, so
+# Dec 31 is next to Jan 1.
+WEATHER_METRIC = WeightedEuclideanMetric(weights=(400.0, 1.0, 1.0, 0.25), periods=(None, None, None, 366.0))
+# the settings the weather tree is built and searched with, saved in its snapshot's metadata: a snapshot saved with any
+# other settings is rebuilt rather than reused. (Lists rather than tuples, since that is what comes back from json.)
+WEATHER_BUILD_PARAMETERS = {"leaf_size": WEATHER_LEAF_SIZE,
+                            "storage": WEATHER_STORAGE,
+                            "numeric_columns": list(WEATHER_NUMERIC_COLUMNS),
+                            "payload_column": WEATHER_PAYLOAD_COLUMN,
+                            "metric_weights": WEATHER_METRIC.get_weights().tolist(),
+                            "metric_periods": list(WEATHER_METRIC.get_periods())}
 
 
 def main():
     print("Weather Runner")
 
-    data_from_file = load_data("Weather Data 2014-2024.tsv")
-    print(f"Loaded {len(data_from_file)} days.")
+    tree = load_or_build_weather_tree(WEATHER_FILE, WEATHER_SNAPSHOT)
+    print(f"Loaded {len(tree)} days.")
+    cache = QueryCache(tree)  # people often ask about the same day again.
 
-    root = SplitterNode(0)
-    root.build_subtree(set(data_from_file.keys()))
-
-    # print(root)
     while True:
         search_value = request_weather_day()
         print(f"You're looking for {search_value=}")
 
-        closest, distance = root.find_nearest(search_value, None, float('inf'))
+        similar_days = cache.find_k_nearest_rows(search_value, NUM_SIMILAR_DAYS, metric=WEATHER_METRIC)
 
-        if closest is None:
+        if len(similar_days) == 0:
             print("There was a problem... Search says none.")
-        else:
-            print(f"{closest=}\t{distance=}\nDescription: {data_from_file[closest]}")
+        for row, distance in similar_days:
+            closest = tuple(tree.get_point(row).tolist())
+            print(f"{closest=}\t{distance=}\nDescription: {tree.get_payload(row)}")
+
+def load_or_build_weather_tree(data_filename: str, snapshot_filename: str) -> FlatKDTree:
+    """
+    opens the tree saved in the snapshot file, if there is one at least as new as the data file and built with
+    WEATHER_BUILD_PARAMETERS; otherwise, streams the data file into arrays (keeping days with identical weather, which
+    load_data would merge), builds a tree with the descriptions as payloads and saves it, with WEATHER_BUILD_PARAMETERS
+    as its metadata, as the snapshot for next time.
+    :param data_filename: the tsv file of weather data.
+    :param snapshot_filename: where the built tree is saved.
+    :return: the tree.
+    """
+    if os.path.exists(snapshot_filename) and os.path.getmtime(snapshot_filename) >= os.path.getmtime(data_filename):
+        try:
+            tree = FlatKDTree.load(snapshot_filename)
+            if tree.get_metadata() == WEATHER_BUILD_PARAMETERS:
+                return tree
+            print(f"Rebuilding, because the snapshot was built with other settings: {tree.get_metadata()}")
+        except ValueError as error:
+            print(f"Rebuilding, because the snapshot could not be used: {error}")
+
+    points, descriptions = load_table(data_filename, numeric_columns=WEATHER_NUMERIC_COLUMNS,
+                                      payload_column=WEATHER_PAYLOAD_COLUMN)
+    tree = FlatKDTree(leaf_size=WEATHER_LEAF_SIZE, storage=WEATHER_STORAGE)
+    tree.build_from_array(points, payloads=descriptions)
+    tree.save(snapshot_filename, metadata=WEATHER_BUILD_PARAMETERS)
+    return tree
 
 def load_data(filename: str) -> Dict[Tuple[float, float, float, float], str]:
     """
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from FlatKDTreeFile import FlatKDTree
+import WeatherRunnerFile
+from WeatherRunnerFile import load_or_build_weather_tree, WEATHER_BUILD_PARAMETERS
+
+
+class WeatherRunnerTestCase(unittest.TestCase):
+
+    def test_snapshot_is_rebuilt_when_settings_change(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, "weather.tsv")
+            snapshot_path = os.path.join(directory, "weather.kdt")
+            with open(data_path, "w") as data_file:
+                data_file.write("PRCP\tTMAX\tTMIN\tDAY\tDESCRIPTION\n")
+                for day in range(40):
+                    data_file.write(f"{day % 3 * 0.1:.1f}\t{50 + day}\t{30 + day}\t{day}\tday {day}\n")
+
+            os.utime(data_path, (1000, 1000))  # long ago, so that the snapshot is always newer.
+
+            def was_rebuilt() -> bool:
+                """
+                :return: whether the snapshot has been written since this was last asked.
+                """
+                rebuilt = os.path.getmtime(snapshot_path) != 2000
+                os.utime(snapshot_path, (2000, 2000))
+                return rebuilt
+
+            tree = load_or_build_weather_tree(data_path, snapshot_path)
+            self.assertTrue(was_rebuilt())
+            self.assertEqual(40, len(tree))
+            self.assertEqual(WEATHER_BUILD_PARAMETERS, FlatKDTree.load(snapshot_path).get_metadata())
+
+            # the same settings reuse the snapshot...
+            tree = load_or_build_weather_tree(data_path, snapshot_path)
+            self.assertEqual(WEATHER_BUILD_PARAMETERS, tree.get_metadata())
+            self.assertFalse(was_rebuilt())
+
+            # ...but different ones rebuild it, as does a snapshot saved without them.
+            with mock.patch.object(WeatherRunnerFile, "WEATHER_BUILD_PARAMETERS",
+                                   {**WEATHER_BUILD_PARAMETERS, "leaf_size": 2}), \
+                    mock.patch.object(WeatherRunnerFile, "WEATHER_LEAF_SIZE", 2):
+                tree = load_or_build_weather_tree(data_path, snapshot_path)
+            self.assertTrue(was_rebuilt())
+            self.assertEqual(2, tree.get_leaf_size())
+            self.assertEqual(2, FlatKDTree.load(snapshot_path).get_metadata()["leaf_size"])
+
+            tree.save(snapshot_path)
+            was_rebuilt()
+            tree = load_or_build_weather_tree(data_path, snapshot_path)
+            self.assertTrue(was_rebuilt())
+            self.assertEqual(WEATHER_BUILD_PARAMETERS, FlatKDTree.load(snapshot_path).get_metadata())
+            del tree
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,504 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from DistanceMetricsFile import DistanceMetric, EUCLIDEAN
+from FlatKDTreeFile import FlatKDTree
+from WeatherRunnerFile import WEATHER_FILE, WEATHER_SNAPSHOT, WEATHER_METRIC, NUM_SIMILAR_DAYS, \
+    load_or_build_weather_tree
+
+SERVICE_HOST = "127.0.0.1"  # the service only listens locally; put your own front end in front of it.
+SERVICE_PORT = 8765
+MAX_MICRO_BATCH = 256  # the most single nearest queries answered together by one find_nearest_batch call.
+MICRO_BATCH_WINDOW_S = 0.001  # how long the first query of a micro-batch waits for others to join it.
+NUM_EXECUTOR_THREADS = 2
+LATENCY_WINDOW = 10_000  # how many of the most recent request latencies the metrics' percentiles are taken over.
+LATENCY_PERCENTILES = (50, 90, 99)
+MAX_LINE_BYTES = 1 << 20  # the longest request line accepted; a batch of many targets can be long.
+
+LOAD_CLIENTS = 8
+LOAD_REQUESTS_PER_CLIENT = 200
+LOAD_MIX = {"nearest": 0.7, "k_nearest": 0.15, "radius": 0.1, "batch": 0.05}  # the share of each op in the load.
+LOAD_BATCH_SIZE = 100
+LOAD_RADIUS = 5.0
+
+
+class ServiceMetrics:
+    """
+    Counters and recent latencies for a WeatherService, as reported by its "metrics" op. Everything here is only
+    touched from the event loop's thread, so it needs no lock.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._started: float = time.perf_counter()
+        self._latencies: Deque[float] = deque(maxlen=window)  # seconds, most recent last.
+        self._num_requests: Dict[str, int] = {}  # op -> how many requests for it were answered.
+        self._num_errors: int = 0
+        self._in_flight: int = 0  # requests read, but not yet answered.
+        self._num_micro_batches: int = 0
+        self._num_micro_batched: int = 0  # targets answered through micro-batches.
+        self._max_micro_batch: int = 0
+        self._num_executor_jobs: int = 0
+        self._max_queue_depth: int = 0
+
+    def get_in_flight(self) -> int:
+        return self._in_flight
+
+    def request_started(self) -> None:
+        self._in_flight += 1
+
+    def request_finished(self, op: str, latency: float, ok: bool) -> None:
+        self._in_flight -= 1
+        self._latencies.append(latency)
+        self._num_requests[op] = self._num_requests.get(op, 0) + 1
+        if not ok:
+            self._num_errors += 1
+
+    def micro_batch_done(self, size: int) -> None:
+        self._num_micro_batches += 1
+        self._num_micro_batched += size
+        self._max_micro_batch = max(self._max_micro_batch, size)
+
+    def executor_job_started(self) -> None:
+        self._num_executor_jobs += 1
+
+    def saw_queue_depth(self, depth: int) -> None:
+        self._max_queue_depth = max(self._max_queue_depth, depth)
+
+    def as_dict(self, queue_depth: int) -> Dict[str, Any]:
+        """
+        :param queue_depth: how many nearest queries are waiting to join a micro-batch right now.
+        :return: a json-ready dictionary of the metrics. Latencies are in milliseconds.
+        """
+        result: Dict[str, Any] = {"uptime_s": time.perf_counter() - self._started,
+                                  "queue_depth": queue_depth,
+                                  "max_queue_depth": self._max_queue_depth,
+                                  "in_flight": self._in_flight,
+                                  "requests": dict(self._num_requests),
+                                  "num_requests": sum(self._num_requests.values()),
+                                  "num_errors": self._num_errors,
+                                  "num_micro_batches": self._num_micro_batches,
+                                  "mean_micro_batch": (self._num_micro_batched / self._num_micro_batches
+                                                       if self._num_micro_batches > 0 else 0.0),
+                                  "max_micro_batch": self._max_micro_batch,
+                                  "num_executor_jobs": self._num_executor_jobs}
+        if self._latencies:
+            values = np.percentile(np.asarray(self._latencies) * 1e3, LATENCY_PERCENTILES)
+            for percentile, value in zip(LATENCY_PERCENTILES, values):
+                result[f"latency_p{percentile}_ms"] = float(value)
+            result["latency_max_ms"] = max(self._latencies) * 1e3
+        return result
+
+
+class WeatherService:
+    """
+    Answers nearest, k-nearest and radius queries about a FlatKDTree over a local socket, with one json object per
+    line each way. A request is {"op": ..., "id": ..., ...}; its response echoes the id, and is either
+    {"id": ..., "ok": true, "result": ...} or {"id": ..., "ok": false, "error": "..."}. The ops are:
+
+    - "nearest", with "target": [x, y, ...]. The result is one match: {"row", "distance", "point", "description"}.
+    - "k_nearest", with "target" and "k". The result is a list of up to k matches, closest first.
+    - "radius", with "target" and "radius" (in the metric's units). The result is a list of the matches within it,
+      closest first.
+    - "batch", with "targets": [[x, y, ...], ...] and optionally "k". The result is a list holding, for each target,
+      its nearest match (if k is left out) or its list of k nearest.
+    - "metrics". The result is ServiceMetrics.as_dict.
+
+    Single nearest queries are the common case, and many clients may send them at once. Rather than searching for each
+    one separately, they wait in a queue; a single task takes everything waiting (after giving the first query
+    MICRO_BATCH_WINDOW_S for others to join it) and answers the lot with one find_nearest_batch call. The tree has no
+    vectorized k_nearest or radius search to batch those with, so each is searched on its own. Every search - the
+    micro-batches, those, and "batch" requests, which may be big - runs on a thread pool rather than on the event loop,
+    so that no search holds up reading, queueing and answering everyone else's requests.
+
+    FlatKDTree searches may run on many threads at once (see its docstring), so the pool's searches and the event
+    loop's never need a lock.
+    """
+
+    def __init__(self,
+                 tree: FlatKDTree,
+                 metric: Optional[DistanceMetric] = WEATHER_METRIC,
+                 max_micro_batch: int = MAX_MICRO_BATCH,
+                 micro_batch_window: float = MICRO_BATCH_WINDOW_S,
+                 num_threads: int = NUM_EXECUTOR_THREADS):
+        """
+        :param tree: the tree to search; it should not be rebuilt while the service is running.
+        :param metric: how to measure distance; None means Euclidean distance.
+        :param max_micro_batch: the most nearest queries to answer with one search.
+        :param micro_batch_window: how long, in seconds, the first query of a micro-batch waits for more to arrive.
+        :param num_threads: how many threads run the searches.
+        """
+        if max_micro_batch < 1:
+            raise ValueError(f"A micro-batch must hold at least one query, but max_micro_batch was {max_micro_batch}.")
+        self._tree = tree
+        self._metric = metric
+        self._max_micro_batch: int = max_micro_batch
+        self._micro_batch_window: float = micro_batch_window
+        self._executor = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix="weather-search")
+        self._metrics = ServiceMetrics()
+        self._pending: Optional[asyncio.Queue] = None  # (target array, future) pairs waiting for a micro-batch.
+        self._batcher: Optional[asyncio.Task] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def get_metrics(self) -> ServiceMetrics:
+        return self._metrics
+
+    def get_queue_depth(self) -> int:
+        return 0 if self._pending is None else self._pending.qsize()
+
+    async def start(self, host: str = SERVICE_HOST, port: int = SERVICE_PORT) -> Tuple[str, int]:
+        """
+        starts listening, and starts the micro-batching task, in the running event loop.
+        :param host: the address to listen on.
+        :param port: the port to listen on; 0 picks a free one.
+        :return: the (host, port) actually listened on.
+        """
+        self._pending = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._answer_micro_batches())
+        self._server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_LINE_BYTES)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self) -> None:
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self) -> None:
+        """
+        stops listening, cancels the micro-batching task and shuts down the thread pool.
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        reads requests from one client until it disconnects. Each request is answered by its own task, so a client may
+        send many requests without waiting for the answers, which then come back in the order they finish - hence the
+        ids.
+        """
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.create_task(self._answer(line, writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _answer(self, line: bytes, writer: asyncio.StreamWriter) -> None:
+        """
+        answers one request line, timing it for the metrics.
+        """
+        started = time.perf_counter()
+        self._metrics.request_started()
+        request_id, op = None, "invalid"
+        response: Dict[str, Any] = {"id": None, "ok": False, "error": "The request was cancelled."}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a json object.")
+            request_id = request.get("id")
+            op = str(request.get("op"))
+            response = {"id": request_id, "ok": True, "result": await self.handle_request(request)}
+        except Exception as error:  # any failure at all - a bad request, or a search that failed on the thread pool -
+            #                         is answered, so that the client isn't left waiting for a response forever.
+            response = {"id": request_id, "ok": False, "error": f"{type(error).__name__}: {error}"}
+        finally:  # even if this task is cancelled, so that the in-flight count still comes back down.
+            self._metrics.request_finished(op, time.perf_counter() - started, response["ok"])
+        try:
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+        except ConnectionError:
+            pass  # the client has gone; nobody is waiting for this answer.
+
+    async def handle_request(self, request: Dict[str, Any]) -> Any:
+        """
+        :param request: a decoded request, as described in the class docstring.
+        :return: the result to send back.
+        :raises ValueError, TypeError, KeyError or OverflowError: if the request is malformed.
+        """
+        op = request.get("op")
+        if op == "nearest":
+            return await self.find_nearest(self._target(request["target"]))
+        if op == "k_nearest":
+            k = int(request.get("k", NUM_SIMILAR_DAYS))
+            return await self._run_in_executor(self._find_k_nearest, self._target(request["target"]), k)
+        if op == "radius":
+            return await self._run_in_executor(self._find_within_radius, self._target(request["target"]),
+                                               float(request["radius"]))
+        if op == "batch":
+            targets = np.array([self._target(target) for target in request["targets"]], dtype=float)
+            k = request.get("k")
+            return await self._run_in_executor(self._answer_batch, targets, None if k is None else int(k))
+        if op == "metrics":
+            return self._metrics.as_dict(self.get_queue_depth())
+        raise ValueError(f"Unknown op {op!r}.")
+
+    async def find_nearest(self, target: np.ndarray) -> Dict[str, Any]:
+        """
+        queues a target for the next micro-batch and waits for its answer.
+        :param target: a point with the tree's dimension.
+        :return: its nearest match.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.put_nowait((target, future))
+        self._metrics.saw_queue_depth(self._pending.qsize())
+        return await future
+
+    async def _answer_micro_batches(self) -> None:
+        """
+        the task that answers queued nearest queries, as many at a time as are waiting (up to max_micro_batch). While
+        one micro-batch is being searched on the thread pool, the next one builds up in the queue.
+        """
+        while True:
+            waiting = [await self._pending.get()]
+            await asyncio.sleep(self._micro_batch_window)  # give other queries sent at about the same time a chance.
+            while len(waiting) < self._max_micro_batch and not self._pending.empty():
+                waiting.append(self._pending.get_nowait())
+            waiting = [(target, future) for target, future in waiting if not future.done()]  # skip any cancelled.
+            if not waiting:
+                continue
+            try:
+                rows, distances = await self._run_in_executor(self._tree.find_nearest_batch,
+                                                              np.array([target for target, _ in waiting]),
+                                                              self._metric)
+            except Exception as error:  # pass the failure on to everyone waiting, rather than ending this task.
+                for _, future in waiting:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self._metrics.micro_batch_done(len(waiting))
+            for (_, future), row, distance in zip(waiting, rows.tolist(), distances.tolist()):
+                if not future.done():
+                    future.set_result(self._match(row, distance))
+
+    async def _run_in_executor(self, function, *arguments) -> Any:
+        self._metrics.executor_job_started()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *arguments)
+
+    def _answer_batch(self, targets: np.ndarray, k: Optional[int]) -> List[Any]:
+        """
+        the part of a "batch" request that runs on the thread pool.
+        """
+        if len(targets) == 0:
+            return []
+        if k is None:
+            rows, distances = self._tree.find_nearest_batch(targets, metric=self._metric)
+            return [self._match(row, distance) for row, distance in zip(rows.tolist(), distances.tolist())]
+        return [self._find_k_nearest(target, k) for target in targets]
+
+    def _find_k_nearest(self, target: np.ndarray, k: int) -> List[Dict[str, Any]]:
+        return [self._match(row, distance)
+                for row, distance in self._tree.find_k_nearest_rows(target, k, metric=self._metric)]
+
+    def _find_within_radius(self, target: np.ndarray, radius: float) -> List[Dict[str, Any]]:
+        rows = np.fromiter(self._tree.query_radius_rows(target, radius, metric=self._metric), dtype=np.int64)
+        if len(rows) == 0:
+            return []
+        metric = EUCLIDEAN if self._metric is None else self._metric
+        distances = metric.distances(np.array([self._tree.get_point(row) for row in rows.tolist()]), target)
+        order = np.argsort(distances, kind="stable")
+        return [self._match(row, distance) for row, distance in zip(rows[order].tolist(), distances[order].tolist())]
+
+    def _target(self, values) -> np.ndarray:
+        """
+        :return: the values of a request's target, as an array, checked against the tree's dimension.
+        """
+        target = np.asarray(values, dtype=float)
+        if target.shape != (self._tree.get_dimension(),):
+            raise ValueError(f"A target needs {self._tree.get_dimension()} numbers, but got {values!r}.")
+        return target
+
+    def _match(self, row: int, distance: float) -> Optional[Dict[str, Any]]:
+        """
+        :return: what a response says about one row of the tree's points, or None for the row -1 of an empty tree.
+        """
+        if row < 0:
+            return None
+        return {"row": row,
+                "distance": float(distance),
+                "point": self._tree.get_point(row).tolist(),
+                "description": self._tree.get_payload(row)}
+
+
+async def send_requests(host: str, port: int, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    sends requests down one connection all at once, without waiting for each answer before sending the next, then
+    collects the responses.
+    :param host: where the service is listening.
+    :param port: the port it is listening on.
+    :param requests: the requests to send. Each is given an "id" (its index in this list), replacing any it had.
+    :return: the responses, in the same order as the requests.
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE_BYTES)
+    try:
+        for request_id, request in enumerate(requests):
+            writer.write(json.dumps({**request, "id": request_id}).encode("utf-8") + b"\n")
+        await writer.drain()
+        responses: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        for _ in requests:
+            response = json.loads(await reader.readline())
+            responses[response["id"]] = response
+        return responses
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def make_load_request(op: str, points: np.ndarray, rng: random.Random) -> Dict[str, Any]:
+    """
+    :param op: which kind of request to make.
+    :param points: the tree's points; targets are made by jittering randomly chosen ones.
+    :param rng: the source of randomness.
+    :return: a random request of that kind.
+    """
+    def random_target() -> List[float]:
+        return [value + rng.gauss(0, 1) for value in points[rng.randrange(len(points))].tolist()]
+
+    if op == "nearest":
+        return {"op": op, "target": random_target()}
+    if op == "k_nearest":
+        return {"op": op, "target": random_target(), "k": NUM_SIMILAR_DAYS}
+    if op == "radius":
+        return {"op": op, "target": random_target(), "radius": LOAD_RADIUS}
+    return {"op": "batch", "targets": [random_target() for _ in range(LOAD_BATCH_SIZE)]}
+
+
+async def run_load(host: str,
+                   port: int,
+                   points: np.ndarray,
+                   num_clients: int = LOAD_CLIENTS,
+                   requests_per_client: int = LOAD_REQUESTS_PER_CLIENT,
+                   mix: Optional[Dict[str, float]] = None,
+                   seed: int = 0) -> Dict[str, Any]:
+    """
+    a load generator: runs num_clients connections at once, each sending its requests one at a time and waiting for
+    each answer, as an interactive front end would, then asks the service for its metrics.
+    :param host: where the service is listening.
+    :param port: the port it is listening on.
+    :param points: the points in the service's tree, around which targets are made.
+    :param num_clients: how many connections to run at once.
+    :param requests_per_client: how many requests each connection sends.
+    :param mix: {op: share of the requests}, LOAD_MIX if None.
+    :param seed: the random seed, so that runs being compared send the same requests.
+    :return: a json-ready summary: the requests sent, errors, throughput, latency percentiles in milliseconds as the
+    clients saw them, and the service's own metrics afterwards.
+    """
+    mix = LOAD_MIX if mix is None else mix
+    ops, shares = list(mix.keys()), list(mix.values())
+    latencies: List[float] = []
+    num_errors = 0
+
+    async def client(client_seed: int) -> None:
+        nonlocal num_errors
+        rng = random.Random(client_seed)
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE_BYTES)
+        try:
+            for request_id in range(requests_per_client):
+                request = make_load_request(rng.choices(ops, shares)[0], points, rng)
+                request["id"] = request_id
+                started = time.perf_counter()
+                writer.write(json.dumps(request).encode("utf-8") + b"\n")
+                await writer.drain()
+                response = json.loads(await reader.readline())
+                latencies.append(time.perf_counter() - started)
+                if not response["ok"]:
+                    num_errors += 1
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(seed * num_clients + index) for index in range(num_clients)))
+    elapsed = time.perf_counter() - started
+    metrics = (await send_requests(host, port, [{"op": "metrics"}]))[0]["result"]
+
+    summary: Dict[str, Any] = {"clients": num_clients,
+                               "requests": len(latencies),
+                               "errors": num_errors,
+                               "elapsed_s": elapsed,
+                               "requests_per_s": len(latencies) / elapsed if elapsed > 0 else 0.0}
+    values = np.percentile(np.asarray(latencies) * 1e3, LATENCY_PERCENTILES)
+    for percentile, value in zip(LATENCY_PERCENTILES, values):
+        summary[f"client_p{percentile}_ms"] = float(value)
+    summary["service"] = metrics
+    return summary
+
+
+async def serve(tree: FlatKDTree, host: str, port: int, max_micro_batch: int, micro_batch_window: float) -> None:
+    service = WeatherService(tree, max_micro_batch=max_micro_batch, micro_batch_window=micro_batch_window)
+    host, port = await service.start(host, port)
+    print(f"Serving {len(tree)} days on {host}:{port}.", flush=True)
+    try:
+        await service.serve_forever()
+    finally:
+        await service.stop()
+
+
+async def serve_and_load(tree: FlatKDTree, num_clients: int, requests_per_client: int, max_micro_batch: int,
+                         micro_batch_window: float) -> Dict[str, Any]:
+    """
+    starts a service on a free local port, runs the load generator against it, and stops it again.
+    """
+    service = WeatherService(tree, max_micro_batch=max_micro_batch, micro_batch_window=micro_batch_window)
+    host, port = await service.start(SERVICE_HOST, 0)
+    try:
+        return await run_load(host, port, tree.get_points(), num_clients, requests_per_client)
+    finally:
+        await service.stop()
+
+
+def main(arguments: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Answers weather searches over a local socket, or load-tests that.")
+    parser.add_argument("mode", choices=["serve", "load"],
+                        help="serve: run the service. load: run the load generator against a service.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--local", action="store_true",
+                        help="with load: start a service of its own on a free port, rather than using --host/--port")
+    parser.add_argument("--clients", type=int, default=LOAD_CLIENTS, help="with load: connections run at once")
+    parser.add_argument("--requests", type=int, default=LOAD_REQUESTS_PER_CLIENT, help="with load: per connection")
+    parser.add_argument("--max-micro-batch", type=int, default=MAX_MICRO_BATCH)
+    parser.add_argument("--micro-batch-window", type=float, default=MICRO_BATCH_WINDOW_S, help="in seconds")
+    options = parser.parse_args(arguments)
+
+    tree = load_or_build_weather_tree(WEATHER_FILE, WEATHER_SNAPSHOT)
+    if options.mode == "serve":
+        asyncio.run(serve(tree, options.host, options.port, options.max_micro_batch, options.micro_batch_window))
+    elif options.local:
+        print(json.dumps(asyncio.run(serve_and_load(tree, options.clients, options.requests, options.max_micro_batch,
+                                                    options.micro_batch_window)), indent=2))
+    else:
+        print(json.dumps(asyncio.run(run_load(options.host, options.port, tree.get_points(), options.clients,
+                                              options.requests)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import math
+import random
+import unittest
+
+import numpy as np
+
+from FlatKDTreeFile import FlatKDTree
+from WeatherServiceFile import WeatherService, send_requests, run_load, SERVICE_HOST
+
+RESPONSE_TIMEOUT = 5.0  # seconds
+
+
+class WeatherServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(41)
+        self.points = np.array([[random.uniform(0, 100) for _ in range(3)] for _ in range(500)])
+        self.tree = FlatKDTree(leaf_size=8)
+        self.tree.build_from_array(self.points, payloads=[f"point {index}" for index in range(len(self.points))])
+        self.targets = [[random.uniform(0, 100) for _ in range(3)] for _ in range(60)]
+
+    def run_with_service(self, client, **options):
+        """
+        starts a service for self.tree on a free port, runs client(host, port) against it, and stops the service.
+        :return: what client returned.
+        """
+        async def run():
+            service = WeatherService(self.tree, metric=None, **options)
+            host, port = await service.start(SERVICE_HOST, 0)
+            try:
+                return await client(host, port)
+            finally:
+                await service.stop()
+        return asyncio.run(run())
+
+    @staticmethod
+    async def send_then_ask_for_metrics(host, port, requests):
+        """
+        :return: the responses to the requests, followed by the metrics once they have all been answered. (A metrics
+        request sent with them would be answered at once, ahead of any still waiting for a micro-batch.)
+        """
+        responses = await send_requests(host, port, requests)
+        return responses + await send_requests(host, port, [{"op": "metrics"}])
+
+    def nearest_distances(self, target):
+        return sorted(math.dist(target, point) for point in self.points.tolist())
+
+    def test_queries(self):
+        requests = [{"op": "nearest", "target": target} for target in self.targets]
+        requests += [{"op": "k_nearest", "target": self.targets[0], "k": 4},
+                     {"op": "radius", "target": self.targets[1], "radius": 15.0},
+                     {"op": "batch", "targets": self.targets[:10]},
+                     {"op": "batch", "targets": self.targets[:3], "k": 2}]
+        responses = self.run_with_service(lambda host, port: self.send_then_ask_for_metrics(host, port, requests))
+        self.assertTrue(all(response["ok"] for response in responses))
+        self.assertEqual(list(range(len(requests))), [response["id"] for response in responses[:-1]])
+
+        for target, response in zip(self.targets, responses):
+            match = response["result"]
+            self.assertAlmostEqual(self.nearest_distances(target)[0], match["distance"])
+            self.assertAlmostEqual(match["distance"], math.dist(target, match["point"]))
+            self.assertEqual(f"point {self.tree.get_original_index(match['row'])}", match["description"])
+        k_nearest, radius, batch, batch_k, metrics = [response["result"] for response in responses[len(self.targets):]]
+        self.assertEqual([round(d, 9) for d in self.nearest_distances(self.targets[0])[:4]],
+                         [round(match["distance"], 9) for match in k_nearest])
+        within = [d for d in self.nearest_distances(self.targets[1]) if d <= 15.0]
+        self.assertEqual([round(d, 9) for d in within], [round(match["distance"], 9) for match in radius])
+        self.assertEqual([response["result"] for response in responses[:10]], batch)
+        self.assertEqual([len(matches) for matches in batch_k], [2, 2, 2])
+
+        # all the nearest queries were sent at once, so they should have shared a few micro-batches.
+        self.assertGreater(metrics["num_micro_batches"], 0)
+        self.assertLess(metrics["num_micro_batches"], len(self.targets))
+        self.assertEqual(len(self.targets), metrics["requests"]["nearest"])
+        self.assertIn("latency_p99_ms", metrics)
+        self.assertIn("queue_depth", metrics)
+
+    def test_bad_requests(self):
+        async def client(host, port):
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(b"not json\n" + json.dumps({"op": "nearest", "target": [1.0], "id": 7}).encode() + b"\n")
+            writer.write(json.dumps({"op": "teleport", "id": 8}).encode() + b"\n")
+            # int() of an infinite k raises OverflowError, which must be answered like any other bad request.
+            writer.write(b'{"op": "k_nearest", "target": [0, 0, 0], "k": Infinity, "id": 9}\n')
+            await writer.drain()
+            # with a time limit, so that a request left unanswered fails the test rather than hanging it.
+            responses = [json.loads(await asyncio.wait_for(reader.readline(), RESPONSE_TIMEOUT)) for _ in range(4)]
+            writer.close()
+            await writer.wait_closed()
+            return responses + await send_requests(host, port, [{"op": "metrics"}])
+
+        responses = self.run_with_service(client)
+        self.assertEqual([False] * 4, [response["ok"] for response in responses[:4]])
+        self.assertCountEqual([None, 7, 8, 9], [response["id"] for response in responses[:4]])
+        errors = {response["id"]: response["error"] for response in responses[:4]}
+        self.assertTrue(errors[9].startswith("OverflowError"))
+        self.assertEqual(4, responses[4]["result"]["num_errors"])
+        self.assertEqual(1, responses[4]["result"]["in_flight"])  # just the metrics request itself.
+
+    def test_micro_batch_size_is_capped(self):
+        requests = [{"op": "nearest", "target": target} for target in self.targets]
+        responses = self.run_with_service(lambda host, port: self.send_then_ask_for_metrics(host, port, requests),
+                                          max_micro_batch=4)
+        metrics = responses[-1]["result"]
+        self.assertLessEqual(metrics["max_micro_batch"], 4)
+        self.assertGreaterEqual(metrics["num_micro_batches"], len(self.targets) // 4)
+
+    def test_load_generator(self):
+        summary = self.run_with_service(lambda host, port: run_load(host, port, self.points, num_clients=4,
+                                                                     requests_per_client=25))
+        self.assertEqual(100, summary["requests"])
+        self.assertEqual(0, summary["errors"])
+        self.assertEqual(100, summary["service"]["num_requests"])
+        self.assertLessEqual(summary["client_p50_ms"], summary["client_p99_ms"])
+
+
+if __name__ == '__main__':
+    unittest.main()